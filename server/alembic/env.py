@@ -48,7 +48,8 @@ def run_migrations_offline():
     """
     url = get_database_url()
     context.configure(  # pylint: disable=maybe-no-member
-        url=url, target_metadata=target_metadata, literal_binds=True)
+        url=url, target_metadata=target_metadata, literal_binds=True,
+        transaction_per_migration=True)
 
     with context.begin_transaction():  # pylint: disable=maybe-no-member
         context.run_migrations()  # pylint: disable=maybe-no-member
@@ -73,7 +74,10 @@ def run_migrations_online():
     with connectable.connect() as connection:
         context.configure(  # pylint: disable=maybe-no-member
             connection=connection,
-            target_metadata=target_metadata
+            target_metadata=target_metadata,
+            # Some migrations build the indexes concurrently outside of the
+            # transaction, so each one is run in its own transaction.
+            transaction_per_migration=True
         )
 
         with context.begin_transaction():  # pylint: disable=maybe-no-member
@@ -0,0 +1,50 @@
+"""add-indexes
+
+Revision ID: a3f1c7e9d2b4
+Revises: 5d2c9a1f7b3e
+Create Date: 2026-10-17 14:03:27.519842
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3f1c7e9d2b4'
+down_revision = '5d2c9a1f7b3e'
+branch_labels = None
+depends_on = None
+
+
+INDEXES = (
+    ('ix_interviews_candidate_type', 'interviews (candidate, type)'),
+    ('ix_interviews_start', 'interviews (start)'),
+    ('ix_candidates_last_name_first_name', 'candidates (last_name, first_name)'),
+    ('ix_candidates_first_working_day',
+     'candidates (first_working_day) WHERE first_working_day IS NOT NULL'),
+)
+
+
+def run_concurrently(statements):
+    # The indexes are built without locking the tables against writes, which
+    # is impossible inside a transaction. The pinned alembic has no
+    # autocommit_block(), so the migration transaction is committed by hand
+    # and a new one is begun afterwards for the rest of the migration (see
+    # transaction_per_migration in env.py).
+    op.execute('COMMIT')
+
+    for statement in statements:
+        op.execute(statement)
+
+    op.execute('BEGIN')
+
+
+def upgrade():
+    # IF NOT EXISTS allows re-running the migration if it was interrupted (an
+    # index left invalid by a failed build has to be dropped by hand though).
+    run_concurrently(['CREATE INDEX CONCURRENTLY IF NOT EXISTS {} ON {}'.format(name, definition)
+                      for name, definition in INDEXES])
+
+
+def downgrade():
+    run_concurrently(['DROP INDEX CONCURRENTLY IF EXISTS {}'.format(name)
+                      for name, _ in reversed(INDEXES)])
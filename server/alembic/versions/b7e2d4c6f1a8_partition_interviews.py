@@ -0,0 +1,165 @@
+"""partition-interviews
+
+Revision ID: b7e2d4c6f1a8
+Revises: a3f1c7e9d2b4
+Create Date: 2026-10-17 16:21:05.374912
+
+"""
+from datetime import date
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e2d4c6f1a8'
+down_revision = 'a3f1c7e9d2b4'
+branch_labels = None
+depends_on = None
+
+
+# The number of the monthly partitions created in advance.
+MONTHS_AHEAD = 3
+
+COLUMNS = 'id, created, type, candidate, start, "end", jobs'
+
+# The interviews without the start can't be put into any partition, so they
+# are kept aside in this table.
+WITHOUT_START = 'interviews_without_start'
+
+INDEXES = (
+    ('ix_interviews_candidate_type', 'candidate_type_idx', '(candidate, type)'),
+    ('ix_interviews_start', 'start_idx', '(start)'),
+)
+
+
+def add_months(day, months):
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def run_concurrently(statements):
+    # See the add-indexes migration.
+    op.execute('COMMIT')
+
+    for statement in statements:
+        op.execute(statement)
+
+    op.execute('BEGIN')
+
+
+def create_indexes(partitions):
+    # The index of a partitioned table can't be built concurrently, so the
+    # indexes are created on the table only (which is instant) and the
+    # indexes of the partitions are built concurrently and attached to them.
+    # The indexes become valid once all of them have been attached.
+    for name, _, columns in INDEXES:
+        op.execute('CREATE INDEX {} ON ONLY interviews {}'.format(name, columns))
+
+    run_concurrently(['CREATE INDEX CONCURRENTLY IF NOT EXISTS {0}_{1} ON {0} {2}'.format(
+        partition, suffix, columns) for partition in partitions for _, suffix, columns in INDEXES])
+
+    for partition in partitions:
+        for name, suffix, _ in INDEXES:
+            op.execute('ALTER INDEX {} ATTACH PARTITION {}_{}'.format(name, partition, suffix))
+
+
+def upgrade():
+    # Requires PostgreSQL 11 or newer. The table is rewritten under the
+    # exclusive lock, so the server must be stopped while it's migrated.
+    op.execute('LOCK TABLE interviews IN ACCESS EXCLUSIVE MODE')
+
+    op.execute('CREATE TABLE {} AS SELECT {} FROM interviews WHERE start IS NULL'.format(
+        WITHOUT_START, COLUMNS))
+    op.execute('DELETE FROM interviews WHERE start IS NULL')
+
+    # The primary key of a partitioned table has to include the partition
+    # key.
+    op.execute("""
+        CREATE TABLE interviews_partitioned (
+            id INTEGER NOT NULL DEFAULT nextval('interviews_id_seq'),
+            created TIMESTAMP WITHOUT TIME ZONE,
+            type VARCHAR,
+            candidate INTEGER,
+            start TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+            "end" TIMESTAMP WITHOUT TIME ZONE,
+            jobs JSON,
+            CONSTRAINT interviews_partitioned_pkey PRIMARY KEY (id, start),
+            CONSTRAINT interviews_partitioned_candidate_fkey
+                FOREIGN KEY (candidate) REFERENCES candidates (id)
+        ) PARTITION BY RANGE (start)
+    """)
+
+    first, last = op.get_bind().execute(
+        'SELECT min(start), max(start) FROM interviews').first()
+    today = date.today()
+    month = add_months(min(first.date() if first else today, today), 0)
+    last_month = add_months(max(last.date() if last else today, today), MONTHS_AHEAD)
+
+    partitions = []
+    while month <= last_month:
+        partitions.append('interviews_y{:04d}m{:02d}'.format(month.year, month.month))
+        op.execute("""
+            CREATE TABLE {} PARTITION OF interviews_partitioned
+            FOR VALUES FROM ('{}') TO ('{}')
+        """.format(partitions[-1], month, add_months(month, 1)))
+        month = add_months(month, 1)
+
+    partitions.append('interviews_default')
+    op.execute('CREATE TABLE interviews_default PARTITION OF interviews_partitioned DEFAULT')
+
+    op.execute('INSERT INTO interviews_partitioned ({columns}) '
+               'SELECT {columns} FROM interviews'.format(columns=COLUMNS))
+
+    # The sequence would be dropped along with the column owning it.
+    op.execute('ALTER SEQUENCE interviews_id_seq OWNED BY NONE')
+    op.execute('DROP TABLE interviews')
+
+    op.execute('ALTER TABLE interviews_partitioned RENAME TO interviews')
+    op.execute('ALTER TABLE interviews '
+               'RENAME CONSTRAINT interviews_partitioned_pkey TO interviews_pkey')
+    op.execute('ALTER TABLE interviews RENAME CONSTRAINT '
+               'interviews_partitioned_candidate_fkey TO interviews_candidate_fkey')
+    op.execute('ALTER SEQUENCE interviews_id_seq OWNED BY interviews.id')
+
+    create_indexes(partitions)
+
+
+def downgrade():
+    op.execute('LOCK TABLE interviews IN ACCESS EXCLUSIVE MODE')
+
+    op.execute("""
+        CREATE TABLE interviews_unpartitioned (
+            id INTEGER NOT NULL DEFAULT nextval('interviews_id_seq'),
+            created TIMESTAMP WITHOUT TIME ZONE,
+            type VARCHAR,
+            candidate INTEGER,
+            start TIMESTAMP WITHOUT TIME ZONE,
+            "end" TIMESTAMP WITHOUT TIME ZONE,
+            jobs JSON,
+            CONSTRAINT interviews_unpartitioned_pkey PRIMARY KEY (id),
+            CONSTRAINT interviews_unpartitioned_candidate_fkey
+                FOREIGN KEY (candidate) REFERENCES candidates (id)
+        )
+    """)
+
+    # The detached partitions are not brought back.
+    op.execute('INSERT INTO interviews_unpartitioned ({columns}) '
+               'SELECT {columns} FROM interviews'.format(columns=COLUMNS))
+    op.execute('INSERT INTO interviews_unpartitioned ({columns}) '
+               'SELECT {columns} FROM {table}'.format(columns=COLUMNS, table=WITHOUT_START))
+    op.execute('DROP TABLE {}'.format(WITHOUT_START))
+
+    op.execute('ALTER SEQUENCE interviews_id_seq OWNED BY NONE')
+    op.execute('DROP TABLE interviews')
+
+    op.execute('ALTER TABLE interviews_unpartitioned RENAME TO interviews')
+    for suffix in ('pkey', 'candidate_fkey'):
+        op.execute('ALTER TABLE interviews RENAME CONSTRAINT '
+                   'interviews_unpartitioned_{0} TO interviews_{0}'.format(suffix))
+    # CREATE TABLE would drop the unique constraint duplicating the primary
+    # key.
+    op.execute('ALTER TABLE interviews ADD CONSTRAINT interviews_id_key UNIQUE (id)')
+    op.execute('ALTER SEQUENCE interviews_id_seq OWNED BY interviews.id')
+
+    run_concurrently(['CREATE INDEX CONCURRENTLY IF NOT EXISTS {} ON interviews {}'.format(
+        name, columns) for name, _, columns in INDEXES])
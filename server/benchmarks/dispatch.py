@@ -0,0 +1,63 @@
+# Copyright 2019 Evgeny Golyshev. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Microbenchmark comparing the cost of constructing a webhook event when
+the table of handlers is built per request via reflection and when it's
+built once by the metaclass.
+
+Run it from the server directory:
+
+    env PYTHONPATH=$(pwd) python3 benchmarks/dispatch.py
+"""
+
+import timeit
+
+from huntflow_reloaded.events import WebhookEvent
+
+
+BODY = {'event': {'type': 'STATUS'}}
+
+NUMBER = 100000
+
+
+class ReflectionEvent(WebhookEvent):
+    """The way the table of handlers was built before: on each request. """
+
+    def __init__(self, decoded_body, scheduler, publish=None):
+        super(ReflectionEvent, self).__init__(decoded_body, scheduler, publish)
+
+        self._handlers = {}
+        for i in dir(self):
+            if i.endswith('_TYPE'):
+                key = getattr(self, i)
+                self._handlers[key] = getattr(self, '{}_handler'.format(i.lower()),
+                                              self.stub_handler)
+
+
+def stub_publish(_message):
+    """Stub for publishing messages. """
+
+
+def main():
+    """The main entry point. """
+
+    for cls in (ReflectionEvent, WebhookEvent):
+        seconds = timeit.timeit(lambda cls=cls: cls(BODY, None, stub_publish).classify(),
+                                number=NUMBER)
+        print('{:<16} {:8.2f} us per event'.format(cls.__name__,
+                                                   seconds / NUMBER * 10 ** 6))
+
+
+if __name__ == '__main__':
+    main()
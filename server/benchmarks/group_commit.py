@@ -0,0 +1,102 @@
+# Copyright 2019 Evgeny Golyshev. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmark comparing the throughput of saving the interviews of the
+concurrent webhooks one transaction per webhook and in group commits.
+
+Run it from the server directory against a migrated database:
+
+    env PYTHONPATH=$(pwd) POSTGRES_URL=postgresql://postgres@localhost/test \\
+        python3 benchmarks/group_commit.py
+"""
+
+import asyncio
+import json
+import os
+import time
+from datetime import datetime, timedelta
+
+from huntflow_reloaded import models
+from huntflow_reloaded.batching import WriteBatcher
+
+CONCURRENCY = 200
+
+REQUESTS = 5000
+
+# The candidates are created far from the ids used by Huntflow, so that they
+# can be safely removed when the benchmark is finished.
+FIRST_ID = 10 ** 9
+
+
+def make_values(number):
+    """Returns the interview saved by the webhook with the given number. """
+
+    start = datetime.now() + timedelta(days=1, minutes=number)
+    return {
+        'candidate': FIRST_ID + number,
+        'first_name': 'Matt',
+        'last_name': 'Groening',
+        'type': 'interview',
+        'created': datetime.now(),
+        'start': start,
+        'end': start + timedelta(hours=1),
+        'start_offset': 180,
+        'jobs': json.dumps([]),
+    }
+
+
+async def run(upsert_interview):
+    """Saves REQUESTS interviews by CONCURRENCY concurrent webhooks and
+    returns the number of interviews saved per second.
+    """
+
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+
+    async def webhook(number):
+        async with semaphore:
+            await upsert_interview(**make_values(number))
+
+    started = time.monotonic()
+    await asyncio.gather(*[webhook(number) for number in range(REQUESTS)])
+    return REQUESTS / (time.monotonic() - started)
+
+
+async def cleanup():
+    """Removes the candidates and interviews created by the benchmark. """
+
+    await models.Interview.delete.where(
+        models.Interview.candidate >= FIRST_ID).gino.status()
+    await models.Candidate.delete.where(
+        models.Candidate.id >= FIRST_ID).gino.status()
+
+
+async def main():
+    """The main entry point. """
+
+    await models.DB.set_bind(os.environ['POSTGRES_URL'], max_size=CONCURRENCY)
+
+    try:
+        await cleanup()
+        per_request = await run(models.upsert_interview)
+        print('one transaction per webhook: {:.0f} interviews/s'.format(per_request))
+
+        await cleanup()
+        batched = await run(WriteBatcher().upsert_interview)
+        print('group commit:                {:.0f} interviews/s'.format(batched))
+    finally:
+        await cleanup()
+
+
+if __name__ == '__main__':
+    asyncio.get_event_loop().run_until_complete(main())
@@ -0,0 +1,110 @@
+# Copyright 2019 Evgeny Golyshev. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmark comparing the reminders stored by the asyncpg jobstore as the
+pickled jobs of the previous versions, which keep the message, and as the
+compact rows of the scheduled_jobs table. It reports the size of the tables
+and the time it takes to load the reminders when the server is started.
+
+Run it from the server directory against a migrated database:
+
+    env PYTHONPATH=$(pwd) POSTGRES_URL=postgresql://postgres@localhost/test \\
+        python3 benchmarks/job_format.py
+"""
+
+import os
+import time
+from datetime import datetime, timedelta
+
+import tornado.ioloop
+
+from huntflow_reloaded.models import DB
+from huntflow_reloaded.pool import Pool
+from huntflow_reloaded.scheduler import Scheduler
+
+REMINDERS = 100000
+
+# The ids of the interviews are far from the ones used by Huntflow.
+FIRST_ID = 10 ** 9
+
+TABLE_SIZE = 'SELECT pg_total_relation_size($1)'
+
+
+def make_scheduler(postgres_url):
+    """Returns the started scheduler using the asyncpg jobstore. """
+
+    scheduler = Scheduler(redis_args='', channel_name='benchmark',
+                          postgres_url=postgres_url, jobstore='asyncpg')
+    scheduler.make()
+    return scheduler
+
+
+async def seed(scheduler):
+    """Schedules REMINDERS reminders in both formats. """
+
+    await scheduler.load()
+    date = datetime.now() + timedelta(days=30)
+    for number in range(REMINDERS):
+        scheduler.add_reminder(date, 'interview', FIRST_ID + number,
+                               job_id='compact-{}'.format(number))
+        message = {
+            'type': 'interview',
+            'first_name': 'Matt',
+            'last_name': str(number),
+            'start': date.strftime('%Y-%m-%dT%H:%M:%S+03:00'),
+        }
+        scheduler.add(date=date, func=scheduler._notify_interview,  # pylint: disable=protected-access
+                      args=(message, {'host': 'localhost', 'password': 'secret'}, 'benchmark'),
+                      job_id='pickled-{}'.format(number))
+    await scheduler.flush()
+
+
+async def measure(postgres_url):
+    """Prints the size of the tables and the time of loading them. """
+
+    for table in ('scheduled_jobs', 'apscheduler_jobs'):
+        size = await DB.scalar(TABLE_SIZE, table)
+        print('{:17} {:7.1f} MB'.format(table + ':', size / 2 ** 20))
+
+    scheduler = make_scheduler(postgres_url)
+    for name in ('load_reminders', 'load_pickled_jobs'):
+        started = time.monotonic()
+        await getattr(scheduler.jobstore, name)()
+        print('{:17} {:7.1f} ms'.format(name + ':', (time.monotonic() - started) * 1000))
+
+    scheduler.scheduler.remove_all_jobs()
+    await scheduler.flush()
+    scheduler.scheduler.shutdown(wait=False)
+
+
+def main():
+    """The main entry point. """
+
+    postgres_url = os.environ['POSTGRES_URL']
+    io_loop = tornado.ioloop.IOLoop.current()
+
+    pool = Pool(postgres_url)
+    io_loop.run_sync(pool.open)
+
+    scheduler = make_scheduler(postgres_url)
+    try:
+        io_loop.run_sync(lambda: seed(scheduler))
+        scheduler.scheduler.shutdown(wait=False)
+        io_loop.run_sync(lambda: measure(postgres_url))
+    finally:
+        io_loop.run_sync(pool.close)
+
+
+if __name__ == '__main__':
+    main()
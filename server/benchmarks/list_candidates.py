@@ -0,0 +1,129 @@
+# Copyright 2019 Evgeny Golyshev. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Regression benchmark of the query behind /manage/list. Seeds 10k
+candidates, half of which have upcoming interviews, and checks that listing
+them costs a constant number of queries, comparing it with the query per
+candidate made before.
+
+Run it from the server directory against a migrated database:
+
+    env PYTHONPATH=$(pwd) POSTGRES_URL=postgresql://postgres@localhost/test \\
+        python3 benchmarks/list_candidates.py
+"""
+
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta
+
+from gino.engine import GinoConnection
+
+from huntflow_reloaded import models
+
+CANDIDATES = 10000
+
+# The candidates are created far from the ids used by Huntflow, so that they
+# can be safely removed when the benchmark is finished.
+FIRST_ID = 10 ** 9
+
+QUERIES = 0
+
+
+def count_queries():
+    """Makes GINO count the queries it sends to the database. """
+
+    execute = GinoConnection._execute  # pylint: disable=protected-access
+
+    def counting_execute(self, clause, multiparams, params):
+        global QUERIES  # pylint: disable=global-statement
+        QUERIES += 1
+        return execute(self, clause, multiparams, params)
+
+    GinoConnection._execute = counting_execute  # pylint: disable=protected-access
+
+
+async def query_per_candidate(now):
+    """The way the candidates were listed before. """
+
+    result = []
+    for candidate in await models.Candidate.query.gino.all():
+        interview = await models.Interview.query.where(
+            models.Interview.candidate == candidate.id).gino.first()
+        if interview and interview.start > now:
+            result.append(candidate)
+
+    return result
+
+
+async def measure(func, now):
+    """Returns the number of the listed candidates, the number of queries
+    and the time it took to list them.
+    """
+
+    queries = QUERIES
+    started = time.monotonic()
+    result = await func(now)
+    return len(result), QUERIES - queries, time.monotonic() - started
+
+
+async def seed():
+    """Creates the candidates and the interviews, half of which are past. """
+
+    now = datetime.now()
+    await models.insert_candidates([
+        {'id': FIRST_ID + i, 'first_name': 'Matt', 'last_name': str(i)}
+        for i in range(CANDIDATES)
+    ])
+    await models.DB.status(models.Interview.__table__.insert(), [
+        {'candidate': FIRST_ID + i, 'type': 'STATUS', 'created': now,
+         'start': now + timedelta(days=1 if i % 2 else -1, minutes=i),
+         'end': now + timedelta(days=1 if i % 2 else -1, minutes=i + 60)}
+        for i in range(CANDIDATES)
+    ])
+
+
+async def cleanup():
+    """Removes the candidates and interviews created by the benchmark. """
+
+    await models.Interview.delete.where(
+        models.Interview.candidate >= FIRST_ID).gino.status()
+    await models.Candidate.delete.where(
+        models.Candidate.id >= FIRST_ID).gino.status()
+
+
+async def main():
+    """The main entry point. """
+
+    await models.DB.set_bind(os.environ['POSTGRES_URL'])
+    count_queries()
+
+    try:
+        await cleanup()
+        await seed()
+
+        now = datetime.now()
+        for name, func in (('query per candidate', query_per_candidate),
+                           ('single join', models.upcoming_candidates)):
+            listed, queries, elapsed = await measure(func, now)
+            print('{:20} {} candidates, {} queries, {:.3f} s'.format(
+                name + ':', listed, queries, elapsed))
+
+        assert queries == 1, 'listing the candidates took {} queries'.format(queries)
+    finally:
+        await cleanup()
+
+
+if __name__ == '__main__':
+    asyncio.get_event_loop().run_until_complete(main())
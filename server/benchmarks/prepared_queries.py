@@ -0,0 +1,134 @@
+# Copyright 2019 Evgeny Golyshev. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmark comparing the per-call latency of the hot queries run through
+the GINO models with the prepared statements of huntflow_reloaded.queries.
+Seeds 1k candidates with interviews and runs each query a number of times
+one after another.
+
+Run it from the server directory against a migrated database:
+
+    env PYTHONPATH=$(pwd) POSTGRES_URL=postgresql://postgres@localhost/test \\
+        python3 benchmarks/prepared_queries.py
+"""
+
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta
+
+from huntflow_reloaded import models, queries
+
+CANDIDATES = 1000
+
+CALLS = 2000
+
+# The candidates are created far from the ids used by Huntflow, so that they
+# can be safely removed when the benchmark is finished.
+FIRST_ID = 10 ** 9
+
+
+def orm_queries():
+    """The way the hot queries are run through the models. """
+
+    candidate = models.Candidate
+    interview = models.Interview
+
+    return [
+        ('candidate by id',
+         lambda i: candidate.get(FIRST_ID + i)),
+        ('candidate by name',
+         lambda i: candidate.query.where(candidate.first_name == 'Matt').where(
+             candidate.last_name == str(i)).gino.first()),
+        ('interview by candidate',
+         lambda i: interview.query.where(
+             interview.candidate == FIRST_ID + i).gino.first()),
+        ('upcoming candidates',
+         lambda i: models.DB.all(models.upcoming_candidates_query(
+             datetime.now(), limit=50))),
+    ]
+
+
+def prepared_queries():
+    """The same queries run as prepared statements. """
+
+    return [
+        ('candidate by id',
+         lambda i: queries.candidate_by_id(FIRST_ID + i)),
+        ('candidate by name',
+         lambda i: queries.candidate_by_name('Matt', str(i))),
+        ('interview by candidate',
+         lambda i: queries.interview_by_candidate(FIRST_ID + i)),
+        ('upcoming candidates',
+         lambda i: queries.upcoming_candidates(datetime.now(), limit=50)),
+    ]
+
+
+async def measure(func):
+    """Returns the mean time (in microseconds) of a call. """
+
+    started = time.monotonic()
+    for i in range(CALLS):
+        await func(i % CANDIDATES)
+
+    return (time.monotonic() - started) / CALLS * 10 ** 6
+
+
+async def seed():
+    """Creates the candidates along with their upcoming interviews. """
+
+    now = datetime.now()
+    await models.insert_candidates([
+        {'id': FIRST_ID + i, 'first_name': 'Matt', 'last_name': str(i)}
+        for i in range(CANDIDATES)
+    ])
+    await models.DB.status(models.Interview.__table__.insert(), [
+        {'candidate': FIRST_ID + i, 'type': 'STATUS', 'created': now,
+         'start': now + timedelta(days=1, minutes=i),
+         'end': now + timedelta(days=1, minutes=i + 60)}
+        for i in range(CANDIDATES)
+    ])
+
+
+async def cleanup():
+    """Removes the candidates and interviews created by the benchmark. """
+
+    await models.Interview.delete.where(
+        models.Interview.candidate >= FIRST_ID).gino.status()
+    await models.Candidate.delete.where(
+        models.Candidate.id >= FIRST_ID).gino.status()
+
+
+async def main():
+    """The main entry point. """
+
+    # A single connection, so that both paths run on the same one.
+    await models.DB.set_bind(os.environ['POSTGRES_URL'], min_size=1, max_size=1)
+
+    try:
+        await cleanup()
+        await seed()
+
+        for (name, orm), (_, prepared) in zip(orm_queries(), prepared_queries()):
+            orm_latency = await measure(orm)
+            prepared_latency = await measure(prepared)
+            print('{:24} orm {:8.1f} us, prepared {:8.1f} us, {:.2f}x'.format(
+                name + ':', orm_latency, prepared_latency,
+                orm_latency / prepared_latency))
+    finally:
+        await cleanup()
+
+
+if __name__ == '__main__':
+    asyncio.get_event_loop().run_until_complete(main())
@@ -0,0 +1,106 @@
+# Copyright 2019 Evgeny Golyshev. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmark comparing APScheduler with the asyncpg jobstore and the reminder
+engine when hundreds of thousands of reminders are pending. It reports the
+time it takes to load the reminders when the server is started and the
+average time of adding and removing a reminder.
+
+Run it from the server directory against a migrated database:
+
+    env PYTHONPATH=$(pwd) POSTGRES_URL=postgresql://postgres@localhost/test \\
+        python3 benchmarks/reminder_engine.py
+"""
+
+import os
+import time
+from datetime import datetime, timedelta
+
+import tornado.ioloop
+
+from huntflow_reloaded.models import DB
+from huntflow_reloaded.pool import Pool
+from huntflow_reloaded.scheduler import Scheduler
+
+PENDING = (100000, 1000000)
+
+OPERATIONS = 10000
+
+SEED_REMINDERS = DB.text("""
+    INSERT INTO scheduled_jobs (id, kind, ref_id, run_time)
+    SELECT 'benchmark-' || n, 'interview', n, now() + interval '30 days' + n * interval '1 s'
+    FROM generate_series(1, :count) n
+""")
+
+DELETE_REMINDERS = "DELETE FROM scheduled_jobs WHERE id LIKE 'benchmark-%'"
+
+
+async def measure(postgres_url, jobstore):
+    """Prints the time of loading the reminders and of adding and removing
+    them using the specified jobstore.
+    """
+
+    scheduler = Scheduler(redis_args='', channel_name='benchmark',
+                          postgres_url=postgres_url, jobstore=jobstore)
+    scheduler.make()
+    try:
+        started = time.monotonic()
+        await scheduler.load()
+        load_time = time.monotonic() - started
+
+        date = datetime.now() + timedelta(days=15)
+        job_ids = ['benchmark-op-{}'.format(number) for number in range(OPERATIONS)]
+
+        started = time.monotonic()
+        for number, job_id in enumerate(job_ids):
+            scheduler.add_reminder(date + timedelta(seconds=number), 'interview', number,
+                                   job_id=job_id)
+        add_time = time.monotonic() - started
+
+        started = time.monotonic()
+        for job_id in job_ids:
+            scheduler.remove_job(job_id)
+        remove_time = time.monotonic() - started
+
+        await scheduler.flush()
+
+        print('{:8} load {:8.1f} ms, add {:6.1f} us, remove {:6.1f} us'.format(
+            jobstore + ':', load_time * 1000, add_time / OPERATIONS * 10 ** 6,
+            remove_time / OPERATIONS * 10 ** 6))
+    finally:
+        scheduler.shutdown()
+
+
+def main():
+    """The main entry point. """
+
+    postgres_url = os.environ['POSTGRES_URL']
+    io_loop = tornado.ioloop.IOLoop.current()
+
+    pool = Pool(postgres_url)
+    io_loop.run_sync(pool.open)
+
+    try:
+        for pending in PENDING:
+            print('{} pending reminders'.format(pending))
+            io_loop.run_sync(lambda: DB.status(SEED_REMINDERS, count=pending))  # pylint: disable=cell-var-from-loop
+            for jobstore in ('asyncpg', 'heap'):
+                io_loop.run_sync(lambda: measure(postgres_url, jobstore))  # pylint: disable=cell-var-from-loop
+            io_loop.run_sync(lambda: DB.status(DELETE_REMINDERS))
+    finally:
+        io_loop.run_sync(pool.close)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+# Copyright 2019 Evgeny Golyshev. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmark comparing the latency of the concurrent webhooks scheduling
+the interview reminders with the SQLAlchemy jobstore, which blocks the
+IOLoop, and with the asyncpg one. Each webhook schedules the reminders of a
+new interview.
+
+Run it from the server directory against a migrated database:
+
+    env PYTHONPATH=$(pwd) POSTGRES_URL=postgresql://postgres@localhost/test \\
+        python3 benchmarks/scheduling_latency.py
+"""
+
+import json
+import os
+import time
+from datetime import datetime, timedelta
+
+import tornado.ioloop
+import tornado.web
+from tornado import gen
+from tornado.httpclient import AsyncHTTPClient
+
+from huntflow_reloaded import handler, models
+from huntflow_reloaded.pool import Pool
+from huntflow_reloaded.scheduler import Scheduler
+
+CONCURRENCY = 50
+
+REQUESTS = 2000
+
+PORT = 8889
+
+# The candidates are created far from the ids used by Huntflow, so that they
+# can be safely removed when the benchmark is finished.
+FIRST_ID = 10 ** 9
+
+
+def make_body(number):
+    """Returns the webhook setting the interview of a new candidate. """
+
+    start = datetime.now() + timedelta(days=2, minutes=number)
+    return json.dumps({
+        'event': {
+            'type': 'STATUS',
+            'applicant': {'id': FIRST_ID + number, 'first_name': 'Matt',
+                          'last_name': str(number)},
+            'calendar_event': {
+                'start': start.strftime('%Y-%m-%dT%H:%M:%S+03:00'),
+                'end': (start + timedelta(hours=1)).strftime('%Y-%m-%dT%H:%M:%S+03:00'),
+            },
+        },
+    })
+
+
+def percentile(values, fraction):
+    """Returns the value the specified fraction of the values don't exceed. """
+
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+async def run(offset):
+    """Sends REQUESTS webhooks by CONCURRENCY concurrent clients and returns
+    the latencies (in seconds) of the requests.
+    """
+
+    client = AsyncHTTPClient(max_clients=CONCURRENCY)
+    url = 'http://localhost:{}/hf'.format(PORT)
+    latencies = []
+    numbers = iter(range(offset, offset + REQUESTS))
+
+    async def worker():
+        for number in numbers:
+            started = time.monotonic()
+            await client.fetch(url, method='POST', body=make_body(number))
+            latencies.append(time.monotonic() - started)
+
+    await gen.multi([worker() for _ in range(CONCURRENCY)])
+    return latencies
+
+
+async def cleanup(scheduler):
+    """Removes the jobs, candidates and interviews created by the benchmark. """
+
+    scheduler.scheduler.remove_all_jobs()
+    await scheduler.flush()
+    await models.Interview.delete.where(
+        models.Interview.candidate >= FIRST_ID).gino.status()
+    await models.Candidate.delete.where(
+        models.Candidate.id >= FIRST_ID).gino.status()
+
+
+def main():
+    """The main entry point. """
+
+    postgres_url = os.environ['POSTGRES_URL']
+    io_loop = tornado.ioloop.IOLoop.current()
+
+    pool = Pool(postgres_url, min_size=CONCURRENCY, max_size=CONCURRENCY)
+    io_loop.run_sync(pool.open)
+
+    for number, jobstore in enumerate(('sqlalchemy', 'asyncpg')):
+        scheduler = Scheduler(redis_args='', channel_name='benchmark',
+                              postgres_url=postgres_url, jobstore=jobstore)
+        scheduler.make()
+        io_loop.run_sync(scheduler.load)
+
+        application = tornado.web.Application([
+            (r'/hf/?', handler.HuntflowWebhookHandler,
+             {'pool': pool, 'scheduler': scheduler}),
+        ])
+        server = application.listen(PORT)
+
+        try:
+            latencies = io_loop.run_sync(lambda number=number: run(number * REQUESTS))
+            print('{:10} p50 {:7.1f} ms, p99 {:7.1f} ms'.format(
+                jobstore + ':', percentile(latencies, 0.5) * 1000,
+                percentile(latencies, 0.99) * 1000))
+        finally:
+            server.stop()
+            io_loop.run_sync(lambda scheduler=scheduler: cleanup(scheduler))
+            scheduler.scheduler.shutdown(wait=False)
+
+    io_loop.run_sync(pool.close)
+
+
+if __name__ == '__main__':
+    main()
@@ -15,15 +15,26 @@
 
 """Server intended for handling the POST requests from Huntflow. """
 
+import functools
 import logging
 import sys
 
+import asyncpg
 import redis
 import tornado.ioloop
 from tornado.options import define, options
 from dotenv import load_dotenv
 
+from huntflow_reloaded.batching import WriteBatcher
+from huntflow_reloaded.cache import CANDIDATES
+from huntflow_reloaded.idempotency import IdempotencyCache
+from huntflow_reloaded.ingest import IngestQueue
+from huntflow_reloaded.journal import Journal
+from huntflow_reloaded.locks import CandidateLocks
+from huntflow_reloaded.pool import Pool, Replicas
+from huntflow_reloaded.retention import RetentionSweeper
 from huntflow_reloaded.scheduler import Scheduler
+from huntflow_reloaded.upcoming import UPCOMING
 from huntflow_reloaded import handler
 
 load_dotenv()
@@ -31,26 +42,122 @@ load_dotenv()
 LOGGER = logging.getLogger('tornado.application')
 
 
+define('advisory-locks', help='serialize the webhooks of the same candidate '
+                              'across several server processes using Postgres '
+                              'advisory locks',
+       default=False, type=bool)
+define('candidate-cache-misses', help='cache the candidates which are not '
+                                      'found as well (only for a single '
+                                      'server process)',
+       default=False, type=bool)
+define('candidate-cache-size', help='specify the number of the candidates '
+                                    'cached in memory (0 disables the cache)',
+       default=10000, type=int)
+define('candidate-cache-ttl', help='specify the number of seconds the '
+                                   'candidates are cached for',
+       default=60, type=int)
+define('candidate-lock-stripes', help='specify the number of locks the '
+                                      'candidates are spread among (0 '
+                                      'disables the locks)',
+       default=64, type=int)
 define('channel-name',
        help='specify the channel name which is used for communicating with '
             'the bot',
        default='hubot-huntflow-reloaded')
+define('idempotency-cache-size', help='specify the number of the handled '
+                                       'webhooks remembered to skip their '
+                                       'repeated deliveries (0 disables the '
+                                       'cache)',
+       default=10000, type=int)
+define('idempotency-persistent', help='share the handled webhooks between the '
+                                      'server processes via Postgres',
+       default=False, type=bool)
+define('idempotency-ttl', help='specify the number of seconds the handled '
+                               'webhooks are remembered for',
+       default=24 * 60 * 60, type=int)
+define('ingest-queue-size', help='specify the maximum number of webhooks '
+                                  'waiting to be processed',
+       default=1000, type=int)
+define('ingest-retry-after', help='specify the number of seconds Huntflow '
+                                  'is asked to wait when the queue is full',
+       default=5, type=int)
+define('ingest-workers', help='specify the number of workers processing the '
+                              'webhooks in the background (0 means the '
+                              'webhooks are processed before responding)',
+       default=0, type=int)
+define('interview-index', help='keep the upcoming interviews in memory to '
+                                'list the candidates without querying '
+                                'Postgres (only for a single server process)',
+       default=False, type=bool)
+define('jobstore', help='specify the store of the scheduled jobs: sqlalchemy, '
+                        'asyncpg (keeps the jobs in memory and saves them '
+                        'without blocking the server) or heap (same as asyncpg, '
+                        'but the reminders are fired without APScheduler)',
+       default='sqlalchemy')
+define('journal-dir', help='specify the directory the accepted webhooks are '
+                           'written to before processing (the journal is '
+                           'disabled if empty)',
+       default='')
+define('journal-fsync-interval', help='specify the maximum time (in '
+                                      'milliseconds) the webhooks wait for '
+                                      'being flushed to the journal',
+       default=2.0, type=float)
+define('journal-mmap', help='read the journal segments using mmap on startup',
+       default=False, type=bool)
+define('journal-segment-size', help='specify the size (in bytes) of the '
+                                    'journal segment files',
+       default=64 * 1024 * 1024, type=int)
+define('lazy-reminders', help='keep only the next reminder about each '
+                               'interview scheduled and schedule the '
+                               'following one when it fires',
+       default=False, type=bool)
+define('max-body-size', help='specify the maximum size (in bytes) of the '
+                             'webhook body',
+       default=handler.MAX_BODY_SIZE, type=int)
 define('port', help='listen on a specific port', default='8888')
 define('postgres-dbname', help='specify Postgres database name',
        default='huntflow-reloaded')
 define('postgres-host', help='specify Postgres hostname and port', default='localhost')
 define('postgres-pass', help='specify Postgres password', default='')
+define('postgres-pool-max-size', help='specify the maximum number of '
+                                      'connections to Postgres',
+       default=10, type=int)
+define('postgres-pool-min-size', help='specify the number of connections to '
+                                      'Postgres established on startup',
+       default=10, type=int)
 define('postgres-port', help='specify Postgres port', default='5432')
+define('postgres-replica-max-lag', help='specify the number of seconds a '
+                                        'replica may lag behind the primary '
+                                        'to be read from',
+       default=5.0, type=float)
+define('postgres-replicas', help='specify the comma-separated URLs of the '
+                                 'Postgres replicas the /manage endpoints '
+                                 'read from',
+       default='')
 define('postgres-user', help='specify Postgres username', default='postgres')
+define('retention-batch-size', help='specify the maximum number of the '
+                                    'employed candidates removed by one '
+                                    'statement',
+       default=1000, type=int)
+define('retention-sweep-interval', help='specify how often (in seconds) the '
+                                        'candidates are removed the day after '
+                                        'their first working day',
+       default=60 * 60, type=int)
 define('redis-host', help='specify Redis host', default='localhost')
 define('redis-password', help='specify Redis password', default='')
 define('redis-port', help='specify Redis port', default=6379)
+define('write-batch-size', help='specify the maximum number of interviews '
+                                'saved in one transaction',
+       default=100, type=int)
+define('write-batch-window', help='specify the time (in milliseconds) the '
+                                  'interviews saved by the concurrent webhooks '
+                                  'are collected for to be saved in one '
+                                  'transaction (0 disables the batching)',
+       default=0.0, type=float)
 
 
-def main():
-    """The main entry point. """
-
-    options.parse_command_line()
+def check_redis():
+    """Exits if Redis can't be reached. """
 
     conn = redis.StrictRedis(host=options.redis_host,
                              password=options.redis_password,
@@ -62,6 +169,102 @@ def main():
         sys.stderr.write('Could not connect to Redis\n')
         sys.exit(1)
 
+
+def open_pools(postgres_url):
+    """Opens the pool of connections to Postgres and the pools of the
+    replicas if they are specified. Exits if Postgres can't be reached.
+    """
+
+    pool = Pool(postgres_url,
+                min_size=options.postgres_pool_min_size,
+                max_size=options.postgres_pool_max_size)
+
+    replicas = None
+    if options.postgres_replicas:
+        replicas = Replicas(options.postgres_replicas.split(','),
+                            min_size=options.postgres_pool_min_size,
+                            max_size=options.postgres_pool_max_size,
+                            max_lag=options.postgres_replica_max_lag)
+
+    try:
+        tornado.ioloop.IOLoop.current().run_sync(pool.open)
+        if replicas:
+            tornado.ioloop.IOLoop.current().run_sync(replicas.open)
+    except (OSError, asyncpg.PostgresError):
+        sys.stderr.write('Could not connect to Postgres\n')
+        sys.exit(1)
+
+    return pool, replicas
+
+
+def start_sweeper():
+    """Starts removing the employed candidates periodically. """
+
+    sweeper = RetentionSweeper(batch_size=options.retention_batch_size)
+    tornado.ioloop.IOLoop.current().spawn_callback(sweeper.sweep)
+    tornado.ioloop.PeriodicCallback(
+        lambda: tornado.ioloop.IOLoop.current().spawn_callback(sweeper.sweep),
+        options.retention_sweep_interval * 1000).start()
+
+
+def make_webhook_args(app_args):
+    """Returns the arguments of the handlers of the single webhooks and of
+    the batches of them. The journal and the ingest queue are not included.
+    """
+
+    batch_args = dict(app_args, max_body_size=options.max_body_size)
+    webhook_args = dict(app_args, max_body_size=options.max_body_size)
+
+    if options.candidate_lock_stripes:
+        locks = CandidateLocks(stripes=options.candidate_lock_stripes,
+                               advisory=options.advisory_locks)
+        batch_args['locks'] = locks
+        webhook_args['locks'] = locks
+
+    if options.write_batch_window:
+        webhook_args['writer'] = WriteBatcher(window=options.write_batch_window / 1000,
+                                              max_items=options.write_batch_size)
+
+    if options.idempotency_cache_size:
+        idempotency = IdempotencyCache(maxsize=options.idempotency_cache_size,
+                                       ttl=options.idempotency_ttl,
+                                       persistent=options.idempotency_persistent)
+        batch_args['idempotency'] = idempotency
+        webhook_args['idempotency'] = idempotency
+
+        if options.idempotency_persistent:
+            tornado.ioloop.PeriodicCallback(
+                lambda: tornado.ioloop.IOLoop.current().spawn_callback(idempotency.purge),
+                options.idempotency_ttl * 1000).start()
+
+    return batch_args, webhook_args
+
+
+def open_journal(scheduler):
+    """Opens the journal and replays the webhooks which have not been
+    processed.
+    """
+
+    journal = Journal(options.journal_dir,
+                      fsync_interval=options.journal_fsync_interval / 1000,
+                      segment_size=options.journal_segment_size,
+                      use_mmap=options.journal_mmap)
+    pending = journal.open()
+
+    LOGGER.info('replaying %s journal entries', len(pending))
+    tornado.ioloop.IOLoop.current().run_sync(
+        functools.partial(journal.replay, scheduler))
+
+    return journal
+
+
+def main():
+    """The main entry point. """
+
+    options.parse_command_line()
+
+    check_redis()
+
     postgres_url = 'postgresql://{user}:{password}@{host}:{port}/{dbname}'.format(
         user=options.postgres_user,
         password=options.postgres_pass,
@@ -78,24 +281,62 @@ def main():
             'port': options.redis_port
         },
         'channel_name': options.channel_name,
+        'jobstore': options.jobstore,
+        'lazy_reminders': options.lazy_reminders,
     }
 
+    pool, replicas = open_pools(postgres_url)
+
+    CANDIDATES.configure(maxsize=options.candidate_cache_size,
+                         ttl=options.candidate_cache_ttl,
+                         cache_misses=options.candidate_cache_misses)
+
+    if options.interview_index:
+        tornado.ioloop.IOLoop.current().run_sync(UPCOMING.load)
+
     scheduler = Scheduler(**scheduler_args)
     scheduler.make()
+    tornado.ioloop.IOLoop.current().run_sync(scheduler.load)
+
+    start_sweeper()
 
     app_args = {
         'scheduler' : scheduler,
-        'postgres_url': postgres_url,
+        'pool': pool,
     }
 
+    manage_args = {
+        'pool': pool,
+        'replicas': replicas,
+    }
+
+    batch_args, webhook_args = make_webhook_args(app_args)
+    ingest = None
+    journal = None
+
+    if options.journal_dir:
+        journal = open_journal(scheduler)
+        webhook_args['journal'] = journal
+
+    if options.ingest_workers:
+        ingest = IngestQueue(workers=options.ingest_workers,
+                             maxsize=options.ingest_queue_size,
+                             retry_after=options.ingest_retry_after,
+                             journal=journal,
+                             idempotency=webhook_args.get('idempotency'))
+        ingest.start()
+        webhook_args['ingest'] = ingest
+
     application = tornado.web.Application([
-        (r'/hf/?', handler.HuntflowWebhookHandler, app_args),
-        (r'/token', handler.TokenObtainPairHandler, {'postgres_url': postgres_url}),
+        (r'/hf/?', handler.HuntflowWebhookHandler, webhook_args),
+        (r'/hf/batch/?', handler.HuntflowBatchWebhookHandler, batch_args),
+        (r'/token', handler.TokenObtainPairHandler, {'pool': pool}),
         (r'/token/refresh', handler.TokenRefreshHandler),
-        (r'/manage/list', handler.ListCandidatesHandler, {'postgres_url': postgres_url}),
+        (r'/manage/list', handler.ListCandidatesHandler, manage_args),
         (r'/manage/delete', handler.DeleteInterviewHandler, app_args),
-        (r'/manage/fwd_list', handler.ListCandidatesWithFwdHandler, {'postgres_url': postgres_url}),
-        (r'/manage/fwd', handler.ShowFwdHandler, {'postgres_url': postgres_url})
+        (r'/manage/fwd_list', handler.ListCandidatesWithFwdHandler, manage_args),
+        (r'/manage/fwd', handler.ShowFwdHandler, manage_args),
+        (r'/metrics', handler.MetricsHandler),
     ])
     application.listen(options.port)
 
@@ -106,6 +347,14 @@ def main():
     except KeyboardInterrupt:
         sys.stderr.write('Shutting down the server since the signal was '
                          'generated by Ctrl-C\n')
+        # The accepted webhooks are processed before the pool is closed.
+        if ingest:
+            tornado.ioloop.IOLoop.current().run_sync(ingest.stop)
+        if journal:
+            tornado.ioloop.IOLoop.current().run_sync(journal.close)
+        if replicas:
+            tornado.ioloop.IOLoop.current().run_sync(replicas.close)
+        tornado.ioloop.IOLoop.current().run_sync(pool.close)
         sys.exit(130)
 
 
@@ -14,7 +14,9 @@
 # limitations under the License.
 
 
-"""Utility for controlling (creating/deleting/printing) the clients instances. """
+"""Utility for controlling (creating/deleting/printing) the clients instances
+and archiving the past interviews.
+"""
 
 import asyncio
 import re
@@ -24,6 +26,7 @@ import ssl
 import string
 import sys
 from argparse import ArgumentParser
+from datetime import date
 from email.message import EmailMessage
 from smtplib import SMTP_SSL, SMTPException
 
@@ -31,6 +34,7 @@ from asyncpg.exceptions import UniqueViolationError
 from dotenv import load_dotenv
 
 from huntflow_reloaded.models import User, gino_run
+from huntflow_reloaded.partitions import add_months, archive_partitions, create_partitions
 
 
 load_dotenv()
@@ -114,6 +118,16 @@ async def list_of_users():
     return all_users
 
 
+async def archive_interviews(horizon, ahead, drop):
+    """Creating the partitions of the next months and archiving the
+    partitions older than horizon months.
+    """
+    today = date.today()
+    created = await create_partitions(today, ahead)
+    archived = await archive_partitions(add_months(today, -horizon), drop=drop)
+    return created, archived
+
+
 def connect_to_postgres(loop, connection_str):
     """Connecting to postgres server. """
     loop.run_until_complete(gino_run(connection_str))
@@ -136,6 +150,22 @@ def parse_args():
 
     subparsers = parser.add_subparsers(help='commands', dest='command')
 
+    # archive command
+    parser_archive = subparsers.add_parser('archive',
+                                           help='archive the past interviews')
+    parser_archive.add_argument('-m', '--horizon', dest='horizon', type=int,
+                                default=12,
+                                help='number of months the interviews are '
+                                     'kept for')
+    parser_archive.add_argument('-a', '--ahead', dest='ahead', type=int,
+                                default=3,
+                                help='number of the next months to create '
+                                     'the partitions for')
+    parser_archive.add_argument('-d', '--drop', dest='drop',
+                                action='store_true',
+                                help='drop the archived partitions instead '
+                                     'of detaching them')
+
     # create command
     parser_create = subparsers.add_parser('create',
                                           help='create the user instance')
@@ -205,7 +235,16 @@ def main():  # pylint: disable=too-many-branches,too-many-statements,too-many-lo
 
     loop.run_until_complete(gino_run(connection_str))
 
-    if args.command == 'create':
+    if args.command == 'archive':
+        created, archived = loop.run_until_complete(
+            archive_interviews(args.horizon, args.ahead, args.drop))
+        loop.close()
+        for name in created:
+            sys.stderr.write('Partition {} created\n'.format(name))
+        for name in archived:
+            sys.stderr.write('Partition {} {}\n'.format(
+                name, 'dropped' if args.drop else 'detached'))
+    elif args.command == 'create':
         password = generate_password(args.pass_len)
         if not is_valid_email(args.email):
             sys.stderr.write('Not valid email!\n')
@@ -15,10 +15,48 @@
 
 set -x
 
+ADVISORY_LOCKS=${ADVISORY_LOCKS:="false"}
+
+CANDIDATE_CACHE_MISSES=${CANDIDATE_CACHE_MISSES:="false"}
+
+CANDIDATE_CACHE_SIZE=${CANDIDATE_CACHE_SIZE:="10000"}
+
+CANDIDATE_CACHE_TTL=${CANDIDATE_CACHE_TTL:="60"}
+
+CANDIDATE_LOCK_STRIPES=${CANDIDATE_LOCK_STRIPES:="64"}
+
 CHANNEL_NAME=${CHANNEL_NAME:="hubot-huntflow-reloaded"}
 
+IDEMPOTENCY_CACHE_SIZE=${IDEMPOTENCY_CACHE_SIZE:="10000"}
+
+IDEMPOTENCY_PERSISTENT=${IDEMPOTENCY_PERSISTENT:="false"}
+
+IDEMPOTENCY_TTL=${IDEMPOTENCY_TTL:="86400"}
+
+INGEST_QUEUE_SIZE=${INGEST_QUEUE_SIZE:="1000"}
+
+INGEST_RETRY_AFTER=${INGEST_RETRY_AFTER:="5"}
+
+INGEST_WORKERS=${INGEST_WORKERS:="0"}
+
+INTERVIEW_INDEX=${INTERVIEW_INDEX:="false"}
+
+JOBSTORE=${JOBSTORE:="sqlalchemy"}
+
+JOURNAL_DIR=${JOURNAL_DIR:=""}
+
+JOURNAL_FSYNC_INTERVAL=${JOURNAL_FSYNC_INTERVAL:="2"}
+
+JOURNAL_MMAP=${JOURNAL_MMAP:="false"}
+
+JOURNAL_SEGMENT_SIZE=${JOURNAL_SEGMENT_SIZE:="67108864"}
+
+LAZY_REMINDERS=${LAZY_REMINDERS:="false"}
+
 LOGLEVEL=${LOGLEVEL:="info"}
 
+MAX_BODY_SIZE=${MAX_BODY_SIZE:="10485760"}
+
 LOG_FILE=${LOG_FILE:="/var/log/huntflow-reloaded-server.log"}
 
 POSTGRES_DBNAME=${POSTGRES_DBNAME:="huntflow-reloaded"}
@@ -27,8 +65,16 @@ POSTGRES_HOST=${POSTGRES_HOST:="127.0.0.1"}
 
 POSTGRES_PASSWORD=${POSTGRES_PASSWORD:=""}
 
+POSTGRES_POOL_MAX_SIZE=${POSTGRES_POOL_MAX_SIZE:="10"}
+
+POSTGRES_POOL_MIN_SIZE=${POSTGRES_POOL_MIN_SIZE:="10"}
+
 POSTGRES_PORT=${POSTGRES_PORT:="5432"}
 
+POSTGRES_REPLICA_MAX_LAG=${POSTGRES_REPLICA_MAX_LAG:="5"}
+
+POSTGRES_REPLICAS=${POSTGRES_REPLICAS:=""}
+
 POSTGRES_USER=${POSTGRES_USER:="postgres"}
 
 REDIS_HOST=${REDIS_HOST:="127.0.0.1"}
@@ -37,6 +83,14 @@ REDIS_PASSWORD=${REDIS_PASSWORD:=""}
 
 REDIS_PORT=${REDIS_PORT:="16379"}
 
+RETENTION_BATCH_SIZE=${RETENTION_BATCH_SIZE:="1000"}
+
+RETENTION_SWEEP_INTERVAL=${RETENTION_SWEEP_INTERVAL:="3600"}
+
+WRITE_BATCH_SIZE=${WRITE_BATCH_SIZE:="100"}
+
+WRITE_BATCH_WINDOW=${WRITE_BATCH_WINDOW:="0"}
+
 ACCESS_TOKEN_LIFETIME=${ACCESS_TOKEN_LIFETIME:="1"}
 
 REFRESH_TOKEN_LIFETIME=${REFRESH_TOKEN_LIFETIME:="60"}
@@ -87,18 +141,64 @@ args=()
 
 args+=( --port="${PORT}")
 
+args+=( --advisory-locks="${ADVISORY_LOCKS}" )
+
+args+=( --candidate-cache-misses="${CANDIDATE_CACHE_MISSES}" )
+
+args+=( --candidate-cache-size="${CANDIDATE_CACHE_SIZE}" )
+
+args+=( --candidate-cache-ttl="${CANDIDATE_CACHE_TTL}" )
+
+args+=( --candidate-lock-stripes="${CANDIDATE_LOCK_STRIPES}" )
+
 args+=( --channel-name="${CHANNEL_NAME}")
 
+args+=( --idempotency-cache-size="${IDEMPOTENCY_CACHE_SIZE}" )
+
+args+=( --idempotency-persistent="${IDEMPOTENCY_PERSISTENT}" )
+
+args+=( --idempotency-ttl="${IDEMPOTENCY_TTL}" )
+
+args+=( --ingest-queue-size="${INGEST_QUEUE_SIZE}" )
+
+args+=( --ingest-retry-after="${INGEST_RETRY_AFTER}" )
+
+args+=( --ingest-workers="${INGEST_WORKERS}" )
+
+args+=( --interview-index="${INTERVIEW_INDEX}" )
+
+args+=( --jobstore="${JOBSTORE}" )
+
+args+=( --journal-dir="${JOURNAL_DIR}" )
+
+args+=( --journal-fsync-interval="${JOURNAL_FSYNC_INTERVAL}" )
+
+args+=( --journal-mmap="${JOURNAL_MMAP}" )
+
+args+=( --journal-segment-size="${JOURNAL_SEGMENT_SIZE}" )
+
+args+=( --lazy-reminders="${LAZY_REMINDERS}" )
+
 args+=( --logging="${LOGLEVEL}" )
 
+args+=( --max-body-size="${MAX_BODY_SIZE}" )
+
 args+=( --postgres-dbname="${POSTGRES_DBNAME}" )
 
 args+=( --postgres-host="${POSTGRES_HOST}" )
 
 args+=( --postgres-pass="${POSTGRES_PASSWORD}" )
 
+args+=( --postgres-pool-max-size="${POSTGRES_POOL_MAX_SIZE}" )
+
+args+=( --postgres-pool-min-size="${POSTGRES_POOL_MIN_SIZE}" )
+
 args+=( --postgres-port="${POSTGRES_PORT}" )
 
+args+=( --postgres-replica-max-lag="${POSTGRES_REPLICA_MAX_LAG}" )
+
+args+=( --postgres-replicas="${POSTGRES_REPLICAS}" )
+
 args+=( --postgres-user="${POSTGRES_USER}" )
 
 args+=( --redis-host="${REDIS_HOST}" )
@@ -107,6 +207,14 @@ args+=( --redis-password="${REDIS_PASSWORD}" )
 
 args+=( --redis-port="${REDIS_PORT}" )
 
+args+=( --retention-batch-size="${RETENTION_BATCH_SIZE}" )
+
+args+=( --retention-sweep-interval="${RETENTION_SWEEP_INTERVAL}" )
+
+args+=( --write-batch-size="${WRITE_BATCH_SIZE}" )
+
+args+=( --write-batch-window="${WRITE_BATCH_WINDOW}" )
+
 args+=( --log-file-prefix="${LOG_FILE}" )
 
 >&2 echo "huntflow-reloaded-server is starting..."
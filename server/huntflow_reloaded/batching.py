@@ -0,0 +1,114 @@
+""" Group commit of the interviews saved by the concurrent webhooks """
+
+import asyncio
+import logging
+
+from . import models
+from .metrics import METRICS
+
+
+class WriteBatcher:  # pylint: disable=too-few-public-methods
+    """Class implementing a stage between the webhook handlers and the
+    database, which collects the interviews saved by the concurrent webhooks
+    for window seconds (or until max_items are collected) and saves them in a
+    single transaction. The candidates and the interviews of the whole batch
+    are saved by one multi-row statement each. Each webhook waits until the
+    shared transaction is committed.
+    """
+
+    def __init__(self, window=0.005, max_items=100):
+        self._handle = None
+        self._items = []
+        self._logger = logging.getLogger('tornado.application')
+        self._max_items = max_items
+        self._window = window
+
+    async def upsert_interview(self, **values):
+        """Queues the interview to be saved and waits until it's saved.
+        Accepts and returns the same as models.upsert_interview.
+        """
+
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+        self._items.append((values, future))
+
+        if len(self._items) >= self._max_items:
+            self._flush()
+        elif self._handle is None:
+            self._handle = loop.call_later(self._window, self._flush)
+
+        return await future
+
+    def _flush(self):
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+
+        items, self._items = self._items, []
+        asyncio.ensure_future(self._write(items))
+
+    async def _write(self, items):
+        METRICS.observe('batching.batch', len(items))
+
+        candidates = {}
+        for values, _ in items:
+            candidates[values['candidate']] = {
+                'id': values['candidate'],
+                'first_name': values['first_name'],
+                'last_name': values['last_name'],
+            }
+
+        # The connection is acquired explicitly, so that the batch never
+        # reuses the connection of the webhook which triggered the flush.
+        try:
+            async with models.DB.acquire(reuse=False) as conn:
+                async with conn.transaction():
+                    await models.insert_candidates(list(candidates.values()), bind=conn)
+                    results = [None] * len(items)
+                    for indexes in self._split(items):
+                        rows = await models.upsert_interviews(
+                            [items[index][0] for index in indexes], bind=conn)
+                        for index, row in zip(indexes, rows):
+                            results[index] = row
+        except Exception:  # pylint: disable=broad-except
+            self._logger.exception('Could not save the batch of %s interviews, '
+                                   'saving them one by one', len(items))
+            await self._write_one_by_one(items)
+            return
+
+        for (_, future), result in zip(items, results):
+            if not future.done():
+                future.set_result(result)
+
+    @staticmethod
+    def _split(items):
+        # Returns the lists of the indexes of the items saved by each
+        # statement. The interviews of the same candidate and type are saved
+        # by the statements run one after another, in the order they came.
+        rounds = []
+        seen = {}
+        for index, (values, _) in enumerate(items):
+            key = (values['candidate'], values['type'])
+            number = seen.get(key, 0)
+            seen[key] = number + 1
+
+            if number == len(rounds):
+                rounds.append([])
+            rounds[number].append(index)
+
+        return rounds
+
+    @staticmethod
+    async def _write_one_by_one(items):
+        # The webhook may have stopped waiting, but the interview is saved
+        # anyway like the ones of the batch.
+        for values, future in items:
+            try:
+                async with models.DB.acquire(reuse=False) as conn:
+                    result = await models.upsert_interview(bind=conn, **values)
+            except Exception as exc:  # pylint: disable=broad-except
+                if not future.done():
+                    future.set_exception(exc)
+            else:
+                if not future.done():
+                    future.set_result(result)
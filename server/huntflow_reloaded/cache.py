@@ -0,0 +1,123 @@
+""" Read-through cache of the candidates """
+
+import time
+from collections import OrderedDict
+
+from .metrics import METRICS
+from .models import DB
+from . import queries
+
+
+class CandidateCache:
+    """Class implementing an LRU cache of the candidates looked up either by
+    id or by the (first name, last name) pair. The entries expire in ttl
+    seconds. The code creating or changing the candidates must invalidate
+    them. The cache is disabled until it's configured with a non-zero size.
+
+    The misses are cached only if cache_misses is true. The invalidations are
+    not shared between the server processes, so it's only safe for a single
+    server process: a candidate created by another one would be reported as
+    missing until the miss expires.
+    """
+
+    def __init__(self, maxsize=0, ttl=60, cache_misses=False):
+        self._cache_misses = cache_misses
+        self._entries = OrderedDict()
+        self._maxsize = maxsize
+        # The name each cached candidate is cached by, so the entry can be
+        # found when the candidate is invalidated by id.
+        self._names = {}
+        self._ttl = ttl
+
+        METRICS.gauge('candidate_cache.size', lambda: len(self._entries))
+
+    def configure(self, maxsize, ttl, cache_misses=False):
+        """Changes the size, the ttl of the cache and whether the misses are
+        cached dropping its entries.
+        """
+
+        self._entries.clear()
+        self._names.clear()
+        self._cache_misses = cache_misses
+        self._maxsize = maxsize
+        self._ttl = ttl
+
+    async def get(self, candidate_id):
+        """Returns the candidate with the specified id or None. """
+
+        key = ('id', candidate_id)
+        found, candidate = self._lookup(key)
+        if found:
+            return candidate
+
+        candidate = await queries.candidate_by_id(candidate_id)
+        self._remember(key, candidate)
+        return candidate
+
+    async def get_by_name(self, first_name, last_name, bind=None):
+        """Returns the candidate with the specified name or None. The miss is
+        looked up using bind if it's specified. What is looked up using the
+        bind other than DB (i.e. on a replica) is not cached, since it may be
+        stale and the invalidations made meanwhile would be lost.
+        """
+
+        key = ('name', first_name, last_name)
+        found, candidate = self._lookup(key)
+        if found:
+            return candidate
+
+        candidate = await queries.candidate_by_name(first_name, last_name, bind=bind)
+        if bind is None or bind is DB:
+            self._remember(key, candidate)
+            if candidate is not None:
+                self._remember(('id', candidate['id']), candidate)
+        return candidate
+
+    def invalidate(self, candidate_id, first_name=None, last_name=None):
+        """Forgets the candidate cached by id and by name. The new name of
+        the candidate must be passed to forget the misses cached for it.
+        """
+
+        self._entries.pop(('id', candidate_id), None)
+
+        key = self._names.pop(candidate_id, None)
+        if key is not None:
+            self._entries.pop(key, None)
+
+        if first_name is not None or last_name is not None:
+            self._drop(('name', first_name, last_name))
+
+    def _lookup(self, key):
+        if not self._maxsize:
+            return False, None
+
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            self._drop(key)
+            METRICS.incr('candidate_cache.misses')
+            return False, None
+
+        self._entries.move_to_end(key)
+        METRICS.incr('candidate_cache.hits')
+        return True, entry[1]
+
+    def _remember(self, key, candidate):
+        if not self._maxsize or (candidate is None and not self._cache_misses):
+            return
+
+        self._entries[key] = (time.monotonic() + self._ttl, candidate)
+        self._entries.move_to_end(key)
+        if candidate is not None and key[0] == 'name':
+            self._names[candidate['id']] = key
+
+        while len(self._entries) > self._maxsize:
+            self._drop(next(iter(self._entries)))
+            METRICS.incr('candidate_cache.evictions')
+
+    def _drop(self, key):
+        _, candidate = self._entries.pop(key, (None, None))
+        if candidate is not None and self._names.get(candidate['id']) == key:
+            del self._names[candidate['id']]
+
+
+CANDIDATES = CandidateCache()
@@ -0,0 +1,422 @@
+# Copyright 2019 Evgeny Golyshev. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Module containing the processing of the Huntflow webhook events. """
+
+
+import functools
+import json
+import logging
+import re
+from datetime import datetime
+
+from tornado.escape import json_decode
+
+from huntflow_reloaded import models
+from .cache import CANDIDATES
+from .locks import NullLock
+from .metrics import METRICS
+from .upcoming import UPCOMING
+
+
+class IncompleteRequest(Exception):
+    """Exception raised when receiving a request of a specific type but not
+    containing the necessary fields for this type.
+    """
+
+
+class UndefinedType(Exception):
+    """Exception raised when receiving a request which doesn't contain the type
+    field in its body.
+    """
+
+
+class UnknownType(Exception):
+    """Exception raised when receiving a request which has the type field in
+    its body, but the value is unknown.
+    """
+
+
+class EventDispatcher(type):
+    """Metaclass building the table of the event handlers once, when the
+    class is created. For each NAME_TYPE attribute the name_type_handler
+    method is used, or the stub handler if there is no such method.
+    """
+
+    def __init__(cls, name, bases, namespace):
+        super(EventDispatcher, cls).__init__(name, bases, namespace)
+
+        cls.HANDLERS = {}
+        for i in dir(cls):
+            if i.endswith('_TYPE'):
+                key = getattr(cls, i)
+                cls.HANDLERS[key] = getattr(cls, '{}_handler'.format(i.lower()),
+                                            cls.stub_handler)
+
+
+class WebhookEvent(metaclass=EventDispatcher):  # pylint: disable=too-many-instance-attributes
+    """Class implementing the processing of a single Huntflow webhook event
+    regardless of the HTTP request it was delivered with.
+    """
+
+    ADD_TYPE = 1
+    REMOVED_TYPE = 2
+    STATUS_TYPE = 3
+    TYPES = {
+        'ADD': ADD_TYPE,
+        'REMOVED': REMOVED_TYPE,
+        'STATUS': STATUS_TYPE,
+    }
+
+    HANDLERS = {}
+
+    # The parts of the webhook body the handlers use. Everything else (the
+    # resume, the custom fields, etc.) is dropped as soon as the body is
+    # decoded.
+    FIELDS = {
+        'event': {
+            'id': None,
+            'type': None,
+            'created': None,
+            'applicant': {
+                'id': None,
+                'first_name': None,
+                'last_name': None,
+            },
+            'calendar_event': {
+                'start': None,
+                'end': None,
+            },
+            'employment_date': None,
+        },
+    }
+
+    def __init__(self, decoded_body, scheduler, publish=None, locks=None,  # pylint: disable=too-many-arguments
+                 writer=None, deferred=False):
+        self._decoded_body = decoded_body
+        self._deferred = deferred
+        self._locks = locks
+        self._writer = writer
+        self._logger = logging.getLogger('tornado.application')
+        self._publish = publish or scheduler.publish_now
+        self._req_type = None
+        self._scheduler = scheduler
+        self.basic_attrs = {}
+        self.event = {}
+        self.event_type = ''
+        self.context = {}
+        self.message = {}
+        self.previous_jobs = []
+        self.start = None
+        self.unchanged = False
+
+    @classmethod
+    def register_type(cls, name, handler=None):
+        """Registers the handler of the events of the specified type, which
+        may be either a new type or one of the known ones. The handler is a
+        coroutine function accepting the event. Can be used as a decorator:
+
+            @WebhookEvent.register_type('CUSTOM')
+            async def custom_type_handler(event):
+                ...
+        """
+
+        if handler is None:
+            return functools.partial(cls.register_type, name)
+
+        # Copying the tables so that the parent classes are not affected.
+        if name not in cls.TYPES:
+            cls.TYPES = dict(cls.TYPES)
+            cls.TYPES[name] = max(cls.TYPES.values()) + 1
+
+        cls.HANDLERS = dict(cls.HANDLERS)
+        cls.HANDLERS[cls.TYPES[name]] = handler
+
+        return handler
+
+    @classmethod
+    def extract(cls, decoded_body):
+        """Returns the copy of the decoded body containing only the fields
+        listed in FIELDS.
+        """
+
+        return extract_fields(decoded_body, cls.FIELDS)
+
+    def classify(self):
+        """Figures out the type of the event. """
+
+        try:
+            req_type = self._decoded_body['event']['type']
+        except (KeyError, TypeError):
+            raise UndefinedType
+
+        try:
+            self._req_type = self.TYPES[req_type]
+        except (KeyError, TypeError):
+            raise UnknownType
+
+    def validate(self):
+        """Checks the fields of the 'STATUS' event which can be checked
+        without the database, so that the broken events are rejected before
+        they are queued. Raises IncompleteRequest.
+        """
+
+        if self._req_type != self.STATUS_TYPE:
+            return
+
+        try:
+            event = self._decoded_body['event']
+            applicant = event['applicant']
+            if not all(field in applicant for field in ('id', 'first_name', 'last_name')):
+                raise IncompleteRequest
+
+            if event.get('calendar_event'):
+                get_date_from_string(event['calendar_event']['start'])
+                get_date_from_string(event['calendar_event']['end'])
+            elif event.get('employment_date'):
+                datetime.strptime(event['employment_date'], '%Y-%m-%d')
+            else:
+                raise IncompleteRequest
+        except (KeyError, TypeError, ValueError):
+            raise IncompleteRequest
+
+    async def process(self):
+        """Invokes the handler responsible for the type of the event. """
+
+        await self.HANDLERS[self._req_type](self)
+
+    def _form_valid_basic_attrs(self):
+        applicant = self.event['applicant']
+
+        try:
+            self.basic_attrs['_id'] = applicant['id']
+            self.basic_attrs['first_name'] = applicant['first_name']
+            self.basic_attrs['last_name'] = applicant['last_name']
+        except KeyError:
+            raise IncompleteRequest
+
+    #
+    # Handlers
+    #
+
+    async def add_type_handler(self):
+        """Invokes when a request of the 'ADD' type is received. """
+        self._logger.info("Handling 'add' request")
+
+    async def removed_type_handler(self):
+        """Invokes when a request of the 'REMOVED' type is received. """
+        self._logger.info("Handling 'removed' request")
+
+    async def status_type_handler(self):
+        """Invokes when a request of the 'STATUS' type is received:
+        * setting interview;
+        * resetting interview;
+        * setting the first working day.
+        """
+
+        self._logger.info("Handling 'status' request")
+
+        self.event = self._decoded_body['event']
+
+        self._form_valid_basic_attrs()
+
+        # The events of the same candidate are handled one by one, so that
+        # the concurrent webhooks don't leave orphaned interviews or jobs.
+        async with self._lock(self.basic_attrs['_id']):
+            if self.event.get('calendar_event'):
+                await self.handle_calendar_event()
+            elif self.event.get('employment_date'):
+                await self.handle_employment_date()
+            else:
+                raise IncompleteRequest
+
+            if not self._deferred:
+                await self.apply()
+
+    async def apply(self):
+        """Applies the changes of the processed event which are not part of
+        the database transaction: updates the index of the upcoming
+        interviews, removes the jobs of the rescheduled interview, publishes
+        the message and schedules the reminders. The events created with
+        deferred=True apply them only when this method is invoked, e.g. once
+        the transaction is committed.
+        """
+
+        if self.unchanged or not self.message:
+            return
+
+        if self.start is not None and UPCOMING.loaded:
+            UPCOMING.add(self.basic_attrs['_id'], self.basic_attrs['first_name'],
+                         self.basic_attrs['last_name'], self.start)
+
+        if self.previous_jobs:
+            removed = await self._scheduler.remove_jobs(self.previous_jobs)
+            self._logger.info('Removed %s jobs of the rescheduled interview of the '
+                              'candidate %s', removed, self.basic_attrs['_id'])
+
+        self._publish(self.message)
+        if self.event_type:
+            await self._scheduler.create_event(self.event_type,
+                                               context=self.context)
+
+    def _lock(self, candidate_id):
+        return self._locks(candidate_id) if self._locks else NullLock()
+
+    @property
+    def candidate_id(self):
+        """The id of the candidate the event is about, if it's known. """
+
+        try:
+            return self._decoded_body['event']['applicant']['id']
+        except (KeyError, TypeError):
+            return None
+
+    async def handle_calendar_event(self):
+        """Handles the setting and rescheduling of the interview. The
+        candidate and the interview are saved in one round-trip to the
+        database.
+        """
+
+        calendar_event = self.event['calendar_event']
+
+        try:
+            start = calendar_event['start']
+            _end = calendar_event['end']
+        except KeyError:
+            raise IncompleteRequest
+
+        message_type = 'interview'
+        _id = self.basic_attrs['_id']
+        jobs = self._scheduler.get_job_ids()
+        start_date = get_date_from_string(start)
+
+        upsert_interview = self._writer.upsert_interview if self._writer \
+            else models.upsert_interview
+
+        result = await upsert_interview(
+            candidate=_id,
+            first_name=self.basic_attrs['first_name'],
+            last_name=self.basic_attrs['last_name'],
+            type=self.event.get('type'),
+            created=datetime.now(),
+            start=start_date,
+            end=get_date_from_string(_end),
+            start_offset=get_utc_offset_from_string(start),
+            jobs=json.dumps(jobs)
+        )
+
+        # The candidate may have just been created.
+        CANDIDATES.invalidate(_id, self.basic_attrs['first_name'],
+                              self.basic_attrs['last_name'])
+
+        # Huntflow sends the event when any field of the applicant is
+        # changed, so there is no need to reschedule the same interview.
+        if not result['changed']:
+            METRICS.incr('webhook.unchanged_events')
+            self._logger.info('The interview of the candidate %s has not been changed', _id)
+            self.unchanged = True
+            return
+
+        self.start = start_date
+
+        if result['existed']:
+            message_type = 'rescheduled-interview'
+
+            if result['previous_jobs']:
+                self.previous_jobs = json_decode(result['previous_jobs'])
+
+        self.event_type = 'schedule_interview'
+
+        self.message = {
+            "type": message_type,
+            "first_name": self.basic_attrs['first_name'],
+            "last_name": self.basic_attrs['last_name'],
+            "start": start,
+        }
+
+        message_to_be_scheduled = self.message.copy()
+        message_to_be_scheduled["type"] = "interview"
+
+        self.context = {"message": message_to_be_scheduled,
+                        "jobs": jobs,
+                        "interview": result['id']}
+
+    async def handle_employment_date(self):
+        """Handles the setting of the first working day. """
+
+        try:
+            employment_date = self.event['employment_date']
+        except KeyError:
+            raise IncompleteRequest
+
+        _id = self.basic_attrs['_id']
+
+        date_from_string = datetime.strptime(employment_date, "%Y-%m-%d").date()
+
+        if await CANDIDATES.get(_id) is None:
+            raise IncompleteRequest
+
+        await models.Candidate.update.values(
+            first_working_day=date_from_string).where(
+                models.Candidate.id == _id).gino.status()
+        CANDIDATES.invalidate(_id)
+
+        # Nothing is scheduled, since the candidate is removed by the
+        # retention sweeper the day after the first working day.
+        self.message = {
+            'type': 'fwd',
+            'first_name': self.basic_attrs['first_name'],
+            'last_name': self.basic_attrs['last_name'],
+            'employment_date': employment_date,
+        }
+
+    async def stub_handler(self):
+        """Invokes when a type is registered but there is no handler defined
+        which is responsible for dealing with the requests of the type.
+        """
+        self._logger.info('Invoking the stub handler to serve the request of '
+                          'the type %s', self._req_type)
+
+
+def extract_fields(value, fields):
+    """Returns the copy of the value containing only the specified fields.
+    The fields are described by a dict whose keys are the names of the
+    fields and whose values are either the dicts describing the nested
+    fields or None if the field is to be kept as it is.
+    """
+
+    if not isinstance(value, dict):
+        return value
+
+    return {name: value[name] if nested is None else extract_fields(value[name], nested)
+            for name, nested in fields.items() if name in value}
+
+
+def get_date_from_string(date_string):
+    """Transforms the specified date string into a proper datetime object. """
+
+    return _parse_date_string(date_string).replace(tzinfo=None)
+
+
+def get_utc_offset_from_string(date_string):
+    """Returns the UTC offset (in minutes) of the specified date string. """
+
+    return int(_parse_date_string(date_string).utcoffset().total_seconds()) // 60
+
+
+def _parse_date_string(date_string):
+    format_string = '%Y-%m-%dT%H:%M:%S%z'
+    regexp = r"([+-]\d{1,2})(:)(\d{1,2})"
+
+    return datetime.strptime(re.sub(regexp, r"\1\3", date_string), format_string)
@@ -15,309 +15,309 @@
 """Module containing the Huntflow webhook handler. """
 
 
+import asyncio
+import base64
+import binascii
+import functools
 import json
 import logging
-import re
 from datetime import datetime
 
 from tornado.escape import json_decode
-from tornado.web import RequestHandler, MissingArgumentError
-
-from huntflow_reloaded import models
+from tornado.web import RequestHandler, MissingArgumentError, stream_request_body
+
+from huntflow_reloaded import models, queries
+from .cache import CANDIDATES
+from .events import IncompleteRequest, UndefinedType, UnknownType, WebhookEvent
+from .idempotency import delivery_key
+from .locks import NullLock
+from .metrics import METRICS
 from .tokens import RefreshToken, AccessToken, ExpiredTokenException, InvalidTokenException
+from .upcoming import UPCOMING
 
-class IncompleteRequest(Exception):
-    """Exception raised when receiving a request of a specific type but not
-    containing the necessary fields for this type.
-    """
-
-
-class UndefinedType(Exception):
-    """Exception raised when receiving a request which doesn't contain the type
-    field in its body.
-    """
-
+MAX_BODY_SIZE = 10 * 1024 * 1024
 
-class UnknownType(Exception):
-    """Exception raised when receiving a request which has the type field in
-    its body, but the value is unknown.
-    """
+# The number of the rows streamed between the flushes of the response.
+STREAM_CHUNK_SIZE = 100
 
 
 class HuntflowBaseHandler(RequestHandler):  # pylint: disable=abstract-method,too-many-instance-attributes
     """Class implementing a base huntflow webhook handler. """
 
-    GINO_CONNECTED = False
-
-    def initialize(self, postgres_url, scheduler):  # pylint: disable=arguments-differ
-        self._postgres_url = postgres_url
+    def initialize(self, pool, scheduler):  # pylint: disable=arguments-differ
+        self._pool = pool
         self._scheduler = scheduler
 
     async def _connect_to_database(self):
         """ Connecting to ORM if not connected already """
-        if not HuntflowBaseHandler.GINO_CONNECTED:
-            try:
-                await models.gino_run(self._postgres_url)
-            except:
-                raise ConnectionError('Could not connect to Postgresql')
-            else:
-                HuntflowBaseHandler.GINO_CONNECTED = True
+        try:
+            await self._pool.open()
+        except:
+            raise ConnectionError('Could not connect to Postgresql')
 
 
+@stream_request_body
 class HuntflowWebhookHandler(HuntflowBaseHandler):  # pylint: disable=abstract-method,too-many-instance-attributes
-    """Class implementing a Huntflow Webhook handler. """
-
-    ADD_TYPE = 1
-    REMOVED_TYPE = 2
-    STATUS_TYPE = 3
-    TYPES = {
-        'ADD': ADD_TYPE,
-        'REMOVED': REMOVED_TYPE,
-        'STATUS': STATUS_TYPE,
-    }
-    GINO_CONNECTED = False
+    """Class implementing a Huntflow Webhook handler. The body is received
+    in chunks, and the requests whose bodies exceed max_body_size are
+    rejected with 413 before the body is read.
+    """
 
     def __init__(self, application, request, **kwargs):
         super(HuntflowWebhookHandler, self).__init__(application, request,
                                                      **kwargs)
-        self._decoded_body = {}
-        self._handlers = {}
         self._logger = logging.getLogger('tornado.application')
-        self._req_type = None
-        self.basic_attrs = {}
-        self.event = {}
-        self.event_type = ''
-        self.context = {}
-        self.message = {}
+        self._chunks = []
+
+    def initialize(self, pool, scheduler, ingest=None, journal=None,  # pylint: disable=arguments-differ,too-many-arguments
+                   idempotency=None, locks=None, writer=None,
+                   max_body_size=MAX_BODY_SIZE):
+        super(HuntflowWebhookHandler, self).initialize(pool, scheduler)
+        self._idempotency = idempotency
+        self._ingest = ingest
+        self._journal = journal
+        self._locks = locks
+        self._writer = writer
+        self._max_body_size = max_body_size
+
+    def prepare(self):
+        content_length = self.request.headers.get('Content-Length')
+        if content_length is not None and int(content_length) > self._max_body_size:
+            METRICS.incr('webhook.too_large')
+            self.set_status(413)
+            self.finish('Request body is too large')
+            return
 
-        for i in dir(self):
-            if i.endswith('_TYPE'):
-                key = getattr(self, i)
-                val = self._get_attr_or_stub('{}_handler'.format(i.lower()))
-                self._handlers[key] = val
+        # The bodies without Content-Length (chunked ones) are cut off by
+        # the connection itself.
+        self.request.connection.set_max_body_size(self._max_body_size)
 
+    def data_received(self, chunk):
+        self._chunks.append(chunk)
 
-    def _classify_request(self):
-        try:
-            req_type = self._decoded_body['event']['type']
-        except KeyError:
-            raise UndefinedType
+    def _decode_body(self):
+        """Decodes the received body and frees the chunks. Writes the error
+        and returns None if the body is not valid JSON.
+        """
 
-        try:
-            self._req_type = HuntflowWebhookHandler.TYPES[req_type]
-        except KeyError:
-            raise UnknownType
+        body, self._chunks = b''.join(self._chunks), []
 
-    def _get_attr_or_stub(self, attribute_name):
         try:
-            return getattr(self, attribute_name)
-        except AttributeError:
-            return self.stub_handler
-
-    def _process_request(self):
-        pass
+            return json.loads(body.decode('utf8'))
+        except ValueError:
+            self.write('Could not decode request body. '
+                       'There must be valid JSON')
+            self.set_status(500)
+            return None
 
-    def _form_valid_basic_attrs(self):
-        applicant = self.event['applicant']
+    async def _claim(self, key):
+        """Returns the key of the delivery if it's seen for the first time
+        or None if it's a duplicate.
+        """
 
-        try:
-            self.basic_attrs['_id'] = applicant['id']
-            self.basic_attrs['first_name'] = applicant['first_name']
-            self.basic_attrs['last_name'] = applicant['last_name']
-        except KeyError:
-            raise IncompleteRequest
+        if await self._idempotency.claim(key):
+            return key
 
-    async def post(self):  # pylint: disable=arguments-differ
-        body = self.request.body.decode('utf8')
+        self._logger.debug('Skipping the duplicate delivery %s', key)
+        return None
 
+    async def post(self):  # pylint: disable=arguments-differ,too-many-return-statements
         await self._connect_to_database()
 
-        try:
-            self._decoded_body = json_decode(body)
-        except json.decoder.JSONDecodeError:
-            self.write('Could not decode request body. '
-                       'There must be valid JSON')
-            self.set_status(500)
+        decoded_body = self._decode_body()
+        if decoded_body is None:
             return
 
+        # The delivery is identified by the whole body, not only by the
+        # fields the handlers use.
+        raw_body, decoded_body = decoded_body, WebhookEvent.extract(decoded_body)
+        self._logger.debug(decoded_body)
+
+        event = WebhookEvent(decoded_body, self._scheduler, locks=self._locks,
+                             writer=self._writer)
+
         try:
-            self._classify_request()
+            event.classify()
         except UndefinedType:
-            self._logger.debug(body)
             self.write('Undefined type')
             self.set_status(500)
             return
         except UnknownType:
-            self._logger.debug(body)
             self.write('Unknown type')
             self.set_status(500)
             return
 
-        self._logger.debug(self._decoded_body)
-
+        # The broken events are rejected before they are acknowledged with
+        # 202 and lost.
         try:
-            await self._handlers[self._req_type]()
+            event.validate()
         except IncompleteRequest:
-            self._logger.debug(body)
             self.write('Incomplete request')
             self.set_status(500)
             return
 
-        self._logger.debug(body)
-
-    #
-    # Handlers
-    #
+        key = None
+        if self._idempotency:
+            key = await self._claim(delivery_key(raw_body))
+            if key is None:
+                return
 
-    async def add_type_handler(self):
-        """Invokes when a request of the 'ADD' type is received. """
-        self._logger.info("Handling 'add' request")
+        entry_id = None
+        if self._journal:
+            entry_id = await self._append_to_journal(decoded_body, key)
 
-    async def removed_type_handler(self):
-        """Invokes when a request of the 'REMOVED' type is received. """
-        self._logger.info("Handling 'removed' request")
+        if self._ingest:
+            await self._enqueue(event, entry_id, key)
+            return
 
-    async def status_type_handler(self):
-        """Invokes when a request of the 'STATUS' type is received:
-        * setting interview;
-        * resetting interview;
-        * setting the first working day.
+        processed = False
+        try:
+            await event.process()
+            processed = True
+        except IncompleteRequest:
+            self.write('Incomplete request')
+            self.set_status(500)
+            return
+        finally:
+            if entry_id is not None:
+                self._journal.mark_done(entry_id)
+            if key is not None and not processed:
+                await self._idempotency.release(key)
+
+    async def _append_to_journal(self, decoded_body, key):
+        """Writes the body to the journal and returns the id of the entry.
+        The delivery is released if the body could not be written, so it's
+        handled when Huntflow retries it.
         """
 
-        self._logger.info("Handling 'status' request")
-
-        self.event = self._decoded_body['event']
-
-        self._form_valid_basic_attrs()
-
-        if self.event.get('calendar_event'):
-            await self.handle_calendar_event()
-        elif self.event.get('employment_date'):
-            await self.handle_employment_date()
-        else:
-            raise IncompleteRequest
-
-        self._scheduler.publish_now(self.message)
-        await self._scheduler.create_event(self.event_type,
-                                           context=self.context)
-
-    async def handle_calendar_event(self):  # pylint: disable=too-many-locals
-        """Handles the setting and rescheduling of the interview. """
-
-        calendar_event = self.event['calendar_event']
-
         try:
-            start = calendar_event['start']
-            _end = calendar_event['end']
-        except KeyError:
-            raise IncompleteRequest
-
-        message_type = 'interview'
-        _id = self.basic_attrs['_id']
-
-        candidate = await models.Candidate.query.where(models.Candidate.id == _id).gino.all()
-
-        if not candidate:
-            await models.Candidate.create(
-                id=self.basic_attrs['_id'],
-                first_name=self.basic_attrs['first_name'],
-                last_name=self.basic_attrs['last_name']
-            )
-
-        interview = await models.Interview.query \
-            .where(models.Interview.candidate == _id) \
-            .where(models.Interview.type == self.event.get('type')) \
-            .gino.first()
-
-        if interview:
-            message_type = 'rescheduled-interview'
-
-            if interview.jobs:
-                jobs_to_be_deleted = json_decode(interview.jobs)
-
-                for job_id in jobs_to_be_deleted:
-                    self._scheduler.remove_job(job_id)
-
-            await models.Interview.delete.where(models.Interview.candidate == _id).gino.status()
-
-        interview_start = get_date_from_string(start)
-        interview_end = get_date_from_string(_end)
-
-        today = datetime.now()
-
-        options = {
-            "created": today,
-            "type": self.event.get('type'),
-            "candidate": _id,
-            "start": interview_start,
-            "end": interview_end
-        }
-
-        interview = await models.Interview.create(**options)
-
-        self.event_type = 'schedule_interview'
-
-        self.message = {
-            "type": message_type,
-            "first_name": self.basic_attrs['first_name'],
-            "last_name": self.basic_attrs['last_name'],
-            "start": start,
-        }
-
-        message_to_be_scheduled = self.message.copy()
-        message_to_be_scheduled["type"] = "interview"
-
-        self.context = {"message": message_to_be_scheduled,
-                        "interview": interview}
-
-    async def handle_employment_date(self):
-        """Handles the setting of the first working day. """
+            return await self._journal.append(json.dumps(decoded_body).encode('utf8'))
+        except Exception:
+            if key is not None:
+                await self._idempotency.release(key)
+            raise
 
+    async def _enqueue(self, event, entry_id, key):
         try:
-            employment_date = self.event['employment_date']
-        except KeyError:
-            raise IncompleteRequest
-
-        _id = self.basic_attrs['_id']
-
-        candidate = await models.Candidate.query.where(
-            models.Candidate.id == _id).gino.first()
-
-        date_from_string = datetime.strptime(employment_date, "%Y-%m-%d").date()
+            self._ingest.put(event, entry_id, key)
+        except asyncio.QueueFull:
+            if entry_id is not None:
+                self._journal.mark_done(entry_id)
+            if key is not None:
+                await self._idempotency.release(key)
+
+            self.set_header('Retry-After', self._ingest.retry_after)
+            self.write('Too many events are waiting to be processed')
+            self.set_status(503)
+            return
 
-        await candidate.update(first_working_day=date_from_string).apply()
+        self.set_status(202)
 
-        self.event_type = 'remove_candidate'
 
-        self.message = {
-            'type': 'fwd',
-            'first_name': self.basic_attrs['first_name'],
-            'last_name': self.basic_attrs['last_name'],
-            'employment_date': employment_date,
-        }
+class HuntflowBatchWebhookHandler(HuntflowWebhookHandler):  # pylint: disable=abstract-method
+    """Class implementing a handler which accepts an array of Huntflow
+    webhook events and applies all of them in a single database transaction.
+    Each event is processed within its own savepoint, so a broken event does
+    not prevent the rest of the batch from being applied. The jobs are
+    scheduled and the messages are published only when the transaction is
+    committed.
+    """
 
-        self.context = {'employment_date': employment_date,
-                        'candidate_id': _id}
+    ERRORS = {
+        IncompleteRequest: 'Incomplete request',
+        UndefinedType: 'Undefined type',
+        UnknownType: 'Unknown type',
+    }
 
-    async def stub_handler(self):
-        """Invokes when a type is registered but there is no handler defined
-        which is responsible for dealing with the requests of the type.
-        """
-        self._logger.info('Invoking the stub handler to serve the request of '
-                          'the type %s', self._req_type)
+    async def post(self):  # pylint: disable=arguments-differ
+        await self._connect_to_database()
 
+        decoded_body = self._decode_body()
+        if decoded_body is None:
+            return
 
-def get_date_from_string(date_string):
-    """Transforms the specified date string into a proper datetime object. """
+        if not isinstance(decoded_body, list):
+            self.write('Request body must be an array of events')
+            self.set_status(500)
+            return
 
-    format_string = '%Y-%m-%dT%H:%M:%S%z'
-    regexp = r"(\+\d{1,2})(:)(\d{1,2})"
+        events = []
+        results = []
 
-    data = datetime \
-        .strptime(re.sub(regexp, r"\1\3", date_string), format_string) \
-        .replace(tzinfo=None)
+        for raw_item in decoded_body:
+            event = WebhookEvent(WebhookEvent.extract(raw_item), self._scheduler,
+                                 deferred=True)
+            try:
+                event.classify()
+                event.validate()
+            except (IncompleteRequest, UndefinedType, UnknownType) as exc:
+                results.append(self._error(exc))
+                continue
+
+            # The delivery is identified by the whole event like the ones
+            # delivered one by one.
+            key = None
+            if self._idempotency:
+                key = await self._claim(delivery_key(raw_item))
+                if key is None:
+                    results.append({'status': 'duplicate'})
+                    continue
+
+            events.append((len(results), event, key))
+            results.append(None)
+
+        # All the candidates of the batch are locked at once, before the
+        # transaction is started, to avoid deadlocks with the concurrent
+        # webhooks waiting for the rows locked by the transaction.
+        candidate_ids = [event.candidate_id for _, event, _ in events
+                         if event.candidate_id is not None]
+        lock = self._locks.many(candidate_ids) if self._locks else NullLock()
 
-    return data
+        try:
+            await self._process(lock, events, results)
+        except Exception:
+            # Nothing has been committed, so the deliveries are to be handled
+            # when Huntflow retries them.
+            for _, _, key in events:
+                if key is not None:
+                    await self._idempotency.release(key)
+            raise
+
+        self.write({
+            'results': results,
+            'total': len(results),
+            'success': all(result['status'] != 'error' for result in results),
+        })
+
+    async def _process(self, lock, events, results):
+        async with lock:
+            processed = []
+            async with models.DB.transaction():
+                for i, event, key in events:
+                    try:
+                        async with models.DB.transaction():
+                            await event.process()
+                    except Exception as exc:  # pylint: disable=broad-except
+                        results[i] = self._error(exc)
+                        if key is not None:
+                            await self._idempotency.release(key)
+                    else:
+                        results[i] = {'status': 'ok'}
+                        processed.append((i, event))
+
+            # The scheduler keeps the jobs in its own storage, so they are
+            # changed only when the changes of the events are committed.
+            for i, event in processed:
+                try:
+                    await event.apply()
+                except Exception as exc:  # pylint: disable=broad-except
+                    results[i] = self._error(exc)
+
+    def _error(self, exc):
+        if type(exc) not in self.ERRORS:
+            self._logger.error('Could not process the event', exc_info=exc)
+
+        return {'status': 'error', 'detail': self.ERRORS.get(type(exc), 'Internal error')}
 
 
 class TokenObtainPairHandler(RequestHandler):  # pylint: disable=abstract-method,
@@ -329,8 +329,8 @@ class TokenObtainPairHandler(RequestHandler):  # pylint: disable=abstract-method
         self.user = None
         self.valid = False
 
-    def initialize(self, postgres_url):  # pylint: disable=arguments-differ
-        self._postgres_url = postgres_url
+    def initialize(self, pool):  # pylint: disable=arguments-differ
+        self._pool = pool
 
     async def post(self):  # pylint: disable=arguments-differ
         body = self.request.body.decode('utf8')
@@ -355,7 +355,7 @@ class TokenObtainPairHandler(RequestHandler):  # pylint: disable=abstract-method
         await self.validate(email, password)
 
         if self.valid:
-            refresh = RefreshToken.for_user(self.user.id)
+            refresh = RefreshToken.for_user(self.user['id'])
 
             data = {
                 'access': str(refresh.access_token()), 'refresh': str(refresh)}
@@ -371,12 +371,11 @@ class TokenObtainPairHandler(RequestHandler):  # pylint: disable=abstract-method
     async def validate(self, email, password):
         """Checks if user with the given credentials exists. """
 
-        await models.gino_run(self._postgres_url)
+        await self._pool.open()
 
-        user = await models.User.query.where(
-            models.User.email == email).gino.first()
+        user = await queries.user_by_email(email)
 
-        if user and user.password == password:
+        if user and user['password'] == password:
             self.user = user
             self.valid = True
 
@@ -404,6 +403,25 @@ class TokenRefreshHandler(RequestHandler):  # pylint: disable=abstract-method
 class ManageHandler(HuntflowBaseHandler):  # pylint: disable=abstract-method,
     """Class implementing common methods for handling /manage endpoint. """
 
+    # The column the lists of the candidates are sorted by (along with the
+    # id) and the format it's kept in the pagination cursor.
+    SORT_KEY = None
+    SORT_KEY_FORMAT = None
+
+    def initialize(self, pool, scheduler=None, replicas=None):  # pylint: disable=arguments-differ
+        super(ManageHandler, self).initialize(pool, scheduler)
+        self._replicas = replicas
+
+    async def get_reader(self):
+        """Returns what the read-only queries are run with: the engine of
+        one of the replicas if they are configured or DB otherwise.
+        """
+
+        if self._replicas:
+            return await self._replicas.choose()
+
+        return models.DB
+
     def get_current_user(self):
         try:
             access_token = self.get_argument('access')
@@ -426,6 +444,103 @@ class ManageHandler(HuntflowBaseHandler):  # pylint: disable=abstract-method,
             self.set_status(403)
             return None
 
+    def get_page(self):
+        """Returns the (sort key, id) pair the page starts after and the
+        maximum number of the candidates on the page. Writes the error and
+        returns None if the parameters are invalid.
+        """
+
+        after, limit = None, None
+
+        try:
+            cursor = self.get_argument('cursor', None)
+            if cursor is not None:
+                value, _id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+                after = (self.parse_sort_key(value), int(_id))
+
+            limit = self.get_argument('limit', None)
+            if limit is not None:
+                limit = int(limit)
+                if limit <= 0:
+                    raise ValueError
+        except (binascii.Error, TypeError, ValueError):
+            data = {
+                'detail': 'Invalid pagination parameters',
+                'code': 'invalid_page'}
+            self.set_status(400)
+            self.write(data)
+            return None
+
+        return after, limit
+
+    def parse_sort_key(self, value):
+        """Converts the sort key kept in the cursor back to the value. """
+
+        return datetime.strptime(value, self.SORT_KEY_FORMAT)
+
+    def make_cursor(self, row):
+        """Returns the cursor pointing to the candidates after the row. """
+
+        pair = [row[self.SORT_KEY].strftime(self.SORT_KEY_FORMAT), row['id']]
+        return base64.urlsafe_b64encode(json.dumps(pair).encode('ascii')).decode('ascii')
+
+    @property
+    def streaming(self):
+        """Whether the candidates are to be written as NDJSON rows. """
+
+        return self.get_argument('stream', None) in ('1', 'true')
+
+    async def write_candidates(self, query, limit, fetch):
+        """Writes the candidates either as one JSON object fetched by the
+        prepared statement or, if the stream argument is passed, as NDJSON
+        rows flushed while they are read from the cursor of the query.
+        """
+
+        if self.streaming:
+            await self._stream_candidates(query)
+            return
+
+        self.write_page(await fetch(bind=await self.get_reader()), limit)
+
+    def write_page(self, rows, limit):
+        """Writes the candidates as one JSON object along with the cursor of
+        the next page.
+        """
+
+        message = {
+            'users': [{'first_name': row['first_name'],
+                       'last_name': row['last_name']} for row in rows],
+            'total': len(rows),
+            'success': True
+        }
+
+        if limit is not None:
+            full = rows and len(rows) == limit
+            message['next'] = self.make_cursor(rows[-1]) if full else None
+
+        self.write(message)
+
+    def write_row(self, row):
+        """Writes the candidate as an NDJSON row. """
+
+        self.set_header('Content-Type', 'application/x-ndjson')
+        self.write(json.dumps({'first_name': row['first_name'],
+                               'last_name': row['last_name'],
+                               'cursor': self.make_cursor(row)}))
+        self.write('\n')
+
+    async def _stream_candidates(self, query):
+        count = 0
+        reader = await self.get_reader()
+        # asyncpg cursors work only inside a transaction.
+        async with reader.transaction():
+            async for row in reader.iterate(query):
+                self.write_row(row)
+
+                count += 1
+                if count % STREAM_CHUNK_SIZE == 0:
+                    await self.flush()
+
 
 class DeleteInterviewHandler(ManageHandler):  # pylint: disable=abstract-method
     """
@@ -463,13 +578,10 @@ class DeleteInterviewHandler(ManageHandler):  # pylint: disable=abstract-method
 
         await self._connect_to_database()
 
-        candidate = await models.Candidate.query.where(
-            models.Candidate.first_name == first_name).where(
-                models.Candidate.last_name == last_name).gino.first()
+        candidate = await CANDIDATES.get_by_name(first_name, last_name)
 
         if candidate:
-            interview = await models.Interview.query.where(
-                models.Interview.candidate == candidate.id).gino.first()
+            interview = await queries.interview_by_candidate(candidate['id'])
         else:
             data = {
                 'detail': 'Candidate with the given credentials was not found',
@@ -478,15 +590,16 @@ class DeleteInterviewHandler(ManageHandler):  # pylint: disable=abstract-method
             self.write(data)
             return
 
-        if interview and interview.start > datetime.now():
-            if interview.jobs:
-                jobs_to_be_deleted = json_decode(interview.jobs)
-
-                for job_id in jobs_to_be_deleted:
-                    self._scheduler.remove_job(job_id)
+        if interview and interview['start'] > datetime.now():
+            if interview['jobs']:
+                await self._scheduler.remove_jobs(json_decode(interview['jobs']))
+                await self._scheduler.flush()
 
             await models.Interview.delete.where(
-                models.Interview.candidate == candidate.id).gino.status()
+                models.Interview.candidate == candidate['id']).gino.status()
+
+            if UPCOMING.loaded:
+                UPCOMING.remove(candidate['id'])
         else:
             message = {
                 'detail': 'Candidate does not have non-expired interviews',
@@ -503,35 +616,36 @@ class ListCandidatesHandler(ManageHandler):  # pylint: disable=abstract-method
     which have non-expired interview.
     """
 
-    def initialize(self, postgres_url):  # pylint: disable=arguments-differ
-        self._postgres_url = postgres_url
-
+    SORT_KEY = 'start'
+    SORT_KEY_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
 
     async def get(self):  # pylint: disable=arguments-differ
         if not self.current_user:
             return
 
-        await self._connect_to_database()
-
-        all_candidates = await models.Candidate.query.gino.all()
+        page = self.get_page()
+        if page is None:
+            return
 
-        all_candidates_names = []
+        after, limit = page
 
-        for candidate in all_candidates:
-            interview = await models.Interview.query.where(
-                models.Interview.candidate == candidate.id).gino.first()
-            if interview and interview.start > datetime.now():
-                all_candidates_names.append(
-                    {'first_name': candidate.first_name,
-                     'last_name': candidate.last_name})
+        # The index is kept up to date, so there is no need to query the
+        # database.
+        if UPCOMING.loaded:
+            rows = UPCOMING.list(datetime.now(), after=after, limit=limit)
+            if self.streaming:
+                for row in rows:
+                    self.write_row(row)
+            else:
+                self.write_page(rows, limit)
+            return
 
-        message = {
-            'users': all_candidates_names,
-            'total': len(all_candidates_names),
-            'success': True
-        }
+        await self._connect_to_database()
 
-        self.write(message)
+        now = datetime.now()
+        query = models.upcoming_candidates_query(now, after=after, limit=limit)
+        fetch = functools.partial(queries.upcoming_candidates, now, after=after, limit=limit)
+        await self.write_candidates(query, limit, fetch)
 
 
 class ListCandidatesWithFwdHandler(ManageHandler):  # pylint: disable=abstract-method
@@ -540,33 +654,27 @@ class ListCandidatesWithFwdHandler(ManageHandler):  # pylint: disable=abstract-m
     which have first working day attribute.
     """
 
-    def initialize(self, postgres_url):  # pylint: disable=arguments-differ
-        self._postgres_url = postgres_url
+    SORT_KEY = 'first_working_day'
+    SORT_KEY_FORMAT = '%Y-%m-%d'
 
     async def get(self):  # pylint: disable=arguments-differ
         if not self.current_user:
             return
 
-        await self._connect_to_database()
-
-        all_candidates = await models.Candidate.query.gino.all()
+        page = self.get_page()
+        if page is None:
+            return
 
-        candidates_with_fwd = []
+        after, limit = page
 
-        for candidate in all_candidates:
-            if candidate.first_working_day:
-                candidates_with_fwd.append(
-                    {'first_name': candidate.first_name,
-                     'last_name': candidate.last_name}
-                )
+        await self._connect_to_database()
 
-        message = {
-            'users': candidates_with_fwd,
-            'total': len(candidates_with_fwd),
-            'success': True
-        }
+        query = models.candidates_with_fwd_query(after=after, limit=limit)
+        fetch = functools.partial(queries.candidates_with_fwd, after=after, limit=limit)
+        await self.write_candidates(query, limit, fetch)
 
-        self.write(message)
+    def parse_sort_key(self, value):
+        return super(ListCandidatesWithFwdHandler, self).parse_sort_key(value).date()
 
 
 class ShowFwdHandler(ManageHandler):  # pylint: disable=abstract-method
@@ -575,9 +683,6 @@ class ShowFwdHandler(ManageHandler):  # pylint: disable=abstract-method
     first working day for the specified candidate.
     """
 
-    def initialize(self, postgres_url):  # pylint: disable=arguments-differ
-        self._postgres_url = postgres_url
-
     async def get(self):  # pylint: disable=arguments-differ
         if not self.current_user:
             return
@@ -596,16 +701,15 @@ class ShowFwdHandler(ManageHandler):  # pylint: disable=abstract-method
 
         await self._connect_to_database()
 
-        candidate = await models.Candidate.query.where(
-            models.Candidate.first_name == first_name).where(
-                models.Candidate.last_name == last_name).gino.first()
+        candidate = await CANDIDATES.get_by_name(first_name, last_name,
+                                                 bind=await self.get_reader())
 
         if candidate:
-            if candidate.first_working_day:
+            if candidate['first_working_day']:
                 message = {
-                    'candidate': {'first_name': candidate.first_name,
-                                  'last_name': candidate.last_name,
-                                  'fwd': candidate.first_working_day.isoformat()}
+                    'candidate': {'first_name': candidate['first_name'],
+                                  'last_name': candidate['last_name'],
+                                  'fwd': candidate['first_working_day'].isoformat()}
                 }
                 self.write(message)
             else:
@@ -620,3 +724,10 @@ class ShowFwdHandler(ManageHandler):  # pylint: disable=abstract-method
                 'code': 'no_candidate'}
             self.set_status(400)
             self.write(data)
+
+
+class MetricsHandler(RequestHandler):  # pylint: disable=abstract-method,too-few-public-methods
+    """Class implementing handler exposing the runtime metrics of the server. """
+
+    def get(self):  # pylint: disable=arguments-differ
+        self.write(METRICS.snapshot())
@@ -0,0 +1,106 @@
+""" Deduplication of the repeated Huntflow webhook deliveries """
+
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from sqlalchemy.dialects.postgresql import insert
+
+from .metrics import METRICS
+from .models import DB, WebhookDelivery
+
+
+def delivery_key(decoded_body):
+    """Returns the key identifying the webhook delivery: the event id if
+    Huntflow provides it or the hash of the normalized body otherwise.
+    """
+
+    event = decoded_body.get('event')
+    if isinstance(event, dict) and event.get('id') is not None:
+        return 'id:{}'.format(event['id'])
+
+    normalized = json.dumps(decoded_body, sort_keys=True, separators=(',', ':'))
+    return 'sha256:{}'.format(hashlib.sha256(normalized.encode('utf8')).hexdigest())
+
+
+class IdempotencyCache:
+    """Class implementing an LRU cache of the handled webhook deliveries,
+    which expire in ttl seconds. In persistent mode the deliveries are also
+    saved to the webhook_deliveries table, so several server processes share
+    the knowledge about them.
+    """
+
+    def __init__(self, maxsize=10000, ttl=24 * 60 * 60, persistent=False):
+        self._entries = OrderedDict()
+        self._maxsize = maxsize
+        self._persistent = persistent
+        self._ttl = ttl
+
+        METRICS.gauge('idempotency.size', lambda: len(self._entries))
+
+    async def claim(self, key):
+        """Returns True if the delivery is seen for the first time (or its
+        previous copy has expired) and False if it's a duplicate.
+        """
+
+        if self._lookup(key):
+            METRICS.incr('idempotency.duplicates')
+            return False
+
+        if self._persistent:
+            now = datetime.now()
+            table = WebhookDelivery.__table__
+            stmt = insert(table) \
+                .values(key=key, created=now) \
+                .on_conflict_do_update(
+                    index_elements=[table.c.key],
+                    set_={'created': now},
+                    where=table.c.created < now - timedelta(seconds=self._ttl)) \
+                .returning(table.c.key)
+
+            # Nothing is written and returned if there is a fresh copy.
+            if await DB.scalar(stmt) is None:
+                self._remember(key)
+                METRICS.incr('idempotency.duplicates')
+                return False
+
+        self._remember(key)
+        return True
+
+    async def release(self, key):
+        """Forgets the delivery, so that its next copy is handled. It's used
+        when the handling of the delivery failed.
+        """
+
+        self._entries.pop(key, None)
+
+        if self._persistent:
+            await WebhookDelivery.delete.where(WebhookDelivery.key == key).gino.status()
+
+    async def purge(self):
+        """Removes the expired deliveries from the database. """
+
+        if self._persistent:
+            expired = datetime.now() - timedelta(seconds=self._ttl)
+            await WebhookDelivery.delete.where(WebhookDelivery.created < expired).gino.status()
+
+    def _lookup(self, key):
+        expires = self._entries.get(key)
+        if expires is None:
+            return False
+
+        if expires < time.monotonic():
+            del self._entries[key]
+            return False
+
+        self._entries.move_to_end(key)
+        return True
+
+    def _remember(self, key):
+        self._entries[key] = time.monotonic() + self._ttl
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self._maxsize:
+            self._entries.popitem(last=False)
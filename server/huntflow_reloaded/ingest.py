@@ -0,0 +1,95 @@
+""" Asynchronous ingestion of Huntflow webhooks """
+
+import asyncio
+import logging
+
+from .events import IncompleteRequest
+from .metrics import METRICS
+
+
+class IngestQueue:
+    """Class implementing a bounded queue of webhook events served by a pool
+    of workers. The webhook handler only puts the events to the queue, so
+    slow PostgreSQL or Redis don't make Huntflow wait for the response.
+    """
+
+    def __init__(self, workers, maxsize, retry_after=5, journal=None,  # pylint: disable=too-many-arguments
+                 idempotency=None):
+        self.retry_after = retry_after
+        self._idempotency = idempotency
+        self._journal = journal
+        self._logger = logging.getLogger('tornado.application')
+        self._queue = asyncio.Queue(maxsize=maxsize)
+        self._workers_number = workers
+        self._workers = []
+
+        METRICS.gauge('ingest.queue_depth', self._queue.qsize)
+        METRICS.gauge('ingest.queue_size', lambda: maxsize)
+
+    def start(self):
+        """Runs the workers. """
+
+        for _ in range(self._workers_number):
+            self._workers.append(asyncio.ensure_future(self._work()))
+
+    async def join(self):
+        """Waits until all the queued events are processed. """
+
+        await self._queue.join()
+
+    async def stop(self):
+        """Processes the queued events and stops the workers. """
+
+        await self.join()
+
+        for worker in self._workers:
+            worker.cancel()
+
+        self._workers = []
+
+    def put(self, event, entry_id=None, key=None):
+        """Queues the event to be processed. Raises asyncio.QueueFull if the
+        queue is full. The journal entry, if any, is marked as done as soon
+        as the event is processed. The delivery key, if any, is released if
+        the event could not be processed, so that the delivery is handled
+        when Huntflow retries it.
+        """
+
+        try:
+            self._queue.put_nowait((event, entry_id, key))
+        except asyncio.QueueFull:
+            METRICS.incr('ingest.rejected')
+            raise
+
+        METRICS.incr('ingest.accepted')
+
+    async def _work(self):
+        while True:
+            event, entry_id, key = await self._queue.get()
+
+            try:
+                await event.process()
+            except Exception as exc:  # pylint: disable=broad-except
+                METRICS.incr('ingest.failed')
+                if isinstance(exc, IncompleteRequest):
+                    self._logger.debug('Incomplete request')
+                else:
+                    self._logger.exception('Could not process the event')
+
+                await self._release(key)
+            else:
+                METRICS.incr('ingest.processed')
+            finally:
+                if entry_id is not None:
+                    self._journal.mark_done(entry_id)
+
+                self._queue.task_done()
+
+    async def _release(self, key):
+        if key is None:
+            return
+
+        try:
+            await self._idempotency.release(key)
+        except Exception:  # pylint: disable=broad-except
+            self._logger.exception('Could not release the delivery %s', key)
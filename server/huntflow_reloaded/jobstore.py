@@ -0,0 +1,222 @@
+""" APScheduler jobstores removing several jobs at once """
+
+import logging
+import pickle
+
+from apscheduler.job import Job
+from apscheduler.jobstores.memory import MemoryJobStore
+from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore as BaseSQLAlchemyJobStore
+from apscheduler.triggers.date import DateTrigger
+from apscheduler.util import datetime_to_utc_timestamp
+
+from .metrics import METRICS
+from .models import DB
+from .writebehind import WriteBehind
+
+# The reminders are stored as the (kind, ref_id) arguments of the function
+# below and the time they fire at (see the scheduled_jobs table).
+REMINDER = 'huntflow_reloaded.scheduler:Scheduler._remind'
+
+SELECT_REMINDERS = 'SELECT id, kind, ref_id, run_time FROM scheduled_jobs ORDER BY run_time'
+
+INSERT_REMINDERS = 'INSERT INTO scheduled_jobs (id, kind, ref_id, run_time) VALUES ($1, $2, $3, $4)'
+
+DELETE_REMINDERS = 'DELETE FROM scheduled_jobs WHERE id = ANY($1::varchar[])'
+
+DELETE_ALL_REMINDERS = 'DELETE FROM scheduled_jobs'
+
+# The other jobs (e.g. the ones scheduled by the previous versions) are
+# pickled into the same table the SQLAlchemy jobstore of APScheduler uses, so
+# that the jobstores can be switched without losing them. The reminders are
+# moved to that table by Scheduler.load() when the SQLAlchemy jobstore is
+# used again.
+CREATE_TABLE = """
+    CREATE TABLE IF NOT EXISTS {table} (
+        id VARCHAR(191) NOT NULL PRIMARY KEY,
+        next_run_time FLOAT(25),
+        job_state BYTEA NOT NULL
+    )
+"""
+
+CREATE_INDEX = 'CREATE INDEX IF NOT EXISTS ix_{table}_next_run_time ON {table} (next_run_time)'
+
+SELECT_JOBS = 'SELECT id, job_state FROM {table} ORDER BY next_run_time'
+
+INSERT_JOBS = 'INSERT INTO {table} (id, next_run_time, job_state) VALUES ($1, $2, $3)'
+
+DELETE_JOBS = 'DELETE FROM {table} WHERE id = ANY($1::varchar[])'
+
+DELETE_ALL_JOBS = 'DELETE FROM {table}'
+
+
+class SQLAlchemyJobStore(BaseSQLAlchemyJobStore):  # pylint: disable=too-few-public-methods
+    """Class extending the SQLAlchemy jobstore of APScheduler with removing
+    several jobs by one statement. Like the rest of the jobstore, it blocks,
+    so it must be run in an executor when the IOLoop is running.
+    """
+
+    def remove_jobs(self, job_ids):
+        """Removes the jobs with the specified ids at once and returns the
+        ids of the jobs which have been removed.
+        """
+
+        delete = self.jobs_t.delete() \
+            .where(self.jobs_t.c.id.in_(job_ids)) \
+            .returning(self.jobs_t.c.id)
+        return [row[0] for row in self.engine.execute(delete)]
+
+
+class AsyncpgJobStore(MemoryJobStore):
+    """Class implementing the jobstore which keeps the jobs in memory, so
+    the scheduler never waits for the database, and writes the changes
+    behind (see WriteBehind) using the pool of the handlers. The changes
+    made one after another are written in one transaction. The jobs are
+    loaded from the database by load() once the scheduler is started.
+
+    The reminders are saved as rows of typed columns instead of pickles, so
+    they are cheap to save and load, and don't keep the messages and the
+    Redis credentials.
+
+    The jobstore must be used only from the thread running the IOLoop.
+    """
+
+    def __init__(self, tablename='apscheduler_jobs', pickle_protocol=pickle.HIGHEST_PROTOCOL):
+        super(AsyncpgJobStore, self).__init__()
+        self._logger = logging.getLogger('tornado.application')
+        self._pickle_protocol = pickle_protocol
+        self._table = tablename
+
+        # The job id mapped to the (is reminder, row) pair describing the
+        # job or to None if the job is removed.
+        self._writes = WriteBehind(self._persist, 'jobstore')
+
+        METRICS.gauge('jobstore.pending', lambda: len(self._writes))
+
+    async def load(self):
+        """Loads the jobs from the database. """
+
+        await self.load_reminders()
+        await self.load_pickled_jobs()
+
+    async def load_reminders(self):
+        """Loads the reminders from the database. """
+
+        for row in await DB.all(SELECT_REMINDERS):
+            job = Job(self._scheduler, id=row['id'], func=REMINDER,
+                      trigger=DateTrigger(row['run_time']), executor='default',
+                      args=(row['kind'], row['ref_id']), kwargs={}, name=None,
+                      next_run_time=row['run_time'],
+                      **self._scheduler._job_defaults)  # pylint: disable=protected-access
+            job._jobstore_alias = self._alias  # pylint: disable=protected-access
+            self._restore(job)
+
+    async def load_pickled_jobs(self):
+        """Creates the table of the pickled jobs unless it exists and loads
+        the jobs from it.
+        """
+
+        await DB.status(CREATE_TABLE.format(table=self._table))
+        await DB.status(CREATE_INDEX.format(table=self._table))
+
+        failed = []
+        for row in await DB.all(SELECT_JOBS.format(table=self._table)):
+            try:
+                job = self._reconstitute_job(row['job_state'])
+            except Exception:  # pylint: disable=broad-except
+                self._logger.exception('Unable to restore job %s -- removing it', row['id'])
+                failed.append(row['id'])
+                continue
+
+            self._restore(job)
+
+        for job_id in failed:
+            self._writes.change(job_id, None)
+
+    async def flush(self):
+        """Waits for the changes made so far to be written. Raises the error
+        if they could not be written.
+        """
+
+        await self._writes.flush()
+
+    def add_job(self, job):
+        super(AsyncpgJobStore, self).add_job(job)
+        self._save(job)
+
+    def update_job(self, job):
+        super(AsyncpgJobStore, self).update_job(job)
+        self._save(job)
+
+    def remove_job(self, job_id):
+        super(AsyncpgJobStore, self).remove_job(job_id)
+        self._writes.change(job_id, None)
+
+    def remove_jobs(self, job_ids):
+        """Removes the jobs with the specified ids at once and returns the
+        ids of the jobs which have been removed. The jobs are deleted from
+        the database by one statement.
+        """
+
+        removed = {job_id for job_id in job_ids
+                   if self._jobs_index.pop(job_id, None) is not None}
+        if removed:
+            self._jobs = [(job, timestamp) for job, timestamp in self._jobs
+                          if job.id not in removed]
+            for job_id in removed:
+                self._writes.change(job_id, None)
+
+        return list(removed)
+
+    def remove_all_jobs(self):
+        super(AsyncpgJobStore, self).remove_all_jobs()
+        self._writes.clear()
+
+    def shutdown(self):
+        # The jobs are forgotten without removing them from the database.
+        super(AsyncpgJobStore, self).remove_all_jobs()
+
+    def _restore(self, job):
+        if self.lookup_job(job.id) is None:
+            super(AsyncpgJobStore, self).add_job(job)
+
+    def _reconstitute_job(self, job_state):
+        job_state = pickle.loads(job_state)
+        job_state['jobstore'] = self
+        job = Job.__new__(Job)
+        job.__setstate__(job_state)
+        job._scheduler = self._scheduler  # pylint: disable=protected-access
+        job._jobstore_alias = self._alias  # pylint: disable=protected-access
+        return job
+
+    def _save(self, job):
+        if job.func_ref == REMINDER and job.next_run_time is not None:
+            kind, ref_id = job.args
+            self._writes.change(job.id, (True, (kind, ref_id, job.next_run_time)))
+        else:
+            self._writes.change(job.id, (False, (datetime_to_utc_timestamp(job.next_run_time),
+                                                 pickle.dumps(job.__getstate__(),
+                                                              self._pickle_protocol))))
+
+    async def _persist(self, changes, clear):
+        # The changed jobs are removed from both tables and the ones which
+        # are not removed are inserted again, since the job may have been
+        # saved in the other format before.
+        removed = list(changes)
+        reminders = [(job_id, ) + change[1] for job_id, change in changes.items()
+                     if change is not None and change[0]]
+        pickled = [(job_id, ) + change[1] for job_id, change in changes.items()
+                   if change is not None and not change[0]]
+
+        async with DB.acquire(reuse=False) as conn:
+            raw_connection = await conn.get_raw_connection()
+            async with raw_connection.transaction():
+                if clear:
+                    await raw_connection.execute(DELETE_ALL_REMINDERS)
+                    await raw_connection.execute(DELETE_ALL_JOBS.format(table=self._table))
+                if removed:
+                    await raw_connection.execute(DELETE_REMINDERS, removed)
+                    await raw_connection.execute(DELETE_JOBS.format(table=self._table), removed)
+                if reminders:
+                    await raw_connection.executemany(INSERT_REMINDERS, reminders)
+                if pickled:
+                    await raw_connection.executemany(INSERT_JOBS.format(table=self._table), pickled)
@@ -0,0 +1,289 @@
+""" Append-only journal of the accepted webhooks """
+
+import asyncio
+import logging
+import mmap
+import os
+import struct
+import zlib
+
+from tornado.escape import json_decode
+
+from .events import WebhookEvent
+from .metrics import METRICS
+
+ENTRY = b'E'
+DONE = b'D'
+
+# kind, entry id, payload length, CRC32 of the payload
+HEADER = struct.Struct('<cQII')
+
+SEGMENT_PREFIX = 'journal-'
+SEGMENT_SUFFIX = '.log'
+
+
+class Journal:  # pylint: disable=too-many-instance-attributes
+    """Class implementing a journal the raw webhook bodies are written to
+    before they are processed. When the server is restarted, the entries
+    which were not marked as done are replayed.
+
+    The journal consists of the segment files. The fsync calls are batched:
+    the writers wait for the next flush which happens either every
+    fsync_interval seconds or as soon as max_batch writers are waiting.
+
+    An entry is marked as done in its own segment, so the mark is never
+    removed before the entry. The segments are kept open until all their
+    entries are done.
+    """
+
+    def __init__(self, path, fsync_interval=0.002, max_batch=64,
+                 segment_size=64 * 1024 * 1024, use_mmap=False):
+        self._path = path
+        self._fsync_interval = fsync_interval
+        self._max_batch = max_batch
+        self._segment_size = segment_size
+        self._use_mmap = use_mmap
+
+        self._logger = logging.getLogger('tornado.application')
+        self._fd = None
+        self._fds = {}
+        self._flusher = None
+        self._locations = {}
+        self._next_id = 1
+        self._pending = []
+        self._segments = {}
+        self._segment = None
+        self._waiters = []
+        self._wakeup = None
+
+    def open(self):
+        """Reads the existing segments and opens a new one for writing.
+        Returns the list of (entry id, body) pairs which have not been
+        processed yet.
+        """
+
+        os.makedirs(self._path, exist_ok=True)
+
+        entries = {}
+        for segment in self._list_segments():
+            done = set()
+            self._segments[segment] = set()
+
+            for kind, entry_id, payload in self._read_segment(segment):
+                self._next_id = max(self._next_id, entry_id + 1)
+                if kind == ENTRY:
+                    entries[entry_id] = (segment, payload)
+                else:
+                    done.add(entry_id)
+
+            for entry_id in done:
+                entries.pop(entry_id, None)
+
+        for entry_id, (segment, _) in entries.items():
+            self._segments[segment].add(entry_id)
+            self._locations[entry_id] = segment
+
+        for segment, pending in list(self._segments.items()):
+            if not pending:
+                self._remove_segment(segment)
+
+        self._open_segment()
+
+        self._wakeup = asyncio.Event()
+        self._flusher = asyncio.ensure_future(self._flush_forever())
+
+        self._pending = [(entry_id, entries[entry_id][1]) for entry_id in sorted(entries)]
+        return self._pending
+
+    async def close(self):
+        """Flushes the journal and closes the current segment. """
+
+        if self._flusher:
+            self._flusher.cancel()
+            self._flusher = None
+
+        await self._flush()
+        for fd in self._fds.values():
+            os.close(fd)
+
+        self._fds = {}
+        self._fd = None
+
+    async def append(self, body):
+        """Writes the body to the journal and waits until it's flushed to
+        the disk. Returns the id of the entry.
+        """
+
+        entry_id = self._next_id
+        self._next_id += 1
+
+        self._write(ENTRY, entry_id, body)
+        self._segments[self._segment].add(entry_id)
+        self._locations[entry_id] = self._segment
+
+        waiter = asyncio.get_event_loop().create_future()
+        self._waiters.append((self._segment, waiter))
+        self._wakeup.set()
+
+        await waiter
+
+        METRICS.incr('journal.appended')
+        return entry_id
+
+    def mark_done(self, entry_id):
+        """Marks the entry as processed. The mark is not flushed immediately:
+        losing it only leads to replaying the entry once again.
+        """
+
+        segment = self._locations.pop(entry_id, None)
+        if segment is None:
+            return
+
+        pending = self._segments[segment]
+        pending.discard(entry_id)
+        if not pending and segment != self._segment:
+            # Removing the segment marks all its entries as done.
+            self._remove_segment(segment)
+            return
+
+        self._write(DONE, entry_id, b'', segment)
+
+    async def replay(self, scheduler):
+        """Processes the entries which were left unprocessed by the previous
+        run of the server.
+        """
+
+        for entry_id, body in self._pending:
+            try:
+                event = WebhookEvent(json_decode(body), scheduler)
+                event.classify()
+                await event.process()
+            except Exception:  # pylint: disable=broad-except
+                self._logger.exception('Could not replay the journal entry %s', entry_id)
+
+            METRICS.incr('journal.replayed')
+            self.mark_done(entry_id)
+
+        self._pending = []
+
+    #
+    # Writing
+    #
+
+    def _write(self, kind, entry_id, payload, segment=None):
+        fd = self._fd if segment is None else self._segment_fd(segment)
+        header = HEADER.pack(kind, entry_id, len(payload), zlib.crc32(payload))
+        os.write(fd, header + payload)
+
+    async def _flush_forever(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+
+            if len(self._waiters) < self._max_batch:
+                await asyncio.sleep(self._fsync_interval)
+
+            try:
+                await self._flush()
+            except Exception:  # pylint: disable=broad-except
+                METRICS.incr('journal.errors')
+                self._logger.exception('Could not flush the journal')
+
+    async def _flush(self):
+        waiters, self._waiters = self._waiters, []
+
+        # The entries appended while the previous fsync was running may have
+        # been written to the segment rotated since then, so the segments
+        # the writers wrote to are flushed. They are not removed until the
+        # writers are done with them, so their descriptors stay open.
+        segments = sorted({segment for segment, _ in waiters}) or [self._segment]
+
+        try:
+            for segment in segments:
+                await asyncio.get_event_loop().run_in_executor(
+                    None, os.fsync, self._fds[segment])
+        except Exception as exc:
+            # The writers are not left waiting for the flush which failed.
+            for _, waiter in waiters:
+                if not waiter.done():
+                    waiter.set_exception(exc)
+            raise
+
+        for _, waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+        if waiters:
+            METRICS.observe('journal.batch', len(waiters))
+
+        # The segment is rotated here rather than in append, so the fsync
+        # running in the executor never deals with a closed descriptor.
+        if os.fstat(self._fd).st_size >= self._segment_size:
+            old_segment = self._segment
+            self._open_segment()
+            if not self._segments[old_segment]:
+                self._remove_segment(old_segment)
+
+    #
+    # Segments
+    #
+
+    def _list_segments(self):
+        names = [name for name in os.listdir(self._path)
+                 if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX)]
+        return [os.path.join(self._path, name) for name in sorted(names)]
+
+    def _open_segment(self):
+        name = '{}{:020d}{}'.format(SEGMENT_PREFIX, self._next_id, SEGMENT_SUFFIX)
+        segment = os.path.join(self._path, name)
+        self._fd = self._segment_fd(segment)
+        self._segment = segment
+        self._segments[segment] = set()
+
+    def _segment_fd(self, segment):
+        # The segments left by the previous run are opened when their
+        # entries are marked as done.
+        fd = self._fds.get(segment)
+        if fd is None:
+            fd = os.open(segment, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+            self._fds[segment] = fd
+
+        return fd
+
+    def _remove_segment(self, segment):
+        del self._segments[segment]
+
+        fd = self._fds.pop(segment, None)
+        if fd is not None:
+            os.close(fd)
+
+        os.unlink(segment)
+
+    def _read_segment(self, segment):
+        with open(segment, 'rb') as infile:
+            if self._use_mmap and os.fstat(infile.fileno()).st_size:
+                with mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                    return list(parse_records(buf))
+
+            return list(parse_records(infile.read()))
+
+
+def parse_records(buf):
+    """Yields the (kind, entry id, payload) records stored in the buffer.
+    Stops at the first truncated or corrupted record, which is the result of
+    a crash in the middle of writing.
+    """
+
+    offset = 0
+    size = len(buf)
+
+    while offset + HEADER.size <= size:
+        kind, entry_id, length, checksum = HEADER.unpack_from(buf, offset)
+        start = offset + HEADER.size
+        payload = bytes(buf[start:start + length])
+
+        if len(payload) != length or zlib.crc32(payload) != checksum:
+            break
+
+        yield kind, entry_id, payload
+        offset = start + length
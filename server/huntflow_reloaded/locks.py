@@ -0,0 +1,110 @@
+""" Locks serializing the handling of the events of the same candidate """
+
+import asyncio
+import sys
+import time
+
+from . import models
+from .metrics import METRICS
+
+# The first key of the advisory locks, which distinguishes them from the
+# advisory locks other applications may take in the same database.
+ADVISORY_NAMESPACE = 0x4866
+
+
+class CandidateLocks:
+    """Class implementing striped locks: the events of the same candidate
+    are handled one by one, while the events of different candidates are
+    handled concurrently (unless their ids fall into the same stripe).
+
+    In advisory mode the PostgreSQL advisory lock of the candidate is also
+    taken, so the events are serialized across several server processes.
+    The advisory lock is held by the connection which everything done under
+    the lock reuses, so the transactions started under the lock are
+    committed before it's released.
+    """
+
+    def __init__(self, stripes=64, advisory=False):
+        self._advisory = advisory
+        self._stripes = [asyncio.Lock() for _ in range(stripes)]
+
+    def __call__(self, candidate_id):
+        return self.many([candidate_id])
+
+    def many(self, candidate_ids):
+        """Returns the lock of several candidates at once. The locks are
+        always taken in the same order, so two batches of events can't
+        deadlock each other.
+        """
+
+        indexes = sorted({hash(i) % len(self._stripes) for i in candidate_ids})
+        stripes = [self._stripes[i] for i in indexes]
+        return _CandidateLock(stripes, sorted(set(candidate_ids)), self._advisory)
+
+
+class _CandidateLock:
+    def __init__(self, stripes, candidate_ids, advisory):
+        self._acquired = []
+        self._advisory = advisory
+        self._candidate_ids = candidate_ids
+        self._connection = None
+        self._locked = []
+        self._stripes = stripes
+
+    async def __aenter__(self):
+        started = time.monotonic()
+
+        try:
+            for stripe in self._stripes:
+                await stripe.acquire()
+                self._acquired.append(stripe)
+
+            if self._advisory:
+                # The connection is reused by the queries run under the lock
+                # (see acquire(reuse=True) of GINO).
+                self._connection = await models.DB.acquire()
+
+                for candidate_id in self._candidate_ids:
+                    await self._connection.scalar(models.DB.select([  # pylint: disable=maybe-no-member
+                        models.DB.func.pg_advisory_lock(  # pylint: disable=maybe-no-member
+                            ADVISORY_NAMESPACE, candidate_id)
+                    ]))
+                    self._locked.append(candidate_id)
+        except BaseException:
+            await self.__aexit__(*sys.exc_info())
+            raise
+
+        METRICS.observe('locks.wait', time.monotonic() - started)
+
+    async def __aexit__(self, exc_type, exc, traceback):
+        try:
+            if self._connection is not None:
+                await self._unlock()
+        finally:
+            while self._acquired:
+                self._acquired.pop().release()
+
+    async def _unlock(self):
+        # asyncpg releases the advisory locks left by the connection when
+        # it's returned to the pool, even if the unlocking has failed.
+        connection, self._connection = self._connection, None
+        try:
+            while self._locked:
+                await connection.scalar(models.DB.select([  # pylint: disable=maybe-no-member
+                    models.DB.func.pg_advisory_unlock(  # pylint: disable=maybe-no-member
+                        ADVISORY_NAMESPACE, self._locked.pop())
+                ]))
+        finally:
+            await connection.release()
+
+
+class NullLock:
+    """Class implementing the lock which doesn't lock anything. It's used
+    when the locks are disabled.
+    """
+
+    async def __aenter__(self):
+        pass
+
+    async def __aexit__(self, exc_type, exc, traceback):
+        pass
@@ -0,0 +1,39 @@
+""" Runtime metrics of the server """
+
+
+class Metrics:
+    """Class collecting counters, gauges and timings of the server. """
+
+    def __init__(self):
+        self._counters = {}
+        self._gauges = {}
+        self._timings = {}
+
+    def incr(self, name, value=1):
+        """Increments the counter by the specified value. """
+
+        self._counters[name] = self._counters.get(name, 0) + value
+
+    def gauge(self, name, func):
+        """Registers the callable returning the current value of the gauge. """
+
+        self._gauges[name] = func
+
+    def observe(self, name, value):
+        """Records the duration (in seconds) of an operation. """
+
+        timing = self._timings.setdefault(name, {'count': 0, 'total': 0.0, 'max': 0.0})
+        timing['count'] += 1
+        timing['total'] += value
+        timing['max'] = max(timing['max'], value)
+
+    def snapshot(self):
+        """Returns the current values of all the metrics. """
+
+        data = dict(self._counters)
+        data.update({name: func() for name, func in self._gauges.items()})
+        data.update({name: dict(timing) for name, timing in self._timings.items()})
+        return data
+
+
+METRICS = Metrics()
@@ -1,6 +1,7 @@
 """ Database GINO models """
 
 from gino.ext.tornado import Gino
+from sqlalchemy.dialects.postgresql import insert
 
 DB = Gino()
 
@@ -27,7 +28,12 @@ class Candidate(DB.Model):
     last_name = DB.Column(DB.String())  # pylint: disable=maybe-no-member
     first_working_day = DB.Column(DB.Date()) # pylint: disable=maybe-no-member
 
-    __table_args__ = (DB.UniqueConstraint('id'))  # pylint: disable=maybe-no-member
+    __table_args__ = (
+        DB.UniqueConstraint('id'),  # pylint: disable=maybe-no-member
+        DB.Index('ix_candidates_last_name_first_name', 'last_name', 'first_name'),  # pylint: disable=maybe-no-member
+        DB.Index('ix_candidates_first_working_day', 'first_working_day',  # pylint: disable=maybe-no-member
+                 postgresql_where=DB.text('first_working_day IS NOT NULL')),  # pylint: disable=maybe-no-member
+    )
 
 class Interview(DB.Model):
     """ Interview event model """
@@ -41,12 +47,220 @@ class Interview(DB.Model):
 
     candidate = DB.Column(DB.Integer(), DB.ForeignKey('candidates.id'))  # pylint: disable=maybe-no-member
 
-    start = DB.Column(DB.DateTime())  # pylint: disable=maybe-no-member
+    # The table is partitioned by month on start (see partitions.py), so the
+    # primary key includes it.
+    start = DB.Column(DB.DateTime(), primary_key=True)  # pylint: disable=maybe-no-member
     end = DB.Column(DB.DateTime())  # pylint: disable=maybe-no-member
 
+    # The start is kept in the local time of Huntflow, whose UTC offset (in
+    # minutes) is kept here, so that the reminders show the same time.
+    start_offset = DB.Column(DB.Integer())  # pylint: disable=maybe-no-member
+
     jobs = DB.Column(DB.JSON())  # pylint: disable=maybe-no-member
 
-    __table_args__ = (DB.UniqueConstraint('id'))  # pylint: disable=maybe-no-member
+    __table_args__ = (
+        DB.Index('ix_interviews_candidate_type', 'candidate', 'type'),  # pylint: disable=maybe-no-member
+        DB.Index('ix_interviews_start', 'start'),  # pylint: disable=maybe-no-member
+    )
+
+class WebhookDelivery(DB.Model):
+    """ Huntflow webhook delivery which has already been handled """
+
+    __tablename__ = 'webhook_deliveries'
+
+    key = DB.Column(DB.String(), primary_key=True)  # pylint: disable=maybe-no-member
+
+    created = DB.Column(DB.DateTime(), nullable=False)  # pylint: disable=maybe-no-member
+
+class ScheduledJob(DB.Model):
+    """ Reminder scheduled by the asyncpg jobstore """
+
+    __tablename__ = 'scheduled_jobs'
+
+    id = DB.Column(DB.String(), primary_key=True)  # pylint: disable=maybe-no-member
+
+    kind = DB.Column(DB.String(), nullable=False)  # pylint: disable=maybe-no-member
+    ref_id = DB.Column(DB.Integer(), nullable=False)  # pylint: disable=maybe-no-member
+    run_time = DB.Column(DB.DateTime(timezone=True), nullable=False, index=True)  # pylint: disable=maybe-no-member
+
+# Creates the candidate unless it exists and creates or reschedules the
+# interview in one round-trip. The interview is not touched if its start and
+# end are not changed. Returns the id of the interview, whether it existed,
+# whether it was changed and the jobs of the previous version of the
+# interview.
+UPSERT_INTERVIEW = DB.text("""
+    WITH new_candidate AS (
+        INSERT INTO candidates (id, first_name, last_name)
+        VALUES (:candidate, :first_name, :last_name)
+        ON CONFLICT (id) DO NOTHING
+    ), previous AS (
+        SELECT id, start, "end", start_offset, jobs FROM interviews
+        WHERE candidate = CAST(:candidate AS INTEGER) AND type = CAST(:type AS VARCHAR)
+        ORDER BY id
+        LIMIT 1
+        FOR UPDATE
+    ), updated AS (
+        UPDATE interviews
+        SET created = CAST(:created AS TIMESTAMP),
+            start = CAST(:start AS TIMESTAMP),
+            "end" = CAST(:end AS TIMESTAMP),
+            start_offset = CAST(:start_offset AS INTEGER),
+            jobs = CAST(:jobs AS JSON)
+        FROM previous
+        WHERE interviews.id = previous.id
+          AND (previous.start IS DISTINCT FROM CAST(:start AS TIMESTAMP)
+               OR previous."end" IS DISTINCT FROM CAST(:end AS TIMESTAMP)
+               OR previous.start_offset IS DISTINCT FROM CAST(:start_offset AS INTEGER))
+        RETURNING interviews.id
+    ), inserted AS (
+        INSERT INTO interviews (created, type, candidate, start, "end", start_offset, jobs)
+        SELECT CAST(:created AS TIMESTAMP), CAST(:type AS VARCHAR),
+               CAST(:candidate AS INTEGER), CAST(:start AS TIMESTAMP),
+               CAST(:end AS TIMESTAMP), CAST(:start_offset AS INTEGER),
+               CAST(:jobs AS JSON)
+        WHERE NOT EXISTS (SELECT 1 FROM previous)
+        RETURNING id
+    )
+    SELECT COALESCE((SELECT id FROM inserted), (SELECT id FROM previous)) AS id,
+           EXISTS (SELECT 1 FROM previous) AS existed,
+           EXISTS (SELECT 1 FROM updated UNION ALL SELECT 1 FROM inserted) AS changed,
+           (SELECT jobs FROM previous) AS previous_jobs
+""").bindparams(
+    DB.bindparam('jobs', type_=DB.JSON()),  # pylint: disable=maybe-no-member
+).columns(
+    id=DB.Integer(),  # pylint: disable=maybe-no-member
+    existed=DB.Boolean(),  # pylint: disable=maybe-no-member
+    changed=DB.Boolean(),  # pylint: disable=maybe-no-member
+    previous_jobs=DB.JSON(),  # pylint: disable=maybe-no-member
+)
+
+# Creates or reschedules the interviews passed as the arrays of their fields
+# in one round-trip the same way UPSERT_INTERVIEW does, except that the
+# candidates must exist. The statement doesn't see its own changes, so the
+# interviews must be of different candidates or types. Returns the same as
+# UPSERT_INTERVIEW for each interview in the order of the arrays.
+UPSERT_INTERVIEWS = DB.text("""
+    WITH batch AS (
+        SELECT *
+        FROM unnest(CAST(:created AS TIMESTAMP[]), CAST(:type AS VARCHAR[]),
+                    CAST(:candidate AS INTEGER[]), CAST(:start AS TIMESTAMP[]),
+                    CAST(:end AS TIMESTAMP[]), CAST(:start_offset AS INTEGER[]),
+                    CAST(:jobs AS TEXT[]))
+             WITH ORDINALITY AS b (created, type, candidate, start, "end", start_offset, jobs, ord)
+    ), previous AS (
+        SELECT batch.ord, p.id, p.start, p."end", p.start_offset, p.jobs
+        FROM batch CROSS JOIN LATERAL (
+            SELECT id, start, "end", start_offset, jobs FROM interviews
+            WHERE candidate = batch.candidate AND type = batch.type
+            ORDER BY id
+            LIMIT 1
+            FOR UPDATE
+        ) p
+    ), updated AS (
+        UPDATE interviews
+        SET created = batch.created,
+            start = batch.start,
+            "end" = batch."end",
+            start_offset = batch.start_offset,
+            jobs = to_json(batch.jobs)
+        FROM previous JOIN batch ON batch.ord = previous.ord
+        WHERE interviews.id = previous.id
+          AND (previous.start IS DISTINCT FROM batch.start
+               OR previous."end" IS DISTINCT FROM batch."end"
+               OR previous.start_offset IS DISTINCT FROM batch.start_offset)
+        RETURNING previous.ord
+    ), inserted AS (
+        INSERT INTO interviews (created, type, candidate, start, "end", start_offset, jobs)
+        SELECT created, type, candidate, start, "end", start_offset, to_json(jobs)
+        FROM batch
+        WHERE NOT EXISTS (SELECT 1 FROM previous WHERE previous.ord = batch.ord)
+        RETURNING id, candidate, type
+    )
+    SELECT COALESCE(inserted.id, previous.id) AS id,
+           previous.id IS NOT NULL AS existed,
+           updated.ord IS NOT NULL OR inserted.id IS NOT NULL AS changed,
+           previous.jobs AS previous_jobs
+    FROM batch
+    LEFT JOIN previous ON previous.ord = batch.ord
+    LEFT JOIN updated ON updated.ord = batch.ord
+    LEFT JOIN inserted ON inserted.candidate = batch.candidate
+                      AND inserted.type IS NOT DISTINCT FROM batch.type
+    ORDER BY batch.ord
+""").columns(
+    id=DB.Integer(),  # pylint: disable=maybe-no-member
+    existed=DB.Boolean(),  # pylint: disable=maybe-no-member
+    changed=DB.Boolean(),  # pylint: disable=maybe-no-member
+    previous_jobs=DB.JSON(),  # pylint: disable=maybe-no-member
+)
+
+UPSERT_INTERVIEWS_FIELDS = ('created', 'type', 'candidate', 'start', 'end', 'start_offset', 'jobs')
+
+async def upsert_interview(bind=None, **values):
+    """ Create or reschedule the interview along with its candidate """
+
+    return await (bind or DB).first(UPSERT_INTERVIEW, **values)
+
+async def upsert_interviews(rows, bind=None):
+    """ Create or reschedule the interviews of different candidates or types in one statement """
+
+    return await (bind or DB).all(UPSERT_INTERVIEWS, **{
+        field: [row[field] for row in rows] for field in UPSERT_INTERVIEWS_FIELDS
+    })
+
+async def insert_candidates(rows, bind=None):
+    """ Create the candidates which don't exist in one statement """
+
+    stmt = insert(Candidate.__table__) \
+        .values(rows) \
+        .on_conflict_do_nothing(index_elements=['id'])
+    await (bind or DB).status(stmt)
+
+def upcoming_candidates_query(now, after=None, limit=None):
+    """ Build the query selecting the candidates having interviews after now,
+    ordered by (start of the nearest interview, id) and starting after the
+    specified pair of them """
+
+    next_interviews = DB.select([Candidate.id, Candidate.first_name, Candidate.last_name,  # pylint: disable=maybe-no-member
+                                 Interview.start]) \
+        .select_from(Candidate.__table__.join(Interview.__table__)) \
+        .where(Interview.start > now) \
+        .distinct(Candidate.id) \
+        .order_by(Candidate.id, Interview.start) \
+        .alias('next_interviews')
+    columns = next_interviews.c
+    query = DB.select([columns.id, columns.first_name, columns.last_name,  # pylint: disable=maybe-no-member
+                       columns.start]) \
+        .order_by(columns.start, columns.id)
+
+    if after is not None:
+        query = query.where(DB.tuple_(columns.start, columns.id) > DB.tuple_(*after))  # pylint: disable=maybe-no-member
+    if limit is not None:
+        query = query.limit(limit)
+
+    return query
+
+def candidates_with_fwd_query(after=None, limit=None):
+    """ Build the query selecting the candidates having the first working day
+    set, ordered by (first working day, id) and starting after the specified
+    pair of them """
+
+    query = DB.select([Candidate.id, Candidate.first_name, Candidate.last_name,  # pylint: disable=maybe-no-member
+                       Candidate.first_working_day]) \
+        .where(Candidate.first_working_day.isnot(None)) \
+        .order_by(Candidate.first_working_day, Candidate.id)
+
+    if after is not None:
+        query = query.where(DB.tuple_(Candidate.first_working_day, Candidate.id) >  # pylint: disable=maybe-no-member
+                            DB.tuple_(*after))  # pylint: disable=maybe-no-member
+    if limit is not None:
+        query = query.limit(limit)
+
+    return query
+
+async def upcoming_candidates(now, bind=None):
+    """ Get the candidates having interviews after now, the nearest first """
+
+    return await (bind or DB).all(upcoming_candidates_query(now))
 
 async def gino_run(postgres_url):
     """ Set up connection to the database """
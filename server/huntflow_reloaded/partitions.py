@@ -0,0 +1,134 @@
+""" Monthly partitions of the interviews table """
+
+from datetime import date
+
+from .models import DB
+
+# The interviews which don't fit any monthly partition go there.
+DEFAULT_PARTITION = 'interviews_default'
+
+PARTITION_PREFIX = 'interviews_y'
+
+LIST_PARTITIONS = """
+    SELECT child.relname
+    FROM pg_inherits
+    JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+    JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+    WHERE parent.relname = 'interviews'
+    ORDER BY child.relname
+"""
+
+FOREIGN_KEYS = """
+    SELECT conname
+    FROM pg_constraint
+    WHERE conrelid = '{}'::regclass AND contype = 'f'
+"""
+
+
+def add_months(day, months):
+    """Returns the first day of the month the specified number of months
+    after (or before, if it's negative) the month of the day.
+    """
+
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    """Returns the name of the partition keeping the interviews which start
+    in the month of the specified day.
+    """
+
+    return '{}{:04d}m{:02d}'.format(PARTITION_PREFIX, month.year, month.month)
+
+
+def partition_month(name):
+    """Returns the first day of the month kept by the partition or None if
+    it's not a monthly partition.
+    """
+
+    if not name.startswith(PARTITION_PREFIX):
+        return None
+
+    try:
+        year, month = name[len(PARTITION_PREFIX):].split('m')
+        return date(int(year), int(month), 1)
+    except ValueError:
+        return None
+
+
+async def list_partitions():
+    """Returns the names of the partitions of the interviews table. """
+
+    return [row[0] for row in await DB.all(LIST_PARTITIONS)]
+
+
+async def create_partition(month):
+    """Creates the partition for the interviews starting in the month of the
+    specified day unless it exists. The interviews of the month which have
+    been put into the default partition are moved to the new one.
+    """
+
+    name = partition_name(month)
+    lower, upper = add_months(month, 0), add_months(month, 1)
+
+    async with DB.transaction():
+        if await DB.scalar("SELECT to_regclass('{}')".format(name)) is not None:
+            return False
+
+        # The partition can't be attached while the default partition keeps
+        # its rows.
+        await DB.status("""
+            CREATE TEMPORARY TABLE interviews_moved ON COMMIT DROP AS
+            SELECT * FROM {default} WHERE start >= '{lower}' AND start < '{upper}'
+        """.format(default=DEFAULT_PARTITION, lower=lower, upper=upper))
+        await DB.status("""
+            DELETE FROM {default} WHERE start >= '{lower}' AND start < '{upper}'
+        """.format(default=DEFAULT_PARTITION, lower=lower, upper=upper))
+        await DB.status("""
+            CREATE TABLE {name} PARTITION OF interviews
+            FOR VALUES FROM ('{lower}') TO ('{upper}')
+        """.format(name=name, lower=lower, upper=upper))
+        await DB.status('INSERT INTO interviews SELECT * FROM interviews_moved')
+
+    return True
+
+
+async def create_partitions(today, ahead):
+    """Creates the partitions for the current month and the specified number
+    of the next months. Returns the names of the created partitions.
+    """
+
+    created = []
+    for months in range(ahead + 1):
+        month = add_months(today, months)
+        if await create_partition(month):
+            created.append(partition_name(month))
+
+    return created
+
+
+async def archive_partitions(before, drop=False):
+    """Detaches (or drops) the partitions of the months preceding the month
+    of the specified day. The detached partitions are left as standalone
+    tables without the foreign keys, so that they don't keep the candidates
+    from being deleted. Returns the names of the archived partitions.
+    """
+
+    archived = []
+    for name in await list_partitions():
+        month = partition_month(name)
+        if month is None or month >= add_months(before, 0):
+            continue
+
+        if drop:
+            await DB.status('DROP TABLE {}'.format(name))
+        else:
+            async with DB.transaction():
+                await DB.status('ALTER TABLE interviews DETACH PARTITION {}'.format(name))
+                for row in await DB.all(FOREIGN_KEYS.format(name)):
+                    await DB.status('ALTER TABLE {} DROP CONSTRAINT {}'.format(name, row[0]))
+
+        archived.append(name)
+
+    return archived
@@ -0,0 +1,181 @@
+""" Pools of connections to Postgres shared by the handlers """
+
+import asyncio
+import itertools
+import time
+
+import gino
+
+from .metrics import METRICS
+from .models import DB
+
+
+class Pool:
+    """Class managing the pool of connections GINO uses. The pool is opened
+    once (normally on startup) and all the handlers share it. The first
+    min_size connections are established and checked in advance, so the
+    first requests don't pay for connecting to the database.
+    """
+
+    def __init__(self, postgres_url, min_size=10, max_size=10):
+        self._postgres_url = postgres_url
+        self._min_size = min_size
+        self._max_size = max_size
+
+        self._engine = None
+        self._lock = None
+
+        METRICS.gauge('pool.size', lambda: self.stats()['size'])
+        METRICS.gauge('pool.in_use', lambda: self.stats()['in_use'])
+        METRICS.gauge('pool.idle', lambda: self.stats()['idle'])
+
+    async def open(self):
+        """Binds GINO to the pool unless it's already done. """
+
+        if self._engine is not None:
+            return
+
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        async with self._lock:
+            if self._engine is not None:
+                return
+
+            self._engine = await DB.set_bind(self._postgres_url,
+                                             min_size=self._min_size,
+                                             max_size=self._max_size)
+
+            await self._prewarm()
+
+    async def close(self):
+        """Waits for the connections to be released and closes them. """
+
+        if self._engine is None:
+            return
+
+        engine, self._engine = self._engine, None
+        if DB.bind is engine:
+            DB.pop_bind()
+
+        await engine.close()
+
+    def stats(self):
+        """Returns the number of the established, used and idle connections. """
+
+        if self._engine is None:
+            return {'size': 0, 'in_use': 0, 'idle': 0, 'max_size': self._max_size}
+
+        size, idle = _pool_sizes(self._engine.raw_pool)
+        return {'size': size, 'in_use': size - idle, 'idle': idle,
+                'max_size': self._max_size}
+
+    async def _prewarm(self):
+        async def ping():
+            async with DB.acquire(reuse=False) as conn:
+                await conn.scalar('SELECT 1')
+
+        await asyncio.gather(*[ping() for _ in range(self._min_size)])
+
+
+def _pool_sizes(pool):
+    """Returns the number of the connections the asyncpg pool has established
+    and the number of the idle ones.
+    """
+
+    # asyncpg provides the public API for the statistics since 0.25 only.
+    # The older versions GINO 0.8 works with (since 0.18) are read through the
+    # holders of the connections, the idle ones of which wait in the queue
+    # along with the holders which have not connected yet.
+    if hasattr(pool, 'get_size'):
+        return pool.get_size(), pool.get_idle_size()
+
+    try:
+        holders = pool._holders  # pylint: disable=protected-access
+        size = sum(holder._con is not None for holder in holders)  # pylint: disable=protected-access
+        idle = pool._queue.qsize() - (len(holders) - size)  # pylint: disable=protected-access
+    except AttributeError:
+        # The internals of the version in use are unknown, so the statistics
+        # are not reported rather than breaking the metrics.
+        return 0, 0
+
+    return size, idle
+
+
+# How long (in seconds) the measured replication lag of a replica is trusted.
+LAG_CHECK_INTERVAL = 1
+
+# The replica which has replayed everything it received may still be behind
+# if it's disconnected from the primary, so the lag is measured from the time
+# of the last replayed transaction. It grows while nothing is written to the
+# primary, which makes the primary be used until the next write.
+REPLICATION_LAG = """
+    SELECT EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+"""
+
+
+class Replicas:
+    """Class managing the pools of connections to the read replicas of
+    Postgres. The replicas are used in turn. The replica lagging behind the
+    primary more than max_lag seconds is skipped, and the primary is used if
+    all of them lag.
+    """
+
+    def __init__(self, postgres_urls, min_size=1, max_size=10, max_lag=5):
+        self._postgres_urls = postgres_urls
+        self._min_size = min_size
+        self._max_size = max_size
+        self._max_lag = max_lag
+
+        self._engines = []
+        self._lags = {}
+        self._next = None
+
+    async def open(self):
+        """Creates the pools of connections to the replicas. """
+
+        for postgres_url in self._postgres_urls:
+            engine = await gino.create_engine(postgres_url,
+                                              min_size=self._min_size,
+                                              max_size=self._max_size)
+            self._engines.append(engine)
+
+        self._next = itertools.cycle(self._engines)
+
+    async def close(self):
+        """Closes the pools of connections to the replicas. """
+
+        engines, self._engines = self._engines, []
+        for engine in engines:
+            await engine.close()
+
+    async def choose(self):
+        """Returns the engine of the next replica which doesn't lag or the
+        primary one (i.e. DB) if there is no such replica.
+        """
+
+        for _ in range(len(self._engines)):
+            engine = next(self._next)
+            if await self._lag(engine) <= self._max_lag:
+                METRICS.incr('replicas.reads')
+                return engine
+
+        METRICS.incr('replicas.fallbacks')
+        return DB
+
+    async def _lag(self, engine):
+        if engine in self._lags:
+            checked, lag = self._lags[engine]
+            if time.monotonic() - checked < LAG_CHECK_INTERVAL:
+                return lag
+
+        try:
+            lag = await engine.scalar(REPLICATION_LAG)
+        except Exception:  # pylint: disable=broad-except
+            lag = None
+
+        # The replica which can't be reached or isn't replicating anything
+        # is treated as infinitely lagging.
+        lag = float('inf') if lag is None else float(lag)
+        self._lags[engine] = (time.monotonic(), lag)
+        return lag
@@ -0,0 +1,137 @@
+""" Hot queries run as prepared statements """
+
+from .models import DB
+
+# The statements are written in plain SQL and are run right on the asyncpg
+# connections, bypassing the compilation by SQLAlchemy and the loading of the
+# GINO models. asyncpg prepares each statement once per connection and keeps
+# it in the statement cache of the connection, so the next calls on the same
+# pooled connection skip parsing and planning as well. The rows are returned
+# as asyncpg records, which are accessed by the column names.
+
+CANDIDATE_BY_ID = """
+    SELECT id, first_name, last_name, first_working_day
+    FROM candidates
+    WHERE id = $1
+"""
+
+CANDIDATE_BY_NAME = """
+    SELECT id, first_name, last_name, first_working_day
+    FROM candidates
+    WHERE first_name = $1 AND last_name = $2
+    LIMIT 1
+"""
+
+# The ids of the jobs are stored as a JSON string, which is unwrapped here the
+# same way the JSON type of SQLAlchemy decodes it.
+INTERVIEW_BY_CANDIDATE = """
+    SELECT id, type, candidate, start, "end", jobs #>> '{}' AS jobs
+    FROM interviews
+    WHERE candidate = $1
+    LIMIT 1
+"""
+
+INTERVIEW_REMINDER = """
+    SELECT c.first_name, c.last_name, i.start, i.start_offset, i.jobs #>> '{}' AS jobs
+    FROM interviews i JOIN candidates c ON c.id = i.candidate
+    WHERE i.id = $1
+"""
+
+USER_BY_EMAIL = """
+    SELECT id, email, password
+    FROM users
+    WHERE email = $1
+"""
+
+# The first pages and the next ones are selected by separate statements, so
+# that the plans of both of them use the indexes.
+
+# The next interview of each candidate is picked by DISTINCT ON, so that the
+# keyset is compared with the plain columns in WHERE.
+UPCOMING_CANDIDATES = """
+    SELECT id, first_name, last_name, start
+    FROM (
+        SELECT DISTINCT ON (c.id) c.id, c.first_name, c.last_name, i.start
+        FROM candidates c JOIN interviews i ON i.candidate = c.id
+        WHERE i.start > $1
+        ORDER BY c.id, i.start
+    ) next_interviews
+    {after}
+    ORDER BY start, id
+    LIMIT $2
+"""
+
+UPCOMING_CANDIDATES_FIRST = UPCOMING_CANDIDATES.format(after='')
+
+UPCOMING_CANDIDATES_AFTER = UPCOMING_CANDIDATES.format(
+    after='WHERE (start, id) > ($3::timestamp, $4::integer)')
+
+CANDIDATES_WITH_FWD = """
+    SELECT id, first_name, last_name, first_working_day
+    FROM candidates
+    WHERE first_working_day IS NOT NULL {after}
+    ORDER BY first_working_day, id
+    LIMIT $1
+"""
+
+CANDIDATES_WITH_FWD_FIRST = CANDIDATES_WITH_FWD.format(after='')
+
+CANDIDATES_WITH_FWD_AFTER = CANDIDATES_WITH_FWD.format(
+    after='AND (first_working_day, id) > ($2::date, $3::integer)')
+
+
+async def _run(method, query, *args, bind=None):
+    # The connection of the current transaction is reused, if there is one.
+    async with (bind or DB).acquire(reuse=True) as conn:
+        raw_connection = await conn.get_raw_connection()
+        return await getattr(raw_connection, method)(query, *args)
+
+
+async def candidate_by_id(candidate_id, bind=None):
+    """Returns the candidate with the specified id or None. """
+
+    return await _run('fetchrow', CANDIDATE_BY_ID, candidate_id, bind=bind)
+
+
+async def candidate_by_name(first_name, last_name, bind=None):
+    """Returns the candidate with the specified name or None. """
+
+    return await _run('fetchrow', CANDIDATE_BY_NAME, first_name, last_name, bind=bind)
+
+
+async def interview_by_candidate(candidate_id, bind=None):
+    """Returns the interview of the candidate or None. """
+
+    return await _run('fetchrow', INTERVIEW_BY_CANDIDATE, candidate_id, bind=bind)
+
+
+async def interview_reminder(interview_id, bind=None):
+    """Returns the interview with the specified id along with the name of
+    its candidate or None.
+    """
+
+    return await _run('fetchrow', INTERVIEW_REMINDER, interview_id, bind=bind)
+
+
+async def user_by_email(email, bind=None):
+    """Returns the user with the specified email or None. """
+
+    return await _run('fetchrow', USER_BY_EMAIL, email, bind=bind)
+
+
+async def upcoming_candidates(now, after=None, limit=None, bind=None):
+    """Returns the same rows as models.upcoming_candidates_query. """
+
+    if after is None:
+        return await _run('fetch', UPCOMING_CANDIDATES_FIRST, now, limit, bind=bind)
+
+    return await _run('fetch', UPCOMING_CANDIDATES_AFTER, now, limit, *after, bind=bind)
+
+
+async def candidates_with_fwd(after=None, limit=None, bind=None):
+    """Returns the same rows as models.candidates_with_fwd_query. """
+
+    if after is None:
+        return await _run('fetch', CANDIDATES_WITH_FWD_FIRST, limit, bind=bind)
+
+    return await _run('fetch', CANDIDATES_WITH_FWD_AFTER, limit, *after, bind=bind)
@@ -0,0 +1,215 @@
+""" Engine firing the reminders without APScheduler """
+
+import heapq
+import logging
+import sys
+import time
+
+from apscheduler.util import convert_to_datetime, datetime_to_utc_timestamp
+from tornado.ioloop import IOLoop
+
+from .metrics import METRICS
+from .models import DB
+from .writebehind import WriteBehind
+
+# The reminders are loaded in no particular order since the heap is built
+# from them in linear time anyway. The fire time is loaded as a timestamp,
+# so that no datetime objects are created.
+LOAD_REMINDERS = """
+    SELECT id, kind, ref_id, extract(epoch FROM run_time)::float8 AS run_time
+    FROM scheduled_jobs
+"""
+
+INSERT_REMINDERS = """
+    INSERT INTO scheduled_jobs (id, kind, ref_id, run_time)
+    VALUES ($1, $2, $3, to_timestamp($4))
+"""
+
+DELETE_REMINDERS = 'DELETE FROM scheduled_jobs WHERE id = ANY($1::varchar[])'
+
+
+class ReminderEngine:  # pylint: disable=too-many-instance-attributes
+    """Class implementing the engine which keeps the pending reminders in
+    memory as (fire time, kind, ref id) entries and fires them when the time
+    comes, using a single timeout of the IOLoop. The entries are ordered by
+    a min-heap, so adding a reminder takes O(log n) time and removing it
+    takes O(1) time: the removed entries are skipped when they reach the top
+    of the heap.
+
+    The reminders are kept in the scheduled_jobs table, which the asyncpg
+    jobstore uses as well. The changes are written behind (see WriteBehind),
+    so add() and remove() never wait for the database. The reminders are
+    loaded by load() when the server is started.
+
+    The reminders which are more than misfire_grace_time seconds late (e.g.
+    because the server has been stopped) are skipped like APScheduler does,
+    unless it's None.
+
+    The engine must be used only from the thread running the IOLoop.
+    """
+
+    def __init__(self, remind, timezone, misfire_grace_time=1):
+        self._logger = logging.getLogger('tornado.application')
+        self._misfire_grace_time = misfire_grace_time
+        self._remind = remind
+        self._timezone = timezone
+
+        # The id of the reminder mapped to its (fire time, kind, ref id)
+        # entry and the heap of the (fire time, id) pairs.
+        self._entries = {}
+        self._heap = []
+
+        self._timeout = None
+        self._armed_at = None
+
+        # The id of the reminder mapped to the row to be inserted or to None
+        # if the reminder is removed.
+        self._writes = WriteBehind(self._persist, 'reminders')
+
+        METRICS.gauge('reminders.pending', lambda: len(self._entries))
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, reminder_id):
+        return reminder_id in self._entries
+
+    def get(self, reminder_id):
+        """Returns the (fire time, kind, ref id) entry of the reminder or
+        None if there is no such reminder.
+        """
+
+        return self._entries.get(reminder_id)
+
+    async def load(self):
+        """Loads the reminders from the database and starts firing them. """
+
+        started = time.monotonic()
+        rows = await DB.all(LOAD_REMINDERS)
+
+        for row in rows:
+            self._entries[row['id']] = (row['run_time'], sys.intern(row['kind']), row['ref_id'])
+
+        self._heap = [(entry[0], reminder_id) for reminder_id, entry in self._entries.items()]
+        heapq.heapify(self._heap)
+        self._arm()
+
+        self._logger.info('Loaded %s reminders in %.3f s', len(rows), time.monotonic() - started)
+
+    def stop(self):
+        """Stops firing the reminders. The reminders are kept. """
+
+        if self._timeout is not None:
+            IOLoop.current().remove_timeout(self._timeout)
+            self._timeout = self._armed_at = None
+
+    async def flush(self):
+        """Waits for the changes made so far to be written. Raises the error
+        if they could not be written.
+        """
+
+        await self._writes.flush()
+
+    def add(self, reminder_id, date, kind, ref_id):
+        """Adds the reminder of the specified kind about the object with the
+        specified id, which fires at the specified date. The reminder with
+        the same id is replaced.
+        """
+
+        fire_time = datetime_to_utc_timestamp(convert_to_datetime(date, self._timezone, 'date'))
+
+        self._entries[reminder_id] = (fire_time, sys.intern(kind), ref_id)
+        heapq.heappush(self._heap, (fire_time, reminder_id))
+        self._writes.change(reminder_id, (reminder_id, kind, ref_id, fire_time))
+
+        if self._armed_at is None or fire_time < self._armed_at:
+            self._arm()
+
+    def remove(self, reminder_id):
+        """Removes the reminder by id. Returns whether it has been removed. """
+
+        return self.remove_many([reminder_id]) == 1
+
+    def remove_many(self, reminder_ids):
+        """Removes the reminders by ids and returns the number of the
+        reminders which have been removed. The missing ones are ignored.
+        """
+
+        removed = 0
+        for reminder_id in reminder_ids:
+            if self._entries.pop(reminder_id, None) is not None:
+                self._writes.change(reminder_id, None)
+                removed += 1
+
+        # The removed entries are dropped from the heap once they outnumber
+        # the pending ones, so that the heap doesn't grow unbounded.
+        if removed and len(self._heap) > 2 * len(self._entries) + 1024:
+            self._heap = [(entry[0], reminder_id)
+                          for reminder_id, entry in self._entries.items()]
+            heapq.heapify(self._heap)
+
+        return removed
+
+    def _pop_stale(self):
+        # Drops the entries of the removed and replaced reminders from the
+        # top of the heap.
+        heap = self._heap
+        while heap:
+            fire_time, reminder_id = heap[0]
+            entry = self._entries.get(reminder_id)
+            if entry is not None and entry[0] == fire_time:
+                break
+            heapq.heappop(heap)
+
+    def _arm(self):
+        self.stop()
+        self._pop_stale()
+        if not self._heap:
+            return
+
+        self._armed_at = self._heap[0][0]
+        self._timeout = IOLoop.current().call_later(
+            max(0, self._armed_at - time.time()), self._fire)
+
+    def _fire(self):
+        self._timeout = self._armed_at = None
+        now = time.time()
+
+        while True:
+            self._pop_stale()
+            if not self._heap or self._heap[0][0] > now:
+                break
+
+            fire_time, reminder_id = heapq.heappop(self._heap)
+            _, kind, ref_id = self._entries.pop(reminder_id)
+            self._writes.change(reminder_id, None)
+
+            if self._misfire_grace_time is not None and \
+                    now - fire_time > self._misfire_grace_time:
+                METRICS.incr('reminders.missed')
+                self._logger.warning('Skipping the %s reminder about %s which is %.0f s late',
+                                     kind, ref_id, now - fire_time)
+                continue
+
+            METRICS.incr('reminders.fired')
+            IOLoop.current().spawn_callback(self._run, kind, ref_id)
+
+        self._arm()
+
+    async def _run(self, kind, ref_id):
+        try:
+            await self._remind(kind, ref_id)
+        except Exception:  # pylint: disable=broad-except
+            METRICS.incr('reminders.errors')
+            self._logger.exception('Unable to send the %s reminder about %s', kind, ref_id)
+
+    @staticmethod
+    async def _persist(changes, _clear):
+        rows = [row for row in changes.values() if row is not None]
+
+        async with DB.acquire(reuse=False) as conn:
+            raw_connection = await conn.get_raw_connection()
+            async with raw_connection.transaction():
+                await raw_connection.execute(DELETE_REMINDERS, list(changes))
+                if rows:
+                    await raw_connection.executemany(INSERT_REMINDERS, rows)
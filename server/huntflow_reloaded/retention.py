@@ -0,0 +1,76 @@
+""" Periodic removal of the candidates who have already started working """
+
+import logging
+import time
+from datetime import date
+
+from .cache import CANDIDATES
+from .metrics import METRICS
+from .models import DB
+from .upcoming import UPCOMING
+
+# Removes a batch of the candidates whose first working day has passed along
+# with their interviews. The candidates locked by the webhooks being handled
+# are skipped until the next run.
+PURGE_CANDIDATES = DB.text("""
+    WITH expired AS (
+        SELECT id FROM candidates
+        WHERE first_working_day < :today
+        ORDER BY id
+        LIMIT :batch_size
+        FOR UPDATE SKIP LOCKED
+    ), purged_interviews AS (
+        DELETE FROM interviews
+        WHERE candidate IN (SELECT id FROM expired)
+        RETURNING id
+    ), purged_candidates AS (
+        DELETE FROM candidates
+        WHERE id IN (SELECT id FROM expired)
+        RETURNING id
+    )
+    SELECT ARRAY(SELECT id FROM purged_candidates) AS candidates,
+           (SELECT count(*) FROM purged_interviews) AS interviews
+""")
+
+
+class RetentionSweeper:  # pylint: disable=too-few-public-methods
+    """Class removing the candidates the day after their first working day.
+    The candidates are removed by the set-based statements in batches of
+    batch_size, so a run holds the locks on a bounded number of rows at a
+    time.
+    """
+
+    def __init__(self, batch_size=1000):
+        self._batch_size = batch_size
+        self._logger = logging.getLogger('tornado.application')
+
+    async def sweep(self, today=None):
+        """Removes all the expired candidates along with their interviews.
+        Returns the number of the removed candidates and interviews.
+        """
+
+        today = today or date.today()
+        started = time.monotonic()
+        purged = {'candidates': 0, 'interviews': 0}
+
+        while True:
+            row = await DB.first(PURGE_CANDIDATES, today=today,
+                                 batch_size=self._batch_size)
+            for candidate_id in row['candidates']:
+                if UPCOMING.loaded:
+                    UPCOMING.remove(candidate_id)
+                CANDIDATES.invalidate(candidate_id)
+
+            purged['candidates'] += len(row['candidates'])
+            purged['interviews'] += row['interviews']
+
+            if len(row['candidates']) < self._batch_size:
+                break
+
+        METRICS.incr('retention.candidates', purged['candidates'])
+        METRICS.incr('retention.interviews', purged['interviews'])
+        METRICS.observe('retention.sweep', time.monotonic() - started)
+
+        self._logger.info('purged %s candidates and %s interviews',
+                          purged['candidates'], purged['interviews'])
+        return purged
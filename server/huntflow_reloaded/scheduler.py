@@ -1,25 +1,81 @@
 """ Scheduler module """
 
 import json
-from datetime import timedelta, datetime
+import logging
+from datetime import timedelta, timezone, datetime
+from uuid import uuid4
 
 from fakeredis import FakeStrictRedis
 from redis import StrictRedis
+from apscheduler.events import EVENT_JOB_REMOVED, JobEvent
 from apscheduler.schedulers.tornado import TornadoScheduler
+from tornado.ioloop import IOLoop
+
+from huntflow_reloaded import events, queries
+from .cache import CANDIDATES
+from .jobstore import SELECT_REMINDERS, AsyncpgJobStore, SQLAlchemyJobStore
+from .models import DB, Candidate, Interview, ScheduledJob
+from .reminders import ReminderEngine
+from .upcoming import UPCOMING
+
+# The time the reminder may be late for in the lazy mode (e.g. because the
+# server was stopped) until it's considered missed and isn't sent.
+MISFIRE_GRACE_TIME = timedelta(minutes=1)
+
+
+class _TornadoScheduler(TornadoScheduler):  # pylint: disable=too-few-public-methods
+    """TornadoScheduler notifying the listeners about the jobs removed
+    bypassing it (see Scheduler.remove_jobs()).
+    """
+
+    def notify_removed(self, job_ids, jobstore='default'):
+        """Dispatches the events the scheduler dispatches when the jobs are
+        removed one by one. The event API is the one of APScheduler 3.5
+        (see requirements.txt).
+        """
+
+        for job_id in job_ids:
+            self._dispatch_event(JobEvent(EVENT_JOB_REMOVED, job_id, jobstore))
 
-from huntflow_reloaded import handler
-from .models import Candidate, Interview
 
 class Scheduler:
     """Class encapsulating scheduling logic. """
 
-    def __init__(self, redis_args, channel_name, postgres_url):
+    # The scheduler the reminders are published by. The reminders keep only
+    # their kind and the id of the object they are about, so the Redis
+    # connection and the message are taken from it when the reminder fires.
+    current = None
+
+    def __init__(self, redis_args, channel_name, postgres_url, jobstore='sqlalchemy',  # pylint: disable=too-many-arguments
+                 lazy_reminders=False):
         self.redis_args = redis_args
         self.channel_name = channel_name
-        self.scheduler = TornadoScheduler(
-            {'apscheduler.jobstores.default': {'type': 'sqlalchemy',
-                                               'url': postgres_url}
-            })
+
+        # Only the next reminder about each interview is scheduled. The
+        # following one is scheduled when the reminder fires.
+        self.lazy_reminders = lazy_reminders
+
+        # The asyncpg jobstore keeps the jobs in memory and saves them using
+        # the pool of the handlers, so the handlers don't block the IOLoop
+        # while scheduling the jobs.
+        if jobstore in ('asyncpg', 'heap'):
+            self.jobstore = AsyncpgJobStore()
+        else:
+            self.jobstore = SQLAlchemyJobStore(url=postgres_url)
+
+        # The lazy reminders must be run even if they are late, so that the
+        # following ones are scheduled. The late ones are not sent though.
+        job_defaults = {'misfire_grace_time': None} if lazy_reminders else {}
+        self.scheduler = _TornadoScheduler({'apscheduler.jobstores.default': self.jobstore},
+                                           job_defaults=job_defaults)
+
+        # The reminders are fired by the engine instead of APScheduler, which
+        # is left with the jobs scheduled by the previous versions.
+        self.reminders = None
+        if jobstore == 'heap':
+            self.reminders = ReminderEngine(
+                self._remind, self.scheduler.timezone,
+                misfire_grace_time=None if lazy_reminders else 1)
     #
     # The main entry-point
     #
@@ -33,29 +89,121 @@ class Scheduler:
     # Shortcuts for scheduler methods
     #
 
-    def add(self, date, func, args):
+    def add(self, date, func, args, job_id=None):
         """Shortcut for adding new events. """
 
         job = self.scheduler.add_job(
             func=func,
             trigger='date',
             next_run_time=date,
-            args=args
+            args=args,
+            id=job_id
         )
         return job
 
+    def add_reminder(self, date, kind, ref_id, job_id=None):
+        """Schedules the reminder of the specified kind (e.g. 'interview')
+        about the object with the specified id.
+        """
+
+        if self.reminders is not None:
+            job_id = job_id or uuid4().hex
+            self.reminders.add(job_id, date, kind, ref_id)
+            return job_id
+
+        return self.add(date=date, func=self._remind, args=(kind, ref_id), job_id=job_id)
+
     def make(self):
         """Shortcut for running the scheduler workers. """
 
+        Scheduler.current = self
         self.scheduler.start()
 
+    async def load(self):
+        """Loads the jobs kept in memory by the jobstore and the reminders. It
+        must be invoked when the scheduler is started and the pool is opened.
+        """
+
+        if self.reminders is not None:
+            await self.reminders.load()
+            await self.jobstore.load_pickled_jobs()
+            self.scheduler.wakeup()
+        elif isinstance(self.jobstore, AsyncpgJobStore):
+            await self.jobstore.load()
+            self.scheduler.wakeup()
+        else:
+            await self._move_reminders()
+
+    async def _move_reminders(self):
+        # The SQLAlchemy jobstore doesn't read the reminders saved as rows by
+        # the asyncpg jobstore or the engine, so they are moved to it when
+        # the server is switched back to it. It keeps pickling them: it is
+        # the jobstore of APScheduler, which reads its own table only, and
+        # the pickles hold just the (kind, ref_id) arguments of _remind.
+        rows = await DB.all(SELECT_REMINDERS)
+        for row in rows:
+            self.scheduler.add_job(func=self._remind, trigger='date',
+                                   next_run_time=row['run_time'],
+                                   args=(row['kind'], row['ref_id']),
+                                   id=row['id'], replace_existing=True)
+
+        if rows:
+            await ScheduledJob.delete.where(
+                ScheduledJob.id.in_([row['id'] for row in rows])).gino.status()
+            logging.getLogger('tornado.application').info(
+                'Moved %s reminders to the SQLAlchemy jobstore', len(rows))
+
+    async def flush(self):
+        """Waits for the jobs added and removed so far to be saved. """
+
+        if self.reminders is not None:
+            await self.reminders.flush()
+        if isinstance(self.jobstore, AsyncpgJobStore):
+            await self.jobstore.flush()
+
+    def shutdown(self):
+        """Stops running the jobs and firing the reminders. """
+
+        if self.reminders is not None:
+            self.reminders.stop()
+        self.scheduler.shutdown(wait=False)
+
     def remove_job(self, job_id):
         """Shortcut for removing scheduler job by id. """
 
+        if self.reminders is not None and self.reminders.remove(job_id):
+            return
+
         job = self.scheduler.get_job(job_id)
         if job:
             job.remove()
 
+    async def remove_jobs(self, job_ids):
+        """Removes the jobs by ids at once and returns the number of the jobs
+        which have been removed. The missing jobs are ignored.
+        """
+
+        if not job_ids:
+            return 0
+
+        removed = 0
+        if self.reminders is not None:
+            removed = self.reminders.remove_many(job_ids)
+            if removed == len(job_ids):
+                return removed
+
+        if isinstance(self.jobstore, AsyncpgJobStore):
+            removed_ids = self.jobstore.remove_jobs(job_ids)
+        else:
+            # The SQLAlchemy jobstore doesn't keep the jobs in memory, so
+            # they are deleted from the table in the executor.
+            removed_ids = await IOLoop.current().run_in_executor(
+                None, self.jobstore.remove_jobs, job_ids)
+
+        self.scheduler.notify_removed(removed_ids)
+
+        return removed + len(removed_ids)
+
     def publish_now(self, message):
         """Shortcut for publishing message in Redis channel immediately. """
 
@@ -73,49 +221,146 @@ class Scheduler:
         """
 
         message = context['message']
-        interview = context['interview']
-        interview_date = handler.get_date_from_string(message['start'])
+        interview_date = events.get_date_from_string(message['start'])
 
-        args = (message, self.redis_args, self.channel_name)
+        if self.lazy_reminders:
+            self.schedule_next_reminder(interview_date, context['interview'], context['jobs'][0])
+            await self.flush()
+            return
 
         scheduled_dates = self.get_scheduled_dates(interview_date)
 
-        jobs = []
+        # The ids have already been saved along with the interview.
+        for scheduled_date, job_id in zip(scheduled_dates, context['jobs']):
+            self.add_reminder(scheduled_date, 'interview', context['interview'], job_id=job_id)
 
-        for scheduled_date in scheduled_dates:
-            job = self.add(date=scheduled_date, func=self._notify_interview, args=args)
-            jobs.append(job.id)
+        await self.flush()
 
-        await interview.update(jobs=json.dumps(jobs)).apply()
+    def schedule_next_reminder(self, interview_date, interview_id, job_id, now=None):
+        """Schedules the first of the reminders about the interview which
+        is not due yet, replacing the job with the specified id. Returns the
+        date of the reminder or None if all the reminders are due.
+        """
 
-    async def remove_candidate(self, context):
-        """Removes the candidate in a day after first working day at midnight. """
+        now = now or datetime.now()
+        self.remove_job(job_id)
 
-        day_after_fwd = self.get_day_after_fwd(context['employment_date'])
+        scheduled_dates = [scheduled_date for scheduled_date
+                           in self.get_scheduled_dates(interview_date) if scheduled_date > now]
+        if not scheduled_dates:
+            return None
 
-        self.add(
-            date=day_after_fwd,
-            func=self._remove_candidate,
-            args=(context['candidate_id'], )
-        )
+        self.add_reminder(min(scheduled_dates), 'interview', interview_id, job_id=job_id)
+        return min(scheduled_dates)
+
+    #
+    # Rendering the reminders from the current state of the database
+    #
+
+    @staticmethod
+    async def render_interview(interview_id):
+        """Returns the message reminding about the interview or None if the
+        interview doesn't exist anymore.
+        """
+
+        interview = await queries.interview_reminder(interview_id)
+        if interview is None:
+            return None
+
+        return Scheduler.make_interview_message(interview)
+
+    async def advance_interview(self, interview_id, now=None):
+        """Schedules the reminder following the one about the interview
+        which fires now (in the lazy mode). Returns the message of the
+        latter or None if the interview doesn't exist anymore or the
+        reminder is late.
+        """
+
+        interview = await queries.interview_reminder(interview_id)
+        if interview is None:
+            return None
+
+        # The interviews scheduled before the lazy mode was enabled have all
+        # their reminders scheduled. They are replaced with the single job
+        # whose id goes first, so that no reminder is sent twice.
+        job_ids = json.loads(interview['jobs'])
+        if len(job_ids) > 1:
+            await self.remove_jobs(job_ids[1:])
+            await Interview.update.values(jobs=json.dumps(job_ids[:1])).where(
+                Interview.id == interview_id).gino.status()
+
+        # The reminders are computed from the current start of the
+        # interview, so it doesn't matter when the interview was scheduled.
+        now = now or datetime.now()
+        self.schedule_next_reminder(interview['start'], interview_id, job_ids[0], now=now)
+        await self.flush()
+
+        due_dates = [scheduled_date for scheduled_date
+                     in self.get_scheduled_dates(interview['start']) if scheduled_date <= now]
+        if not due_dates or now - max(due_dates) > MISFIRE_GRACE_TIME:
+            return None
+
+        return Scheduler.make_interview_message(interview)
+
+    @staticmethod
+    def make_interview_message(interview):
+        """Returns the message reminding about the specified interview. The
+        start is rendered with the UTC offset it was received with.
+        """
+
+        start = interview['start']
+        if interview['start_offset'] is not None:
+            start = start.replace(tzinfo=timezone(timedelta(minutes=interview['start_offset'])))
+
+        return {
+            'type': 'interview',
+            'first_name': interview['first_name'],
+            'last_name': interview['last_name'],
+            'start': start.isoformat(timespec='seconds'),
+        }
 
     #
     # Functions to be invoked when the date comes
     # Note that the method should be static since pickle can't serialize self param.
     #
 
+    @staticmethod
+    async def _remind(kind, ref_id):
+        scheduler = Scheduler.current
+        if scheduler.lazy_reminders:
+            render = getattr(scheduler, 'advance_{}'.format(kind))
+        else:
+            render = getattr(scheduler, 'render_{}'.format(kind))
+
+        message = await render(ref_id)
+        if message is None:
+            logging.getLogger('tornado.application').info(
+                'Skipping the %s reminder about %s which does not exist or is late',
+                kind, ref_id)
+            return
+
+        # Redis is not asynchronous.
+        await IOLoop.current().run_in_executor(None, scheduler.publish_now, message)
+
+    # The reminders scheduled by the previous versions keep the message and
+    # invoke the method directly.
     @staticmethod
     def _notify_interview(message, redis_conn_args, channel_name):
         conn = FakeStrictRedis() if not redis_conn_args else StrictRedis(**redis_conn_args)
         conn.publish(channel_name, json.dumps(message))
 
+    # The candidates are removed by retention.RetentionSweeper now. The
+    # method is kept for the jobs scheduled by the previous versions.
     @staticmethod
     async def _remove_candidate(candidate_id):
         await Interview.delete.where(
             Interview.candidate == candidate_id).gino.status()
 
-        candidate = await Candidate.get(candidate_id)
-        await candidate.delete()
+        if UPCOMING.loaded:
+            UPCOMING.remove(candidate_id)
+
+        await Candidate.delete.where(Candidate.id == candidate_id).gino.status()
+        CANDIDATES.invalidate(candidate_id)
 
     #
     # Calculates dates to be used as triggers for scheduler jobs
@@ -134,14 +379,13 @@ class Scheduler:
         ) - timedelta(days=1)
         return an_hour_in_advance, morning_of_event_day, evening_before_event_day
 
-    @staticmethod
-    def get_day_after_fwd(fwd_date_string):
-        """Calculates the day after first working day from string. """
-
-        fwd_date = list(map(int, fwd_date_string.split('-')))
-        day_after_fwd = datetime(
-            year=fwd_date[0],
-            month=fwd_date[1],
-            day=fwd_date[2]
-        ) + timedelta(days=1)
-        return day_after_fwd
+    def get_job_ids(self):
+        """Generates the ids of the jobs reminding about the interview, so
+        that they can be saved along with the interview before the jobs are
+        scheduled. There is only one job in the lazy mode.
+        """
+
+        if self.lazy_reminders:
+            return [uuid4().hex]
+
+        return [uuid4().hex for _ in self.get_scheduled_dates(datetime.now())]
@@ -0,0 +1,114 @@
+""" In-memory index of the upcoming interviews """
+
+import bisect
+from datetime import datetime
+
+from .metrics import METRICS
+from .models import upcoming_candidates
+
+# Compares greater than any candidate id, so (start, LAST) follows all the
+# interviews starting at start.
+LAST = float('inf')
+
+
+class _Record:  # pylint: disable=too-few-public-methods
+    __slots__ = ('candidate', 'first_name', 'last_name', 'start')
+
+    def __init__(self, candidate, first_name, last_name, start):
+        self.candidate = candidate
+        self.first_name = first_name
+        self.last_name = last_name
+        self.start = start
+
+    def as_row(self):
+        """Returns the record in the form of the rows selected by
+        models.upcoming_candidates_query.
+        """
+
+        return {'id': self.candidate, 'first_name': self.first_name,
+                'last_name': self.last_name, 'start': self.start}
+
+
+class UpcomingInterviews:
+    """Class implementing the index of the upcoming interviews of the
+    candidates sorted by (start, candidate id). The index is loaded from the
+    database once and then kept up to date by the code changing the
+    interviews, so the lists of the candidates are answered without querying
+    the database. The interviews which have already started are evicted when
+    the index is read.
+
+    The index is local to the process, so it must not be used when several
+    server processes handle the webhooks.
+    """
+
+    def __init__(self):
+        self._candidates = {}
+        self._keys = []
+        self._records = []
+        self.loaded = False
+
+        METRICS.gauge('upcoming.size', lambda: len(self._keys))
+
+    async def load(self):
+        """Fills the index with the upcoming interviews from the database. """
+
+        self.clear()
+        for row in await upcoming_candidates(datetime.now()):
+            self.add(row['id'], row['first_name'], row['last_name'], row['start'])
+
+        self.loaded = True
+
+    def clear(self):
+        """Removes all the interviews from the index. """
+
+        self._candidates.clear()
+        self._keys = []
+        self._records = []
+
+    def add(self, candidate, first_name, last_name, start):
+        """Adds the interview of the candidate replacing the previous one. """
+
+        self.remove(candidate)
+
+        key = (start, candidate)
+        i = bisect.bisect_right(self._keys, key)
+        self._keys.insert(i, key)
+        self._records.insert(i, _Record(candidate, first_name, last_name, start))
+        self._candidates[candidate] = key
+
+    def remove(self, candidate):
+        """Removes the interview of the candidate if there is one. """
+
+        key = self._candidates.pop(candidate, None)
+        if key is None:
+            return
+
+        i = bisect.bisect_left(self._keys, key)
+        del self._keys[i]
+        del self._records[i]
+
+    def list(self, now, after=None, limit=None):
+        """Returns the interviews starting after now in the form of the rows
+        selected by models.upcoming_candidates_query. The list starts after
+        the specified (start, candidate id) pair.
+        """
+
+        self._evict(now)
+
+        i = bisect.bisect_right(self._keys, after) if after is not None else 0
+        j = len(self._records) if limit is None else i + limit
+        return [record.as_row() for record in self._records[i:j]]
+
+    def _evict(self, now):
+        expired = bisect.bisect_right(self._keys, (now, LAST))
+        if not expired:
+            return
+
+        for _, candidate in self._keys[:expired]:
+            del self._candidates[candidate]
+
+        del self._keys[:expired]
+        del self._records[:expired]
+
+
+UPCOMING = UpcomingInterviews()
@@ -0,0 +1,98 @@
+""" Writing the changes to the database behind the in-memory state """
+
+import asyncio
+import logging
+from collections import OrderedDict
+
+from tornado.ioloop import IOLoop
+
+from .metrics import METRICS
+
+
+class WriteBehind:
+    """Class implementing the write-behind queue of the changes of the
+    objects kept in memory. The latest change of an object replaces its
+    pending one, and the changes made one after another are written in one
+    batch by the persist coroutine, which accepts the OrderedDict of the
+    changes and whether everything must be cleared before applying them.
+
+    If the batch could not be written, its changes are queued again under
+    the ones made since then and are retried in retry_interval seconds, and
+    the flush() waiting for them raises the error.
+
+    The queue must be used only from the thread running the IOLoop.
+    """
+
+    def __init__(self, persist, name, retry_interval=1):
+        self._logger = logging.getLogger('tornado.application')
+        self._name = name
+        self._persist = persist
+        self._retry_interval = retry_interval
+
+        self._changes = OrderedDict()
+        self._clear = False
+        self._writing = None
+
+    def __len__(self):
+        return len(self._changes)
+
+    def change(self, key, value):
+        """Queues the change of the object. """
+
+        self._changes.pop(key, None)
+        self._changes[key] = value
+        self._start()
+
+    def clear(self):
+        """Drops the pending changes and queues clearing everything. """
+
+        self._changes.clear()
+        self._clear = True
+        self._start()
+
+    async def flush(self):
+        """Waits for the changes made so far to be written. Raises the error
+        if they could not be written.
+        """
+
+        while self._writing is not None or self._changes or self._clear:
+            self._start()
+            writing = self._writing
+            error = await asyncio.shield(writing)
+            if error is not None:
+                raise error
+
+    def _start(self):
+        if self._writing is None and (self._changes or self._clear):
+            self._writing = asyncio.ensure_future(self._write())
+
+    async def _write(self):
+        try:
+            while self._changes or self._clear:
+                changes, self._changes = self._changes, OrderedDict()
+                clear, self._clear = self._clear, False
+
+                try:
+                    await self._persist(changes, clear)
+                except Exception as exc:  # pylint: disable=broad-except
+                    METRICS.incr('{}.errors'.format(self._name))
+                    self._logger.exception('Unable to save %s changes of the %s',
+                                           len(changes), self._name)
+                    self._requeue(changes, clear)
+                    return exc
+
+                METRICS.incr('{}.writes'.format(self._name))
+        finally:
+            self._writing = None
+
+        return None
+
+    def _requeue(self, changes, clear):
+        # The changes made since the batch was taken are newer, and the
+        # clearing made since then drops the batch altogether.
+        if not self._clear:
+            changes.update(self._changes)
+            self._changes = changes
+            self._clear = clear
+
+        IOLoop.current().call_later(self._retry_interval, self._start)
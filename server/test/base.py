@@ -0,0 +1,127 @@
+# Copyright 2019 Evgeny Golyshev. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Module containing the base class of the huntflow-reloaded server tests. """
+
+from datetime import date, timedelta
+
+import subprocess
+# Tests are running synchronously so we have to use sqlalchemy instead of gino.
+import sqlalchemy as sa
+import testing.postgresql
+from tornado.ioloop import IOLoop
+from tornado.testing import AsyncHTTPTestCase
+from tornado.web import Application
+
+from huntflow_reloaded import scheduler
+from huntflow_reloaded.models import Candidate, Interview, User, WebhookDelivery
+from huntflow_reloaded.pool import Pool
+
+
+ACCOUNT = """
+    "account": {
+        "id": 1,
+        "name": "Noname"
+    }
+"""
+
+CREATED_DATE = "1989-12-17T00:00:00+00:00"
+
+POSTGRES_URL = "postgresql://postgres:@localhost:5432/test"
+
+# Postgres is restarted for each test, so the pool is closed after each test
+# and is opened again by the first request of the next one.
+POOL = Pool(POSTGRES_URL, min_size=1, max_size=10)
+
+def compose(req, count=2):
+    """Fills the stubs with relevant data to be sent to the server. """
+
+    current_date = date.today()
+    interview_date = current_date + timedelta(days=count)
+    start_date = "{year}-{month}-{day}T12:00:00+03:00".format(
+        year=interview_date.year,
+        month=interview_date.month,
+        day=interview_date.day
+    )
+    employment_date = "{year}-{month}-{day}".format(year=current_date.year,
+                                                    month=current_date.month,
+                                                    day=current_date.day)
+    return (req.replace('%ACCOUNT%', ACCOUNT)
+            .replace('%CREATED_DATE%', CREATED_DATE)
+            .replace('%START_DATE%', start_date)
+            .replace('%EMPLOYMENT_DATE%', employment_date))
+
+
+class WebTestCase(AsyncHTTPTestCase):
+    """Base class for web tests that also supports WSGI mode.
+
+    Override get_handlers and get_app_kwargs instead of get_app.
+    Append to wsgi_safe to have it run in wsgi_test as well.
+    Override get_new_ioloop to avoid creating a new loop for each test case.
+    The code was borrowed from the original Tornado tests.
+    """
+
+    def get_app(self):
+        self.app = Application(self.get_handlers(), **self.get_app_kwargs())
+        return self.app
+
+    def setUp(self):
+        self._mock_postgres = testing.postgresql.Postgresql(port=5432)
+
+        command = 'server/alembic/migrate.sh ' + POSTGRES_URL
+        subprocess.Popen(command, shell=True).wait()
+
+        engine = sa.create_engine(POSTGRES_URL)
+        self.conn = engine.connect()
+
+        scheduler_args = {
+            'postgres_url': POSTGRES_URL,
+            'redis_args': '',
+            'channel_name': 'stub',
+        }
+
+        # The scheduler is started before the application is created, so
+        # that get_handlers() passes it to the handlers.
+        self.test_scheduler = scheduler.Scheduler(**scheduler_args)
+        self.test_scheduler.make()
+
+        super(WebTestCase, self).setUp()
+
+    def get_handlers(self):
+        """Redefines buildin method. """
+
+        raise NotImplementedError()
+
+    def get_app_kwargs(self):  # pylint: disable=no-self-use
+        """Redefines buildin method. """
+
+        return {}
+
+    def get_new_ioloop(self):
+        return IOLoop.current()
+
+    def tearDown(self):
+        super(WebTestCase, self).tearDown()
+
+        self.test_scheduler.shutdown()
+
+        self.io_loop.run_sync(POOL.close)
+
+        for table in (Interview, Candidate, User, WebhookDelivery):
+            self.conn.execute(table.delete)
+        text = sa.sql.text('DELETE FROM apscheduler_jobs')
+        self.conn.execute(text)
+
+        self.conn.close()
+        self._mock_postgres.stop()
@@ -14,129 +14,49 @@
 
 """Module containing the huntflow-reloaded server tests. """
 
-from datetime import date, timedelta
+import contextlib
+from datetime import date, datetime, timedelta
+import functools
 import json
 import pickle
 import time
 
-import subprocess
-# Tests are running synchronously so we have to use sqlalchemy instead of gino.
+from apscheduler.events import EVENT_JOB_REMOVED
+from asyncpg.connection import Connection
 import sqlalchemy as sa
-import testing.postgresql
-from tornado.ioloop import IOLoop
-from tornado.testing import AsyncHTTPTestCase
-from tornado.web import Application
-
-from huntflow_reloaded import handler, scheduler
-from huntflow_reloaded.models import Candidate, Interview, User
+from tornado import gen
+
+from huntflow_reloaded import events, handler
+from huntflow_reloaded.batching import WriteBatcher
+from huntflow_reloaded.cache import CANDIDATES
+from huntflow_reloaded.locks import ADVISORY_NAMESPACE, CandidateLocks
+from huntflow_reloaded.metrics import METRICS
+from huntflow_reloaded.models import DB, Candidate, Interview, User, insert_candidates
+from huntflow_reloaded.partitions import (FOREIGN_KEYS, add_months, archive_partitions,
+                                          create_partition, list_partitions, partition_name)
+from huntflow_reloaded.pool import Replicas
+from huntflow_reloaded.retention import RetentionSweeper
 from huntflow_reloaded.tokens import Token
 from . import stubs
+from .base import CREATED_DATE, POOL, POSTGRES_URL, WebTestCase, compose
 
 
-ACCOUNT = """
-    "account": {
-        "id": 1,
-        "name": "Noname"
-    }
-"""
-
-CREATED_DATE = "1989-12-17T00:00:00+00:00"
-
-POSTGRES_URL = "postgresql://postgres:@localhost:5432/test"
-
-def compose(req, count=2):
-    """Fills the stubs with relevant data to be sent to the server. """
-
-    current_date = date.today()
-    interview_date = current_date + timedelta(days=count)
-    start_date = "{year}-{month}-{day}T12:00:00+03:00".format(
-        year=interview_date.year,
-        month=interview_date.month,
-        day=interview_date.day
-    )
-    employment_date = "{year}-{month}-{day}".format(year=current_date.year,
-                                                    month=current_date.month,
-                                                    day=current_date.day)
-    return (req.replace('%ACCOUNT%', ACCOUNT)
-            .replace('%CREATED_DATE%', CREATED_DATE)
-            .replace('%START_DATE%', start_date)
-            .replace('%EMPLOYMENT_DATE%', employment_date))
-
-
-class WebTestCase(AsyncHTTPTestCase):
-    """Base class for web tests that also supports WSGI mode.
-
-    Override get_handlers and get_app_kwargs instead of get_app.
-    Append to wsgi_safe to have it run in wsgi_test as well.
-    Override get_new_ioloop to avoid creating a new loop for each test case.
-    The code was borrowed from the original Tornado tests.
-    """
-
-    def get_app(self):
-        self.app = Application(self.get_handlers(), **self.get_app_kwargs())
-        return self.app
-
-    def setUp(self):
-        super(WebTestCase, self).setUp()
-        self._mock_postgres = testing.postgresql.Postgresql(port=5432)
-
-        command = 'server/alembic/migrate.sh ' + POSTGRES_URL
-        subprocess.Popen(command, shell=True).wait()
-
-        engine = sa.create_engine(POSTGRES_URL)
-        self.conn = engine.connect()
-
-        scheduler_args = {
-            'postgres_url': POSTGRES_URL,
-            'redis_args': '',
-            'channel_name': 'stub',
-        }
-
-        self.test_scheduler = scheduler.Scheduler(**scheduler_args)
-        self.test_scheduler.make()
-
-    def get_handlers(self):
-        """Redefines buildin method. """
-
-        raise NotImplementedError()
-
-    def get_app_kwargs(self):  # pylint: disable=no-self-use
-        """Redefines buildin method. """
-
-        return {}
-
-    def get_new_ioloop(self):
-        return IOLoop.current()
-
-    def tearDown(self):
-        super(WebTestCase, self).tearDown()
-
-        for table in (Interview, Candidate, User):
-            self.conn.execute(table.delete)
-        text = sa.sql.text('DELETE FROM apscheduler_jobs')
-        self.conn.execute(text)
-
-        self.conn.close()
-        self._mock_postgres.stop()
-
 class HuntflowWebhookHandlerTest(WebTestCase):
     """Class for testing Huntflow webhooks handling. """
 
     def get_handlers(self):
-        scheduler_args = {
-            'postgres_url': POSTGRES_URL,
-            'redis_args': '',
-            'channel_name': 'stub',
-        }
-        self.test_scheduler = scheduler.Scheduler(**scheduler_args)  # pylint: disable=attribute-defined-outside-init
-        self.test_scheduler.make()
-
         app_args = {
             'scheduler': self.test_scheduler,
-            'postgres_url': POSTGRES_URL,
+            'pool': POOL,
+            'locks': CandidateLocks(),
         }
+
         return [
             ('/hf', handler.HuntflowWebhookHandler, app_args),
+            ('/hf/batched', handler.HuntflowWebhookHandler,
+             dict(app_args, writer=WriteBatcher(window=0.01))),
+            ('/hf/limited', handler.HuntflowWebhookHandler,
+             dict(app_args, max_body_size=128)),
         ]
 
     def test_broken_request(self):
@@ -147,6 +67,18 @@ class HuntflowWebhookHandlerTest(WebTestCase):
         self.assertEqual(response.body, b'Could not decode request body. '
                                         b'There must be valid JSON')
 
+    def test_too_large_request(self):
+        """Check if the request with the body exceeding the limit is rejected
+        before it's read.
+        """
+
+        body = compose(stubs.INTERVIEW_REQUEST)
+        response = self.fetch('/hf/limited', body=body, method='POST')
+        self.assertEqual(response.code, 413)
+
+        to_be_executed = sa.sql.select([Interview])
+        self.assertEqual(self.conn.execute(to_be_executed).fetchall(), [])
+
     def test_request_with_undefined_type(self):
         """Check if it is not possible to send the request with underfined body type. """
 
@@ -209,8 +141,8 @@ class HuntflowWebhookHandlerTest(WebTestCase):
         row = result.fetchone()
         result.close()
 
-        interview_start = handler.get_date_from_string(calendar_event['start'])
-        interview_end = handler.get_date_from_string(calendar_event['end'])
+        interview_start = events.get_date_from_string(calendar_event['start'])
+        interview_end = events.get_date_from_string(calendar_event['end'])
 
         self.assertEqual(row[Interview.start], interview_start)
         self.assertEqual(row[Interview.end], interview_end)
@@ -251,8 +183,8 @@ class HuntflowWebhookHandlerTest(WebTestCase):
 
         row = result[0]
 
-        interview_start = handler.get_date_from_string(calendar_event['start'])
-        interview_end = handler.get_date_from_string(calendar_event['end'])
+        interview_start = events.get_date_from_string(calendar_event['start'])
+        interview_end = events.get_date_from_string(calendar_event['end'])
 
         self.assertEqual(row[Interview.start], interview_start)
         self.assertEqual(row[Interview.end], interview_end)
@@ -261,6 +193,7 @@ class HuntflowWebhookHandlerTest(WebTestCase):
         to_be_executed = sa.sql.text(
             'SELECT job_state FROM apscheduler_jobs ORDER BY next_run_time')
         result = self.conn.execute(to_be_executed).fetchall()
+        self.assertEqual(len(result), 3)
 
         date_tuple = self.test_scheduler.get_scheduled_dates(interview_start)
 
@@ -268,6 +201,184 @@ class HuntflowWebhookHandlerTest(WebTestCase):
             job_state = pickle.loads(row[0])
             self.assertEqual(job_state.get('next_run_time').replace(tzinfo=None), exp_datetime)
 
+    def test_removing_jobs(self):
+        """Check if the jobs are removed from the jobstore in one go and the
+        listeners are notified about each of them.
+        """
+
+        response = self.fetch('/hf', body=compose(stubs.INTERVIEW_REQUEST), method='POST')
+        self.assertEqual(response.code, 200)
+
+        jobs = json.loads(self.conn.execute(sa.sql.select([Interview.jobs])).scalar())
+        self.assertEqual(len(jobs), 3)
+
+        removed = []
+        self.test_scheduler.scheduler.add_listener(lambda event: removed.append(event.job_id),
+                                                   EVENT_JOB_REMOVED)
+        self.assertEqual(self.io_loop.run_sync(
+            functools.partial(self.test_scheduler.remove_jobs, jobs + ['missing'])), 3)
+        self.assertEqual(sorted(removed), sorted(jobs))
+
+        to_be_executed = sa.sql.text('SELECT id FROM apscheduler_jobs')
+        self.assertEqual(self.conn.execute(to_be_executed).fetchall(), [])
+
+    def test_unchanged_interview(self):
+        """Check if the interview is not rescheduled when the webhook doesn't
+        change its start, end or type.
+        """
+
+        body = compose(stubs.INTERVIEW_REQUEST)
+        response = self.fetch('/hf', body=body, method='POST')
+        self.assertEqual(response.code, 200)
+
+        text = sa.sql.text('SELECT id FROM apscheduler_jobs ORDER BY id')
+        jobs = self.conn.execute(text).fetchall()
+
+        to_be_executed = sa.sql.select([Interview.id]).where(Interview.candidate == 1)
+        interviews = self.conn.execute(to_be_executed).fetchall()
+
+        unchanged_events = METRICS.snapshot().get('webhook.unchanged_events', 0)
+
+        body = body.replace(CREATED_DATE, '1990-01-01T00:00:00+00:00')
+        response = self.fetch('/hf', body=body, method='POST')
+        self.assertEqual(response.code, 200)
+        self.assertEqual(response.body, b'')
+
+        self.assertEqual(self.conn.execute(text).fetchall(), jobs)
+        self.assertEqual(self.conn.execute(to_be_executed).fetchall(), interviews)
+        self.assertEqual(METRICS.snapshot()['webhook.unchanged_events'],
+                         unchanged_events + 1)
+
+    def test_concurrent_requests(self):
+        """Check if the concurrent webhooks of the same candidate don't leave
+        several interviews or orphaned reminders.
+        """
+
+        bodies = [compose(stubs.INTERVIEW_REQUEST),
+                  compose(stubs.INTERVIEW_REQUEST, count=5)]
+        requests = [self.http_client.fetch(self.get_url('/hf'), method='POST', body=body)
+                    for body in bodies]
+        responses = self.io_loop.run_sync(lambda: gen.multi(requests))
+        self.assertEqual([response.code for response in responses], [200, 200])
+
+        to_be_executed = sa.sql.select([Interview]).where(Interview.candidate == 1)
+        interviews = self.conn.execute(to_be_executed).fetchall()
+        self.assertEqual(len(interviews), 1)
+
+        text = sa.sql.text('SELECT id FROM apscheduler_jobs')
+        jobs = [row[0] for row in self.conn.execute(text).fetchall()]
+        self.assertEqual(sorted(jobs), sorted(json.loads(interviews[0].jobs)))
+
+    def test_advisory_locks(self):
+        """Check if the changes made under the advisory lock of the
+        candidate are committed while the lock is still held, and the lock
+        is released afterwards.
+        """
+
+        self.io_loop.run_sync(POOL.open)
+
+        locks = CandidateLocks(advisory=True)
+        count_locks = sa.sql.text(
+            "SELECT count(*) FROM pg_locks "
+            "WHERE locktype = 'advisory' AND classid = :namespace AND objid = 1") \
+            .bindparams(namespace=ADVISORY_NAMESPACE).execution_options(autocommit=True)
+        count_candidates = sa.sql.select([sa.func.count()]) \
+            .select_from(Candidate.__table__).execution_options(autocommit=True)
+
+        async def write_under_lock():
+            async with locks(1):
+                async with DB.transaction():
+                    await insert_candidates([{'id': 1, 'first_name': 'Matt',
+                                              'last_name': 'Groening'}])
+
+                return (self.conn.execute(count_candidates).scalar(),
+                        self.conn.execute(count_locks).scalar())
+
+        self.assertEqual(self.io_loop.run_sync(write_under_lock), (1, 1))
+        self.assertEqual(self.conn.execute(count_locks).scalar(), 0)
+
+    def test_group_commit(self):
+        """Check if the interviews saved by the concurrent webhooks are
+        saved in one transaction.
+        """
+
+        batches = METRICS.snapshot().get('batching.batch', {'count': 0})['count']
+
+        bodies = [compose(stubs.INTERVIEW_REQUEST),
+                  compose(stubs.INTERVIEW_REQUEST).replace('"id": 1', '"id": 2')]
+        requests = [self.http_client.fetch(self.get_url('/hf/batched'), method='POST', body=body)
+                    for body in bodies]
+        responses = self.io_loop.run_sync(lambda: gen.multi(requests))
+        self.assertEqual([response.code for response in responses], [200, 200])
+
+        to_be_executed = sa.sql.select([Interview.candidate]).order_by(Interview.candidate)
+        self.assertEqual(self.conn.execute(to_be_executed).fetchall(), [(1, ), (2, )])
+        self.assertEqual(METRICS.snapshot()['batching.batch']['count'], batches + 1)
+
+    def test_group_commit_of_same_candidate(self):
+        """Check if the interviews of the same candidate saved in one batch are
+        saved one after another.
+        """
+
+        self.io_loop.run_sync(POOL.open)
+
+        batcher = WriteBatcher(window=0.01)
+        start = datetime(2030, 1, 5, 12)
+        values = [{'candidate': candidate, 'first_name': 'Matt', 'last_name': 'Groening',
+                   'type': 'STATUS', 'created': datetime.now(),
+                   'start': start + timedelta(days=day),
+                   'end': start + timedelta(days=day, hours=1), 'start_offset': 180,
+                   'jobs': json.dumps(['job-{}-{}'.format(candidate, day)])}
+                  for candidate, day in ((1, 0), (2, 0), (1, 1))]
+
+        results = self.io_loop.run_sync(lambda: gen.multi(
+            [batcher.upsert_interview(**row) for row in values]))
+        self.assertEqual([(result['existed'], result['changed']) for result in results],
+                         [(False, True), (False, True), (True, True)])
+        self.assertEqual(results[2]['id'], results[0]['id'])
+        self.assertEqual(json.loads(results[2]['previous_jobs']), ['job-1-0'])
+
+        to_be_executed = sa.sql.select([Interview.candidate, Interview.start]) \
+            .order_by(Interview.candidate)
+        self.assertEqual(self.conn.execute(to_be_executed).fetchall(),
+                         [(1, start + timedelta(days=1)), (2, start)])
+
+    def test_pool_statistics(self):
+        """Check if the connections are returned to the pool and counted as
+        idle.
+        """
+
+        response = self.fetch('/hf', body=compose(stubs.INTERVIEW_REQUEST), method='POST')
+        self.assertEqual(response.code, 200)
+
+        stats = POOL.stats()
+        self.assertGreaterEqual(stats['size'], 1)
+        self.assertEqual(stats['in_use'], 0)
+        self.assertEqual(stats['idle'], stats['size'])
+        self.assertEqual(METRICS.snapshot()['pool.in_use'], 0)
+
+    def test_candidate_cache(self):
+        """Check if the cached miss is forgotten when the candidate is created
+        by the webhook and the candidate is then served from the cache.
+        """
+
+        self.io_loop.run_sync(POOL.open)
+
+        CANDIDATES.configure(maxsize=100, ttl=60, cache_misses=True)
+        try:
+            lookup = functools.partial(CANDIDATES.get_by_name, 'Matt', 'Groening')
+            self.assertIsNone(self.io_loop.run_sync(lookup))
+
+            response = self.fetch('/hf', body=compose(stubs.INTERVIEW_REQUEST), method='POST')
+            self.assertEqual(response.code, 200)
+
+            hits = METRICS.snapshot().get('candidate_cache.hits', 0)
+            self.assertEqual(self.io_loop.run_sync(lookup)['id'], 1)
+            self.assertEqual(self.io_loop.run_sync(lookup)['id'], 1)
+            self.assertEqual(METRICS.snapshot()['candidate_cache.hits'], hits + 1)
+        finally:
+            CANDIDATES.configure(maxsize=0, ttl=60)
+
     def test_missing_calendar_event_item(self):
         """Check if it is not possible to send the request with missing calendar_event item. """
 
@@ -279,8 +390,9 @@ class HuntflowWebhookHandlerTest(WebTestCase):
 
     def test_handling_employment_date_request(self):
         """Check if it is possible to handle correctly request with employment_date item:
-        - setting scheduler for removing candidate and relevant interview
-          in a day after his/her wirst working day
+        - setting the first working day without scheduling any jobs
+        - removing the candidate and relevant interview by the retention sweeper
+          in a day after his/her first working day
         """
 
         body = compose(stubs.INTERVIEW_REQUEST)
@@ -307,37 +419,89 @@ class HuntflowWebhookHandlerTest(WebTestCase):
 
         to_be_executed = sa.sql.text('SELECT job_state FROM apscheduler_jobs')
         result = self.conn.execute(to_be_executed).fetchall()
-        self.assertEqual(len(result), 1)
+        self.assertEqual(len(result), 0)
 
-        for row in result:
-            job_state = pickle.loads(row[0])
+        fwd_date = datetime.strptime(
+            json.loads(body)['event']['employment_date'], '%Y-%m-%d').date()
+        sweeper = RetentionSweeper(batch_size=1)
+
+        purged = self.io_loop.run_sync(functools.partial(sweeper.sweep, today=fwd_date))
+        self.assertEqual(purged, {'candidates': 0, 'interviews': 0})
+
+        purged = self.io_loop.run_sync(
+            functools.partial(sweeper.sweep, today=fwd_date + timedelta(days=1)))
+        self.assertEqual(purged, {'candidates': 1, 'interviews': 1})
+
+        to_be_executed = sa.sql.select([Candidate]).where(Candidate.id == candidate_id)
+        self.assertEqual(self.conn.execute(to_be_executed).fetchall(), [])
+
+    def test_archiving_partitions(self):
+        """Check if the interviews are kept in the monthly partitions:
+        - moving the interviews from the default partition to the created one
+        - detaching the partitions preceding the horizon
+        """
+
+        response = self.fetch('/hf', body=compose(stubs.INTERVIEW_REQUEST), method='POST')
+        self.assertEqual(response.code, 200)
+
+        month = add_months(date.today(), -24)
+        self.conn.execute(Interview.__table__.insert().values(
+            candidate=None, type='STATUS', start=datetime(month.year, month.month, 15)))
+
+        name = partition_name(month)
+        self.assertNotIn(name, self.io_loop.run_sync(list_partitions))
+        self.assertTrue(self.io_loop.run_sync(functools.partial(create_partition, month)))
+        self.assertFalse(self.io_loop.run_sync(functools.partial(create_partition, month)))
+
+        # The transaction is committed right away, so that the partition is
+        # not locked when it's detached.
+        to_be_executed = sa.sql.text('SELECT count(*) FROM {}'.format(name)) \
+            .execution_options(autocommit=True)
+        self.assertEqual(self.conn.execute(to_be_executed).scalar(), 1)
+
+        archived = self.io_loop.run_sync(
+            functools.partial(archive_partitions, add_months(date.today(), -12)))
+        self.assertEqual(archived, [name])
+        self.assertNotIn(name, self.io_loop.run_sync(list_partitions))
 
-        fwd_date = json.loads(body)['event']['employment_date']
-        exp_datetime = self.test_scheduler.get_day_after_fwd(fwd_date)
+        to_be_executed = sa.sql.text(FOREIGN_KEYS.format(name))
+        self.assertEqual(self.conn.execute(to_be_executed).fetchall(), [])
 
-        self.assertEqual(
-            job_state.get('next_run_time').replace(tzinfo=None), exp_datetime)
+        to_be_executed = sa.sql.select([Interview])
+        self.assertEqual(len(self.conn.execute(to_be_executed).fetchall()), 1)
+
+
+@contextlib.contextmanager
+def counting_queries():
+    """Collects the statements sent to the database while the block runs.
+    Both the GINO queries and the prepared statements of
+    huntflow_reloaded.queries are executed by asyncpg the same way.
+    """
+
+    statements = []
+    do_execute = Connection._do_execute  # pylint: disable=protected-access
+
+    async def counting_execute(self, query, *args, **kwargs):
+        statements.append(query)
+        return await do_execute(self, query, *args, **kwargs)
+
+    Connection._do_execute = counting_execute  # pylint: disable=protected-access
+    try:
+        yield statements
+    finally:
+        Connection._do_execute = do_execute  # pylint: disable=protected-access
 
 
 class ManageEndpointHandlerTest(WebTestCase):
     """Class for testing API of the /manage endpoint. """
 
     def get_handlers(self):
-        scheduler_args = {
-            'postgres_url': POSTGRES_URL,
-            'redis_args': '',
-            'channel_name': 'stub',
-        }
-
-        self.test_scheduler = scheduler.Scheduler(**scheduler_args)  # pylint: disable=attribute-defined-outside-init
-        self.test_scheduler.make()
-
         app_args = {
-            'postgres_url': POSTGRES_URL,
+            'pool': POOL,
             'scheduler': self.test_scheduler,
         }
 
-        db_args = {'postgres_url': POSTGRES_URL}
+        db_args = {'pool': POOL}
 
         return [
             ('/hf', handler.HuntflowWebhookHandler, app_args),
@@ -518,6 +682,83 @@ class ManageEndpointHandlerTest(WebTestCase):
 
         self.assertFalse(interview)
 
+    def test_paginated_list(self):
+        """Test the pagination and the streaming of the list of candidates
+        who have non-expired interviews.
+        """
+
+        self.send_status_request(compose(stubs.INTERVIEW_REQUEST, count=3))
+        self.send_status_request(compose(stubs.INTERVIEW_REQUEST, count=2)
+                                 .replace('"id": 1', '"id": 2')
+                                 .replace('Groening', 'Simpson'))
+
+        to_be_executed = User.insert().values(email='admin@mail.com', password='pass') # pylint: disable=no-member
+        self.conn.execute(to_be_executed)
+        self.access_token = json.loads(self.get_tokens().body).get('access')  # pylint: disable=attribute-defined-outside-init
+
+        url = '/manage/list/?access={}&limit=1'.format(self.access_token)
+
+        names = []
+        cursor = None
+        for _ in range(3):
+            response = self.fetch(url + ('&cursor=' + cursor if cursor else ''), method='GET')
+            self.assertEqual(response.code, 200)
+            page = json.loads(response.body)
+            names.extend(user['last_name'] for user in page['users'])
+            cursor = page['next']
+
+        # The nearest interview goes first.
+        self.assertEqual(names, ['Simpson', 'Groening'])
+        self.assertIsNone(cursor)
+
+        response = self.fetch('/manage/list/?access={}&stream=1'.format(self.access_token),
+                              method='GET')
+        self.assertEqual(response.code, 200)
+        self.assertEqual(response.headers['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in response.body.decode('utf8').splitlines()]
+        self.assertEqual([row['last_name'] for row in rows], ['Simpson', 'Groening'])
+
+        response = self.fetch(url + '&cursor=broken', method='GET')
+        self.assertEqual(response.code, 400)
+        self.assertEqual(json.loads(response.body)['code'], 'invalid_page')
+
+    def test_list_queries(self):
+        """Check if the list of candidates who have non-expired interviews
+        costs a single query regardless of the number of the candidates.
+        """
+
+        to_be_executed = User.insert().values(email='admin@mail.com', password='pass') # pylint: disable=no-member
+        self.conn.execute(to_be_executed)
+        self.access_token = json.loads(self.get_tokens().body).get('access')  # pylint: disable=attribute-defined-outside-init
+
+        listed = []
+        for candidate, last_name in ((1, 'Groening'), (2, 'Simpson'), (3, 'Flanders')):
+            self.send_status_request(compose(stubs.INTERVIEW_REQUEST)
+                                     .replace('"id": 1', '"id": {}'.format(candidate))
+                                     .replace('Groening', last_name))
+
+            with counting_queries() as statements:
+                response = self.get_users_list()
+            self.assertEqual(response.code, 200)
+            listed.append((json.loads(response.body)['total'], len(statements)))
+
+        self.assertEqual(listed, [(1, 1), (2, 1), (3, 1)])
+
+    def test_replica_fallback(self):
+        """Check if the primary is read from when the replica is not
+        replicating anything.
+        """
+
+        # The test database is not a replica, so it can't report the lag.
+        replicas = Replicas([POSTGRES_URL], min_size=1, max_size=1)
+        self.io_loop.run_sync(replicas.open)
+        try:
+            fallbacks = METRICS.snapshot().get('replicas.fallbacks', 0)
+            self.assertIs(self.io_loop.run_sync(replicas.choose), DB)
+            self.assertEqual(METRICS.snapshot()['replicas.fallbacks'], fallbacks + 1)
+        finally:
+            self.io_loop.run_sync(replicas.close)
+
     def test_invalid_deleting_of_interview(self):
         """Check error messages and codes in case of:
         - attempt to delete the interview of non-existed candidate
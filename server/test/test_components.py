@@ -0,0 +1,276 @@
+# Copyright 2019 Evgeny Golyshev. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Module containing the tests of the components used by the handlers. """
+
+import asyncio
+from datetime import datetime, timedelta
+import json
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from tornado.ioloop import IOLoop
+from tornado.testing import AsyncTestCase, gen_test
+
+from huntflow_reloaded import events
+from huntflow_reloaded.journal import Journal
+from huntflow_reloaded.upcoming import UpcomingInterviews
+from huntflow_reloaded.writebehind import WriteBehind
+from . import stubs
+from .base import compose
+
+
+class WebhookEventTest(AsyncTestCase):
+    """Class for testing the dispatching of the webhook events. """
+
+    def get_new_ioloop(self):
+        return IOLoop.current()
+
+    @gen_test
+    async def test_registering_event_type(self):
+        """Check if it's possible to register the handler of a new event type
+        without affecting the parent class.
+        """
+
+        class CustomEvent(events.WebhookEvent):  # pylint: disable=too-few-public-methods
+            """Event class extended with a custom type. """
+
+        handled = []
+
+        @CustomEvent.register_type('CUSTOM')
+        async def custom_type_handler(event):  # pylint: disable=unused-variable
+            handled.append(event)
+
+        event = CustomEvent({'event': {'type': 'CUSTOM'}}, None, publish=handled.append)
+        event.classify()
+        await event.process()
+
+        self.assertEqual(handled, [event])
+
+        event = events.WebhookEvent({'event': {'type': 'CUSTOM'}}, None,
+                                     publish=handled.append)
+        with self.assertRaises(events.UnknownType):
+            event.classify()
+
+    def test_extracting_fields(self):
+        """Check if only the fields used by the handlers are kept. """
+
+        decoded_body = json.loads(compose(stubs.INTERVIEW_REQUEST))
+        decoded_body['event']['applicant']['resume'] = 'x' * 1024
+        decoded_body['event']['calendar_event']['attendees'] = []
+
+        extracted = events.WebhookEvent.extract(decoded_body)
+        self.assertNotIn('account', extracted)
+        self.assertEqual(sorted(extracted['event']['applicant']),
+                         ['first_name', 'id', 'last_name'])
+        self.assertEqual(sorted(extracted['event']['calendar_event']), ['end', 'start'])
+        self.assertEqual(events.WebhookEvent.extract([]), [])
+
+    def test_parsing_dates(self):
+        """Check if the dates are parsed in the local time of Huntflow along
+        with their UTC offsets.
+        """
+
+        self.assertEqual(events.get_date_from_string('2019-1-5T12:00:00+03:00'),
+                         datetime(2019, 1, 5, 12))
+        self.assertEqual(events.get_utc_offset_from_string('2019-01-05T12:00:00+03:00'), 180)
+        self.assertEqual(events.get_utc_offset_from_string('2019-01-05T12:00:00-05:30'), -330)
+
+
+class JournalTest(AsyncTestCase):
+    """Class for testing the journal of the accepted webhooks. """
+
+    def get_new_ioloop(self):
+        return IOLoop.current()
+
+    @gen_test
+    async def test_unfinished_entries(self):
+        """Check if the entries which were not marked as done are returned
+        after reopening the journal, and the fully processed segments are
+        removed.
+        """
+
+        with tempfile.TemporaryDirectory() as path:
+            journal = Journal(path, segment_size=1)
+            self.assertEqual(journal.open(), [])
+
+            bodies = [compose(stubs.INTERVIEW_REQUEST).encode('utf8'),
+                      compose(stubs.FWD_REQUEST).encode('utf8')]
+
+            first_id = await journal.append(bodies[0])
+            second_id = await journal.append(bodies[1])
+            journal.mark_done(first_id)
+            await journal.close()
+
+            journal = Journal(path, use_mmap=True)
+            self.assertEqual(journal.open(), [(second_id, bodies[1])])
+
+            journal.mark_done(second_id)
+            await journal.close()
+
+            journal = Journal(path)
+            self.assertEqual(journal.open(), [])
+            await journal.close()
+
+
+    @gen_test
+    async def test_marks_in_old_segments(self):
+        """Check if the entry marked as done after its segment has been
+        rotated is not replayed once the following segments are removed.
+        """
+
+        with tempfile.TemporaryDirectory() as path:
+            journal = Journal(path, segment_size=1)
+            journal.open()
+
+            bodies = [compose(stubs.INTERVIEW_REQUEST).encode('utf8'),
+                      compose(stubs.FWD_REQUEST).encode('utf8')]
+
+            # Both entries are flushed at once, so they share the segment.
+            first_id, second_id = await asyncio.gather(journal.append(bodies[0]),
+                                                       journal.append(bodies[1]))
+            journal.mark_done(first_id)
+
+            third_id = await journal.append(bodies[0])
+            journal.mark_done(third_id)
+            await journal.close()
+
+            journal = Journal(path)
+            self.assertEqual(journal.open(), [(second_id, bodies[1])])
+            await journal.close()
+
+    @gen_test
+    async def test_failed_flush(self):
+        """Check if the writers waiting for the flush which failed get the
+        error, and the journal keeps flushing.
+        """
+
+        with tempfile.TemporaryDirectory() as path:
+            journal = Journal(path)
+            journal.open()
+
+            appending = asyncio.ensure_future(journal.append(b'{}'))
+            await asyncio.sleep(0)
+            os.close(journal._fd)  # pylint: disable=protected-access
+
+            with self.assertRaises(OSError):
+                await appending
+
+            flusher = journal._flusher  # pylint: disable=protected-access
+            self.assertFalse(flusher.done())
+            flusher.cancel()
+
+    @gen_test
+    async def test_append_during_rotation(self):
+        """Check if the entry appended while the segment is being flushed
+        and then rotated is flushed in the segment it has been written to.
+        """
+
+        with tempfile.TemporaryDirectory() as path:
+            journal = Journal(path, segment_size=1)
+            journal.open()
+
+            flushed = []
+            resume = threading.Event()
+
+            def fsync(fd):
+                flushed.append(fd)
+                if len(flushed) == 1:
+                    resume.wait(5)
+
+            with mock.patch('os.fsync', fsync):
+                first = asyncio.ensure_future(journal.append(b'{}'))
+                while not flushed:
+                    await asyncio.sleep(0.001)
+
+                # The first fsync is running, so the entry goes to the same
+                # segment, which is rotated once the fsync is finished.
+                segment_fd = journal._fd  # pylint: disable=protected-access
+                second = asyncio.ensure_future(journal.append(b'{}'))
+                await asyncio.sleep(0)
+                resume.set()
+                await asyncio.gather(first, second)
+
+                self.assertNotEqual(journal._fd, segment_fd)  # pylint: disable=protected-access
+                self.assertEqual(flushed, [segment_fd, segment_fd])
+                await journal.close()
+
+
+class UpcomingInterviewsTest(unittest.TestCase):
+    """Class for testing the in-memory index of the upcoming interviews. """
+
+    def test_index(self):
+        """Check if the index keeps one interview per candidate ordered by
+        start and evicts the interviews which have started.
+        """
+
+        now = datetime(2019, 1, 1, 12)
+        index = UpcomingInterviews()
+        index.add(1, 'Matt', 'Groening', now + timedelta(hours=2))
+        index.add(2, 'Homer', 'Simpson', now + timedelta(hours=1))
+        index.add(3, 'Marge', 'Simpson', now - timedelta(hours=1))
+        index.add(1, 'Matt', 'Groening', now + timedelta(hours=3))
+
+        rows = index.list(now)
+        self.assertEqual([row['id'] for row in rows], [2, 1])
+
+        rows = index.list(now, after=(rows[0]['start'], rows[0]['id']), limit=1)
+        self.assertEqual([row['id'] for row in rows], [1])
+
+        index.remove(2)
+        self.assertEqual([row['id'] for row in index.list(now)], [1])
+        self.assertEqual(index.list(now + timedelta(hours=3)), [])
+
+
+class WriteBehindTest(AsyncTestCase):
+    """Class for testing the write-behind queue of the changes. """
+
+    def get_new_ioloop(self):
+        return IOLoop.current()
+
+    @gen_test
+    async def test_failed_write(self):
+        """Check if the changes which could not be written are retried
+        along with the newer ones, and flush() raises the error.
+        """
+
+        written = []
+        failing = [True]
+
+        async def persist(changes, clear):
+            if failing[0]:
+                raise OSError('The database is not available')
+            written.append((dict(changes), clear))
+
+        writes = WriteBehind(persist, 'test', retry_interval=0.01)
+        writes.change('first', 1)
+        writes.change('second', 2)
+        with self.assertRaises(OSError):
+            await writes.flush()
+
+        writes.change('first', 3)
+        self.assertEqual(len(writes), 2)
+
+        failing[0] = False
+        await writes.flush()
+        self.assertEqual(written, [({'first': 3, 'second': 2}, False)])
+
+        writes.change('third', 4)
+        writes.clear()
+        writes.change('fourth', 5)
+        await writes.flush()
+        self.assertEqual(written[-1], ({'fourth': 5}, True))
@@ -0,0 +1,236 @@
+# Copyright 2019 Evgeny Golyshev. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Module containing the tests of the webhook delivery. """
+
+from datetime import date
+import functools
+import json
+import os
+import tempfile
+
+import sqlalchemy as sa
+
+from huntflow_reloaded import handler
+from huntflow_reloaded.idempotency import IdempotencyCache, delivery_key
+from huntflow_reloaded.ingest import IngestQueue
+from huntflow_reloaded.journal import Journal
+from huntflow_reloaded.locks import CandidateLocks
+from huntflow_reloaded.models import Candidate, Interview
+from . import stubs
+from .base import POOL, WebTestCase, compose
+
+
+class DeliveryTest(WebTestCase):
+    """Class for testing the delivery of the webhooks in batches, in the
+    background and more than once.
+    """
+
+    def get_handlers(self):
+        app_args = {
+            'scheduler': self.test_scheduler,
+            'pool': POOL,
+            'locks': CandidateLocks(),
+        }
+        idempotency = IdempotencyCache(persistent=True)
+        self.ingest = IngestQueue(workers=1, maxsize=1, idempotency=idempotency)  # pylint: disable=attribute-defined-outside-init
+        journal_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(journal_dir.cleanup)
+        self.journal = Journal(journal_dir.name)  # pylint: disable=attribute-defined-outside-init
+
+        return [
+            ('/hf/async', handler.HuntflowWebhookHandler,
+             dict(app_args, ingest=self.ingest)),
+            ('/hf/async-idempotent', handler.HuntflowWebhookHandler,
+             dict(app_args, ingest=self.ingest, idempotency=idempotency)),
+            ('/hf/batch', handler.HuntflowBatchWebhookHandler, app_args),
+            ('/hf/batch-idempotent', handler.HuntflowBatchWebhookHandler,
+             dict(app_args, idempotency=idempotency)),
+            ('/hf/idempotent', handler.HuntflowWebhookHandler,
+             dict(app_args, idempotency=idempotency)),
+            ('/hf/journaled', handler.HuntflowWebhookHandler,
+             dict(app_args, idempotency=idempotency, journal=self.journal)),
+        ]
+
+    def test_handling_batch_request(self):
+        """Check if it is possible to handle an array of events in one request:
+        - applying valid events
+        - reporting the status of each event separately
+        - rejecting the event with a broken date like the single webhook
+        """
+
+        broken_event = json.loads(compose(stubs.INTERVIEW_REQUEST))
+        broken_event['event']['calendar_event']['start'] = 'tomorrow'
+
+        body = '[{}]'.format(','.join([
+            compose(stubs.INTERVIEW_REQUEST),
+            compose(stubs.REQUEST_WITH_UNKNOWN_TYPE),
+            compose(stubs.INCOMPLETE_INTERVIEW_REQUEST),
+            json.dumps(broken_event),
+        ]))
+
+        response = self.fetch('/hf/batch', body=body, method='POST')
+        self.assertEqual(response.code, 200)
+
+        exp_res = {
+            'results': [
+                {'status': 'ok'},
+                {'status': 'error', 'detail': 'Unknown type'},
+                {'status': 'error', 'detail': 'Incomplete request'},
+                {'status': 'error', 'detail': 'Incomplete request'},
+            ],
+            'total': 4,
+            'success': False,
+        }
+        self.assertEqual(json.loads(response.body), exp_res)
+
+        to_be_executed = sa.sql.select([Interview]).where(Interview.candidate == 1)
+        result = self.conn.execute(to_be_executed).fetchall()
+        self.assertEqual(len(result), 1)
+
+        text = sa.sql.text('SELECT job_state FROM apscheduler_jobs')
+        result = self.conn.execute(text).fetchall()
+        self.assertEqual(len(result), 3)
+
+        response = self.fetch('/hf/batch', body='{}', method='POST')
+        self.assertEqual(response.code, 500)
+        self.assertEqual(response.body, b'Request body must be an array of events')
+
+    def test_handling_queued_request(self):
+        """Check if the webhook is processed in the background when the ingest
+        queue is used:
+        - rejecting the incomplete webhook instead of queueing it
+        - responding with 202 as soon as the webhook is queued
+        - responding with 503 when the queue is full
+        - processing the queued webhook by the workers
+        """
+
+        body = compose(stubs.INTERVIEW_REQUEST)
+
+        response = self.fetch('/hf/async', body=compose(stubs.INCOMPLETE_INTERVIEW_REQUEST),
+                              method='POST')
+        self.assertEqual(response.code, 500)
+        self.assertEqual(response.body, b'Incomplete request')
+
+        response = self.fetch('/hf/async', body=body, method='POST')
+        self.assertEqual(response.code, 202)
+
+        response = self.fetch('/hf/async', body=body, method='POST')
+        self.assertEqual(response.code, 503)
+        self.assertEqual(response.headers['Retry-After'], '5')
+
+        self.ingest.start()
+        self.io_loop.run_sync(self.ingest.stop)
+
+        to_be_executed = sa.sql.select([Interview]).where(Interview.candidate == 1)
+        result = self.conn.execute(to_be_executed).fetchall()
+        self.assertEqual(len(result), 1)
+
+    def test_releasing_failed_delivery(self):
+        """Check if the delivery is handled again when Huntflow retries it
+        after it could not be processed in the background:
+        - retrying the delivery rejected since the queue is full
+        - retrying the delivery whose processing failed
+        """
+
+        body = compose(stubs.INTERVIEW_REQUEST)
+        fwd_body = compose(stubs.FWD_REQUEST)
+
+        # The candidate doesn't exist yet, so the first working day is not set.
+        response = self.fetch('/hf/async-idempotent', body=fwd_body, method='POST')
+        self.assertEqual(response.code, 202)
+
+        response = self.fetch('/hf/async-idempotent', body=body, method='POST')
+        self.assertEqual(response.code, 503)
+
+        self.ingest.start()
+        self.io_loop.run_sync(self.ingest.join)
+
+        response = self.fetch('/hf/async-idempotent', body=body, method='POST')
+        self.assertEqual(response.code, 202)
+        self.io_loop.run_sync(self.ingest.join)
+
+        response = self.fetch('/hf/async-idempotent', body=fwd_body, method='POST')
+        self.assertEqual(response.code, 202)
+        self.io_loop.run_sync(self.ingest.stop)
+
+        to_be_executed = sa.sql.select([Candidate.first_working_day])
+        self.assertEqual(self.conn.execute(to_be_executed).scalar(), date.today())
+
+    def test_duplicate_delivery(self):
+        """Check if the repeated delivery of the same webhook is acknowledged
+        without rescheduling the interview, and the knowledge about the
+        delivery is shared via the database.
+        """
+
+        body = compose(stubs.INTERVIEW_REQUEST)
+
+        response = self.fetch('/hf/idempotent', body=body, method='POST')
+        self.assertEqual(response.code, 200)
+
+        text = sa.sql.text('SELECT id FROM apscheduler_jobs ORDER BY id')
+        jobs = self.conn.execute(text).fetchall()
+        self.assertEqual(len(jobs), 3)
+
+        response = self.fetch('/hf/idempotent', body=body, method='POST')
+        self.assertEqual(response.code, 200)
+        self.assertEqual(response.body, b'')
+
+        self.assertEqual(self.conn.execute(text).fetchall(), jobs)
+
+        # Another server process knows about the delivery too.
+        claim = IdempotencyCache(persistent=True).claim
+        key = delivery_key(json.loads(body))
+        self.assertFalse(self.io_loop.run_sync(functools.partial(claim, key)))
+
+    def test_duplicate_batch_delivery(self):
+        """Check if the repeated delivery of the same event in a batch is
+        reported as a duplicate and is identified by the whole event like
+        the webhook delivered alone.
+        """
+
+        event = compose(stubs.INTERVIEW_REQUEST)
+        body = '[{}]'.format(event)
+
+        response = self.fetch('/hf/batch-idempotent', body=body, method='POST')
+        self.assertEqual(response.code, 200)
+        self.assertEqual(json.loads(response.body)['results'], [{'status': 'ok'}])
+
+        response = self.fetch('/hf/batch-idempotent', body=body, method='POST')
+        self.assertEqual(response.code, 200)
+        self.assertEqual(json.loads(response.body)['results'], [{'status': 'duplicate'}])
+
+        claim = IdempotencyCache(persistent=True).claim
+        key = delivery_key(json.loads(event))
+        self.assertFalse(self.io_loop.run_sync(functools.partial(claim, key)))
+
+    def test_failed_journal_append(self):
+        """Check if the delivery which could not be written to the journal is
+        handled when Huntflow retries it.
+        """
+
+        self.journal.open()
+        self.addCleanup(self.journal._flusher.cancel)  # pylint: disable=protected-access
+        os.close(self.journal._fd)  # pylint: disable=protected-access
+
+        body = compose(stubs.INTERVIEW_REQUEST)
+
+        response = self.fetch('/hf/journaled', body=body, method='POST')
+        self.assertEqual(response.code, 500)
+
+        response = self.fetch('/hf/idempotent', body=body, method='POST')
+        self.assertEqual(response.code, 200)
+
+        text = sa.sql.text('SELECT count(*) FROM apscheduler_jobs')
+        self.assertEqual(self.conn.execute(text).scalar(), 3)
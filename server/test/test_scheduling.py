@@ -0,0 +1,268 @@
+# Copyright 2019 Evgeny Golyshev. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Module containing the tests of the jobstores and the reminders. """
+
+import contextlib
+from datetime import datetime, timedelta
+import functools
+import json
+
+import sqlalchemy as sa
+
+from huntflow_reloaded import handler, scheduler
+from huntflow_reloaded.locks import CandidateLocks
+from huntflow_reloaded.metrics import METRICS
+from huntflow_reloaded.models import Interview
+from . import stubs
+from .base import POOL, POSTGRES_URL, WebTestCase, compose
+
+
+class SchedulingTest(WebTestCase):
+    """Class for testing the jobstores and the engine firing the reminders. """
+
+
+    def get_handlers(self):
+        app_args = {
+            'scheduler': self.test_scheduler,
+            'pool': POOL,
+            'locks': CandidateLocks(),
+        }
+
+        return [
+            ('/hf', handler.HuntflowWebhookHandler, app_args),
+        ]
+
+    @contextlib.contextmanager
+    def started_scheduler(self, **kwargs):
+        """Starts another scheduler with the specified arguments, which loads
+        the saved jobs, and shuts it down on exit. Starting two of them one
+        after another checks what survives the restart of the server.
+        """
+
+        started = scheduler.Scheduler(postgres_url=POSTGRES_URL, redis_args='',
+                                      channel_name='stub', **kwargs)
+        started.make()
+        self.io_loop.run_sync(started.load)
+        try:
+            yield started
+        finally:
+            started.shutdown()
+            scheduler.Scheduler.current = self.test_scheduler
+
+    def test_asyncpg_jobstore(self):
+        """Check if the asyncpg jobstore saves the jobs in the background:
+        - saving the added and removing the removed jobs
+        - removing several jobs at once
+        - saving the reminders as rows instead of pickles
+        - loading the saved jobs on startup
+        """
+
+        response = self.fetch('/hf', body=compose(stubs.INTERVIEW_REQUEST), method='POST')
+        self.assertEqual(response.code, 200)
+
+        interview_id = self.conn.execute(sa.sql.select([Interview.id])).scalar()
+        # Removing the reminders scheduled by the test scheduler.
+        self.conn.execute(sa.sql.text('DELETE FROM apscheduler_jobs'))
+
+        count_jobs = sa.sql.text('SELECT count(*) FROM apscheduler_jobs')
+        select_reminders = sa.sql.text('SELECT id, kind, ref_id FROM scheduled_jobs')
+        args = ({'type': 'interview'}, '', 'stub')
+        run_date = datetime.now() + timedelta(days=1)
+
+        with self.started_scheduler(jobstore='asyncpg') as first:
+            first.add(run_date, first._notify_interview, args, job_id='first')  # pylint: disable=protected-access
+            first.add(run_date, first._notify_interview, args, job_id='second')  # pylint: disable=protected-access
+            first.remove_job('first')
+            first.add_reminder(run_date, 'interview', interview_id, job_id='reminder')
+            self.io_loop.run_sync(first.flush)
+            self.assertEqual(self.conn.execute(count_jobs).scalar(), 1)
+            self.assertEqual([tuple(row) for row in self.conn.execute(select_reminders)],
+                             [('reminder', 'interview', interview_id)])
+
+        with self.started_scheduler(jobstore='asyncpg') as second:
+            self.assertIsNone(second.scheduler.get_job('first'))
+            self.assertIsNotNone(second.scheduler.get_job('second'))
+            self.assertEqual(second.scheduler.get_job('reminder').args,
+                             ('interview', interview_id))
+
+            message = self.io_loop.run_sync(
+                functools.partial(second.render_interview, interview_id))
+            self.assertEqual((message['type'], message['first_name'], message['last_name']),
+                             ('interview', 'Matt', 'Groening'))
+
+            self.assertEqual(self.io_loop.run_sync(functools.partial(
+                second.remove_jobs, ['second', 'reminder', 'missing'])), 2)
+            self.io_loop.run_sync(second.flush)
+            self.assertEqual(self.conn.execute(count_jobs).scalar(), 0)
+            self.assertEqual(self.conn.execute(select_reminders).fetchall(), [])
+
+    def test_switching_back_to_sqlalchemy(self):
+        """Check if the reminders saved as rows are moved to the SQLAlchemy
+        jobstore when the server is switched back to it.
+        """
+
+        response = self.fetch('/hf', body=compose(stubs.INTERVIEW_REQUEST), method='POST')
+        self.assertEqual(response.code, 200)
+
+        interview_id = self.conn.execute(sa.sql.select([Interview.id])).scalar()
+        run_date = datetime.now() + timedelta(days=1)
+
+        with self.started_scheduler(jobstore='asyncpg') as first:
+            first.add_reminder(run_date, 'interview', interview_id, job_id='reminder')
+            self.io_loop.run_sync(first.flush)
+
+        with self.started_scheduler() as second:
+            self.assertEqual(second.scheduler.get_job('reminder').args,
+                             ('interview', interview_id))
+            count_reminders = sa.sql.text('SELECT count(*) FROM scheduled_jobs')
+            self.assertEqual(self.conn.execute(count_reminders).scalar(), 0)
+
+    def test_reminder_engine(self):
+        """Check if the reminder engine fires the reminders without APScheduler:
+        - saving the added and removing the removed reminders
+        - firing the due reminders and removing them
+        - loading the saved reminders on startup
+        """
+
+        response = self.fetch('/hf', body=compose(stubs.INTERVIEW_REQUEST), method='POST')
+        self.assertEqual(response.code, 200)
+
+        interview_id = self.conn.execute(sa.sql.select([Interview.id])).scalar()
+
+        select_reminders = sa.sql.text('SELECT id FROM scheduled_jobs ORDER BY id')
+        run_date = datetime.now() + timedelta(days=1)
+
+        with self.started_scheduler(jobstore='heap') as first:
+            fired = METRICS.snapshot().get('reminders.fired', 0)
+            first.add_reminder(run_date, 'interview', interview_id, job_id='first')
+            first.add_reminder(run_date, 'interview', interview_id, job_id='second')
+            first.add_reminder(datetime.now(), 'interview', interview_id, job_id='due')
+            self.assertEqual(self.io_loop.run_sync(
+                functools.partial(first.remove_jobs, ['first', 'missing'])), 1)
+            # The due reminder is fired right away instead of waiting for the
+            # timeout of the engine.
+            first.reminders._fire()  # pylint: disable=protected-access
+            self.io_loop.run_sync(first.flush)
+
+            self.assertEqual(METRICS.snapshot()['reminders.fired'], fired + 1)
+            self.assertEqual([row.id for row in self.conn.execute(select_reminders)],
+                             ['second'])
+
+        with self.started_scheduler(jobstore='heap') as second:
+            self.assertEqual(len(second.reminders), 1)
+            self.assertEqual(second.reminders.get('second')[1:], ('interview', interview_id))
+
+            second.remove_job('second')
+            self.io_loop.run_sync(second.flush)
+            self.assertEqual(self.conn.execute(select_reminders).fetchall(), [])
+
+    def test_lazy_reminders(self):
+        """Check if only the next reminder about the interview is scheduled
+        in the lazy mode:
+        - scheduling the first reminder which is not due yet
+        - replacing it with the following one
+        """
+
+        response = self.fetch('/hf', body=compose(stubs.INTERVIEW_REQUEST), method='POST')
+        self.assertEqual(response.code, 200)
+
+        interview = self.conn.execute(sa.sql.select([Interview])).fetchone()
+        # Removing the reminders scheduled by the test scheduler.
+        self.conn.execute(sa.sql.text('DELETE FROM apscheduler_jobs'))
+
+        lazy = scheduler.Scheduler(postgres_url=POSTGRES_URL, redis_args='',
+                                   channel_name='stub', lazy_reminders=True)
+        lazy.make()
+        try:
+            self.assertEqual(len(lazy.get_job_ids()), 1)
+
+            job_id = json.loads(interview[Interview.jobs])[0]
+            an_hour_in_advance, morning, evening = lazy.get_scheduled_dates(
+                interview[Interview.start])
+            count_jobs = sa.sql.text('SELECT count(*) FROM apscheduler_jobs')
+
+            self.assertEqual(lazy.schedule_next_reminder(
+                interview[Interview.start], interview[Interview.id], job_id,
+                now=evening - timedelta(days=1)), evening)
+            self.assertEqual(self.conn.execute(count_jobs).scalar(), 1)
+
+            self.assertEqual(lazy.schedule_next_reminder(
+                interview[Interview.start], interview[Interview.id], job_id,
+                now=evening), morning)
+            self.assertEqual(self.conn.execute(count_jobs).scalar(), 1)
+            self.assertEqual(lazy.scheduler.get_job(job_id).next_run_time.replace(tzinfo=None),
+                             morning)
+
+            self.assertIsNone(lazy.schedule_next_reminder(
+                interview[Interview.start], interview[Interview.id], job_id,
+                now=an_hour_in_advance))
+            self.assertEqual(self.conn.execute(count_jobs).scalar(), 0)
+        finally:
+            lazy.shutdown()
+            scheduler.Scheduler.current = self.test_scheduler
+
+    def test_advancing_lazy_reminders(self):
+        """Check if the reminder fired in the lazy mode schedules the
+        following one:
+        - replacing the reminders scheduled before the lazy mode was enabled
+          with a single job
+        - sending the due reminder
+        - skipping the late reminder
+        """
+
+        response = self.fetch('/hf', body=compose(stubs.INTERVIEW_REQUEST), method='POST')
+        self.assertEqual(response.code, 200)
+
+        interview = self.conn.execute(sa.sql.select([Interview])).fetchone()
+        interview_id = interview[Interview.id]
+        job_ids = json.loads(interview[Interview.jobs])
+        self.assertEqual(len(job_ids), 3)
+
+        lazy = scheduler.Scheduler(postgres_url=POSTGRES_URL, redis_args='',
+                                   channel_name='stub', lazy_reminders=True)
+        lazy.make()
+        try:
+            an_hour_in_advance, morning, evening = lazy.get_scheduled_dates(
+                interview[Interview.start])
+
+            # None of the reminders is due yet, so nothing is sent.
+            self.io_loop.run_sync(functools.partial(
+                scheduler.Scheduler._remind, 'interview', interview_id))  # pylint: disable=protected-access
+
+            select_jobs = sa.sql.text('SELECT id FROM apscheduler_jobs')
+            self.assertEqual([row.id for row in self.conn.execute(select_jobs)], job_ids[:1])
+            select_interview_jobs = sa.sql.select([Interview.jobs])
+            self.assertEqual(json.loads(self.conn.execute(select_interview_jobs).scalar()),
+                             job_ids[:1])
+            self.assertEqual(lazy.scheduler.get_job(job_ids[0]).next_run_time.replace(tzinfo=None),
+                             evening)
+
+            message = self.io_loop.run_sync(
+                functools.partial(lazy.advance_interview, interview_id, now=evening))
+            self.assertEqual((message['type'], message['first_name'], message['last_name']),
+                             ('interview', 'Matt', 'Groening'))
+            self.assertEqual(message['start'], interview[Interview.start].strftime(
+                '%Y-%m-%dT%H:%M:%S+03:00'))
+            self.assertEqual(lazy.scheduler.get_job(job_ids[0]).next_run_time.replace(tzinfo=None),
+                             morning)
+
+            late = morning + scheduler.MISFIRE_GRACE_TIME + timedelta(seconds=1)
+            self.assertIsNone(self.io_loop.run_sync(
+                functools.partial(lazy.advance_interview, interview_id, now=late)))
+            self.assertEqual(lazy.scheduler.get_job(job_ids[0]).next_run_time.replace(tzinfo=None),
+                             an_hour_in_advance)
+        finally:
+            lazy.shutdown()
+            scheduler.Scheduler.current = self.test_scheduler